@@ -0,0 +1,197 @@
+"""Ключи кэшей калькулятора: канонические поля, быстрый хэш, пространство имён и версия конфигурации"""
+import hashlib
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import Counter
+
+from app import cache
+from app.config_manager import config_manager
+
+logger = logging.getLogger(__name__)
+
+try:
+    import xxhash
+except ImportError:
+    # Локальная разработка без xxhash: ключи строятся через blake2b
+    xxhash = None
+
+result_cache_requests = Counter(
+    'result_cache_requests_total',
+    'Calculator result cache lookups by namespace and result (hit, miss, stale)',
+    ['namespace', 'result']
+)
+
+KEY_PREFIX = 'calc'
+STATS_PREFIX = 'calc_stats'
+# Как часто счётчики воркера сбрасываются в общий хэш Redis (секунды)
+STATS_FLUSH_INTERVAL = 5.0
+
+
+def canonical_value(value: Any) -> str:
+    """Каноническая строка поля ключа: 2 и 2.0 совпадают, None и enum не зависят от repr"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, Enum):
+        return canonical_value(value.value)
+    if isinstance(value, float):
+        if value != value:
+            return 'nan'
+        value = round(value, 6)
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, (list, tuple)):
+        return ','.join(canonical_value(item) for item in value)
+    return str(value).strip()
+
+
+def fast_hash(text: str) -> str:
+    """64-битный некриптографический хэш (xxh3; blake2b-64, если xxhash не установлен)"""
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(text)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+# Все пространства имён процесса (заполняется конструктором CacheNamespace)
+cache_namespaces: Dict[str, 'CacheNamespace'] = {}
+
+
+class CacheNamespace:
+    """Пространство имён кэша калькулятора.
+
+    Ключ — calc:<имя>:<хэши разделов конфигурации>:<хэш канонических полей>,
+    поэтому в него попадают только перечисленные поля, а новая версия нужных
+    разделов конфигурации сразу даёт новые ключи. Попадания и промахи
+    считаются в Prometheus и (раз в STATS_FLUSH_INTERVAL) в общем хэше Redis
+    для /api/v2/cache/stats; число записанных ключей оценивается HyperLogLog
+    по версиям конфигурации. Чтение и запись значений — в StaleWhileRevalidateCache
+    (app/result_cache.py).
+    """
+
+    def __init__(self, name: str, fields: Tuple[str, ...], config_sections: Tuple[str, ...] = (),
+                 ttl_seconds: int = 300, soft_ttl_seconds: Optional[int] = None):
+        self.name = name
+        self.fields = tuple(fields)
+        self.config_sections = tuple(config_sections)
+        self.ttl_seconds = ttl_seconds
+        self.soft_ttl_seconds = soft_ttl_seconds
+        self._counts: Dict[str, int] = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        cache_namespaces[name] = self
+
+    def config_version(self) -> str:
+        if not self.config_sections:
+            return '-'
+        return config_manager.snapshot.cache_namespace(*self.config_sections)
+
+    def key(self, **values) -> str:
+        """Ключ по значениям полей (лишние или недостающие поля — ошибка)"""
+        if values.keys() != set(self.fields):
+            raise TypeError(f"Cache key fields for {self.name}: expected {self.fields}, got {tuple(values)}")
+        canonical = '|'.join(canonical_value(values[field]) for field in self.fields)
+        return f"{KEY_PREFIX}:{self.name}:{self.config_version()}:{fast_hash(canonical)}"
+
+    # ---- Статистика ----
+
+    def record(self, result: str):
+        """Учёт обращения: hit, miss или stale"""
+        result_cache_requests.labels(namespace=self.name, result=result).inc()
+        with self._lock:
+            self._counts[result] = self._counts.get(result, 0) + 1
+            due = time.monotonic() - self._last_flush >= STATS_FLUSH_INTERVAL
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Сброс накопленных счётчиков воркера в общий хэш Redis"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+        try:
+            pipe = cache.cache._write_client.pipeline(transaction=False)
+            for result, count in counts.items():
+                pipe.hincrby(f"{STATS_PREFIX}:{self.name}", result, count)
+            pipe.execute()
+        except Exception as e:
+            # Redis недоступен — возвращаем счётчики, чтобы не потерять их
+            with self._lock:
+                for result, count in counts.items():
+                    self._counts[result] = self._counts.get(result, 0) + count
+            logger.warning("Cache stats flush error (%s): %s", self.name, e)
+
+    def _keys_hll(self, version: str) -> str:
+        return f"{STATS_PREFIX}:{self.name}:keys:{version}"
+
+    def _versions_key(self) -> str:
+        return f"{STATS_PREFIX}:{self.name}:versions"
+
+    def track_key(self, key: str):
+        """Учёт записанного ключа: PFADD в HyperLogLog его версии конфигурации.
+
+        Оценка живёт ttl_seconds после последней записи, поэтому считает ключи,
+        записанные за время жизни записей, без просмотра Redis (SCAN).
+        """
+        version = key.split(':', 3)[2]
+        try:
+            pipe = cache.cache._write_client.pipeline(transaction=False)
+            pipe.pfadd(self._keys_hll(version), key)
+            pipe.expire(self._keys_hll(version), self.ttl_seconds)
+            pipe.sadd(self._versions_key(), version)
+            pipe.expire(self._versions_key(), self.ttl_seconds)
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Cache key tracking error (%s): %s", self.name, e)
+
+    def _key_cardinality(self, client) -> Tuple[Optional[int], Dict[str, int]]:
+        """Оценка числа ключей: всего и по версиям конфигурации"""
+        versions = sorted(v.decode() if isinstance(v, bytes) else v
+                          for v in client.smembers(self._versions_key()))
+        if not versions:
+            return 0, {}
+        pipe = client.pipeline(transaction=False)
+        for version in versions:
+            pipe.pfcount(self._keys_hll(version))
+        pipe.pfcount(*[self._keys_hll(version) for version in versions])
+        *counts, total = pipe.execute()
+        return total, {version: count for version, count in zip(versions, counts) if count}
+
+    def stats(self) -> Dict[str, Any]:
+        """Оценка числа ключей (по версиям конфигурации), счётчики обращений всех воркеров и доля попаданий.
+
+        Если Redis недоступен, отдаются только локальные счётчики воркера.
+        """
+        self.flush_stats()
+        client = cache.cache._write_client
+        try:
+            requests_by_result = {
+                (k.decode() if isinstance(k, bytes) else k): int(v)
+                for k, v in client.hgetall(f"{STATS_PREFIX}:{self.name}").items()
+            }
+            keys, keys_by_version = self._key_cardinality(client)
+        except Exception as e:
+            logger.warning("Cache stats read error (%s): %s", self.name, e)
+            requests_by_result, keys, keys_by_version = {}, None, {}
+        with self._lock:
+            for result, count in self._counts.items():
+                requests_by_result[result] = requests_by_result.get(result, 0) + count
+
+        lookups = sum(requests_by_result.values())
+        served = requests_by_result.get('hit', 0) + requests_by_result.get('stale', 0)
+        return {
+            'fields': list(self.fields),
+            'config_sections': list(self.config_sections),
+            'config_version': self.config_version(),
+            'ttl_seconds': self.ttl_seconds,
+            'soft_ttl_seconds': self.soft_ttl_seconds,
+            'keys': keys,
+            'keys_by_config_version': keys_by_version,
+            'requests': requests_by_result,
+            'hit_ratio': round(served / lookups, 4) if lookups else None
+        }
@@ -1,98 +1,43 @@
 # Новый оптимизированный калькулятор (бывший calculator_v2.py)
+import contextvars
+import logging
 import time
-import hashlib
 import json
 import os
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Sequence, Tuple, Any
 from pathlib import Path
-import requests
-from shapely.geometry import shape, Point, Polygon
-from functools import wraps
-from flask import current_app, request
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+import numpy as np
+from shapely.geometry import shape, Polygon
+from flask import current_app
 from app import cache
 from app.models import (
     Vehicle, VehicleRequest, RouteRequest, TimeRequest, 
-    CalculationResult, VehicleDatabase, BodyType
+    CalculationResult, get_vehicle_database
 )
 from app.config_manager import config_manager
+from app.geo_cache import geocode_cache, geocode_cache_requests, route_cache, normalize_address
+from app.http_client import deadline_scope, http_client
+from app.pricing_kernel import VehicleRates, get_pricing_kernel
+from app.single_flight import SingleFlight
+from app.cache_keys import CacheNamespace
+from app.result_cache import StaleWhileRevalidateCache
+from app.zone_geometry import KadZoneIndex, build_kad_zone_index, haversine_km, segment_route, segment_route_exact
 
-class RateLimiter:
-    """Система ограничения частоты запросов"""
-    
-    def __init__(self, max_requests: int = 10, window_seconds: int = 60):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-    
-    def _get_client_key(self, client_id: str) -> str:
-        """Генерация ключа для клиента"""
-        return f"rate_limit:{client_id}"
-    
-    def is_allowed(self, client_id: str) -> bool:
-        """Проверка, разрешен ли запрос"""
-        key = self._get_client_key(client_id)
-        current_time = int(time.time())
-        window_start = current_time - self.window_seconds
-        
-        # Получаем список запросов из кэша
-        requests = cache.get(key) or []
-        
-        # Удаляем старые запросы
-        requests = [req_time for req_time in requests if req_time > window_start]
-        
-        # Проверяем лимит
-        if len(requests) >= self.max_requests:
-            return False
-        
-        # Добавляем текущий запрос
-        requests.append(current_time)
-        cache.set(key, requests, timeout=self.window_seconds)
-        
-        return True
-    
-    def get_remaining_requests(self, client_id: str) -> int:
-        """Получить количество оставшихся запросов"""
-        key = self._get_client_key(client_id)
-        current_time = int(time.time())
-        window_start = current_time - self.window_seconds
-        
-        requests = cache.get(key) or []
-        requests = [req_time for req_time in requests if req_time > window_start]
-        
-        return max(0, self.max_requests - len(requests))
-
-def get_client_id() -> str:
-    """Получение идентификатора клиента"""
-    # Используем IP адрес или X-Forwarded-For
-    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
-    user_agent = request.headers.get('User-Agent', '')
-    
-    # Создаем уникальный идентификатор
-    identifier = f"{client_ip}:{user_agent}"
-    return hashlib.md5(identifier.encode()).hexdigest()
-
-def rate_limit(max_requests: int = 10, window_seconds: int = 60):
-    """Декоратор для ограничения частоты запросов"""
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            # Проверяем FLASK_DEBUG - если TRUE, пропускаем rate limiting
-            if os.environ.get('FLASK_DEBUG', 'FALSE').upper() == 'TRUE':
-                return f(*args, **kwargs)
-            
-            limiter = RateLimiter(max_requests, window_seconds)
-            client_id = get_client_id()
-            
-            if not limiter.is_allowed(client_id):
-                remaining = limiter.get_remaining_requests(client_id)
-                return {
-                    'error': 'Rate limit exceeded',
-                    'remaining_requests': remaining,
-                    'retry_after': window_seconds
-                }, 429
-            
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
+logger = logging.getLogger(__name__)
+
+# Пространства имён кэшей калькулятора: в ключ входят только перечисленные поля
+# и хэши разделов конфигурации, от которых зависит результат, поэтому новая
+# версия конфигурации сразу даёт новые ключи, а результаты, не зависящие
+# от изменившихся разделов, остаются в кэше. Анализ маршрута свежий 1 час,
+# устаревший (с фоновым обновлением) — до 24 часов
+ZONE_ANALYSIS_CACHE = CacheNamespace(
+    'zone_analysis',
+    fields=('from_address', 'to_address', 'logic_version'),
+    config_sections=('zone_detection',),
+    ttl_seconds=int(os.getenv('ZONE_ANALYSIS_HARD_TTL', 24 * 3600)),
+    soft_ttl_seconds=int(os.getenv('ZONE_ANALYSIS_SOFT_TTL', 3600))
+)
 
 class DistanceService:
     """Сервис для получения расстояний между адресами"""
@@ -122,6 +67,8 @@ class DistanceService:
     @staticmethod
     def calculate_route_price(distance: float, duration_hours: int, urgent_pickup: bool = False) -> Dict[str, float]:
         """Расчет стоимости маршрута - точно как на фронтенде"""
+        rates = config_manager.snapshot.rates
+        
         # [ИСПРАВЛЕНО] Проверка на нулевую дистанцию
         if distance <= 0:
             # При нулевой дистанции стоимость за путь = 0
@@ -133,25 +80,13 @@ class DistanceService:
             except AttributeError:
                 pass
         else:
-            # Получаем цены из конфигурации
-            pricing = config_manager.get_pricing()
-            base_cost_per_km = pricing['base_cost_per_km']
             # Шаг 1: Расчет стоимости за расстояние
-            distance_cost = distance * base_cost_per_km
+            distance_cost = distance * rates.base_cost_per_km
         
-        # Получаем цены из конфигурации (если не получили ранее)
-        if distance > 0:
-            pricing = config_manager.get_pricing()
-            duration_cost_per_hour = pricing['duration_cost_per_hour']
-            urgent_multiplier = pricing['urgent_pickup_multiplier'] if urgent_pickup else 1.0
-        else:
-            # При нулевой дистанции используем дефолтные значения
-            pricing = config_manager.get_pricing()
-            duration_cost_per_hour = pricing['duration_cost_per_hour']
-            urgent_multiplier = pricing['urgent_pickup_multiplier'] if urgent_pickup else 1.0
+        urgent_multiplier = rates.urgent_multiplier(urgent_pickup)
         
         # Шаг 2: Расчет стоимости за длительность
-        duration_cost = duration_hours * duration_cost_per_hour
+        duration_cost = duration_hours * rates.duration_cost_per_hour
         
         # Шаг 3: Общая стоимость без срочной подачи
         base_total_cost = distance_cost + duration_cost
@@ -170,14 +105,63 @@ class DistanceService:
 class ZoneDistanceService:
     """Сервис для расчёта расстояний с учётом зон (город/за КАДом)"""
     _kad_polygon: Optional[Polygon] = None
+    _kad_index: Optional[KadZoneIndex] = None
     _kad_polygon_loaded: bool = False
     _user_agent: str = "TransportCompany/1.0 (zone-segmentation)"
+    # Общий бюджет времени на геокодирование и маршрут (секунды)
+    _step1_deadline_seconds: float = float(os.getenv('STEP1_DEADLINE_SECONDS', 8.0))
+    _blocking_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='step1')
+    # Объединение одинаковых одновременных запросов (внутри процесса и между воркерами)
+    # Другим воркерам публикуются только настоящие ответы: не None (сбой апстрима)
+    # и не приближённый анализ, который не кэшируется
+    _geocode_flight = SingleFlight('geocode', should_publish=lambda coords: coords is not None)
+    _osrm_flight = SingleFlight('osrm', should_publish=lambda route: route is not None)
+    _zones_flight = SingleFlight('zone_analysis', should_publish=lambda result: bool(result) and not result.get('approximate'))
+    _zone_analysis_cache = StaleWhileRevalidateCache(ZONE_ANALYSIS_CACHE)
     
     @staticmethod
-    @cache.memoize(timeout=3600)  # Кэширование на 1 час
     def get_distance_with_zones(from_address: str, to_address: str, logic_version: int = 2) -> Dict[str, Any]:
         """
-        Получение расстояния между адресами с определением зон
+        Получение расстояния между адресами с определением зон.
+        Оба адреса геокодируются параллельно (analyze_route), весь анализ ограничен бюджетом времени.
+        Кэш stale-while-revalidate: после мягкого TTL устаревший анализ отдаётся сразу,
+        а пересчёт выполняется в фоне. Приближённые результаты (превышен бюджет времени) не кэшируются.
+        Одновременные промахи кэша по одной паре адресов выполняются один раз (single-flight).
+        Ключ (ZONE_ANALYSIS_CACHE) — нормализованные адреса и хэш настроек zone_detection:
+        смена цен не сбрасывает гео-анализ.
+        """
+        key = ZONE_ANALYSIS_CACHE.key(
+            from_address=normalize_address(from_address),
+            to_address=normalize_address(to_address),
+            logic_version=logic_version
+        )
+
+        def compute() -> Dict[str, Any]:
+            return ZoneDistanceService._zones_flight.do(
+                key,
+                ZoneDistanceService.analyze_route, from_address, to_address
+            )
+
+        return ZoneDistanceService._zone_analysis_cache.get_or_compute(
+            key, compute, should_cache=lambda result: not result.get('approximate')
+        )
+
+    @staticmethod
+    def _submit_blocking(func, *args) -> Future:
+        """Блокирующий вызов в пуле потоков step1 с копией контекста (контекст
+        приложения Flask нужен кэшам, срок upstream_deadline — HTTP-клиенту).
+        Зависший запрос остаётся в пуле и не задерживает ответ дольше бюджета.
+        """
+        context = contextvars.copy_context()
+        return ZoneDistanceService._blocking_executor.submit(context.run, func, *args)
+
+    @staticmethod
+    def analyze_route(from_address: str, to_address: str,
+                      deadline_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Анализ маршрута: параллельное геокодирование обоих адресов в пуле step1,
+        затем маршрут OSRM, всё в пределах общего бюджета времени.
+        При превышении бюджета возвращается приближённый результат с флагом approximate.
         """
         # [ИСПРАВЛЕНО] Проверка на одинаковые адреса
         if from_address.strip().lower() == to_address.strip().lower():
@@ -190,71 +174,151 @@ class ZoneDistanceService:
                 'route_type': 'city_only',
                 'kad_toll_applied': False
             }
-        
-        # Получаем координаты адресов
-        from_coords = ZoneDistanceService._get_coordinates(from_address)
-        to_coords = ZoneDistanceService._get_coordinates(to_address)
-        
-        if not from_coords or not to_coords:
-            # Fallback к простому расчёту
-            return ZoneDistanceService._fallback_calculation(from_address, to_address)
-        
-        # Определяем зоны
-        from_zone = ZoneDistanceService._determine_zone(from_coords, from_address)
-        to_zone = ZoneDistanceService._determine_zone(to_coords, to_address)
-
-        # Если есть полигон КАДа и удалось получить геометрию маршрута через OSRM — используем посегментную разбивку
-        kad_polygon = ZoneDistanceService._get_kad_polygon()
-        coordinates = ZoneDistanceService._fetch_osrm_geometry(from_coords, to_coords)
-        if kad_polygon and coordinates:
-            city_km, outside_km, total_km = ZoneDistanceService._segment_route_by_polygon(coordinates, kad_polygon)
-            # Новая логика: если есть и городские, и загородные километры — считаем только загородные
-            if city_km > 0 and outside_km > 0:
-                effective_city_km = 0.0
-                effective_outside_km = outside_km
-                route_type = 'outside_only'
-            elif outside_km > 0 and city_km == 0:
-                effective_city_km = 0.0
-                effective_outside_km = outside_km
-                route_type = 'outside_only'
+
+        budget = deadline_seconds if deadline_seconds is not None else ZoneDistanceService._step1_deadline_seconds
+        deadline = time.monotonic() + budget
+        # Запросы к Nominatim/OSRM (с ретраями) не выходят за тот же бюджет
+        with deadline_scope(budget):
+            # Получаем координаты адресов параллельно
+            geocoding = [
+                ZoneDistanceService._submit_blocking(ZoneDistanceService._get_coordinates, from_address),
+                ZoneDistanceService._submit_blocking(ZoneDistanceService._get_coordinates, to_address)
+            ]
+            done, _ = wait(geocoding, timeout=budget)
+            if len(done) < len(geocoding):
+                logger.warning("Step1 deadline exceeded while geocoding: %s -> %s", from_address, to_address)
+                result = ZoneDistanceService._fallback_calculation(from_address, to_address)
+                result['approximate'] = True
+                return result
+            from_coords, to_coords = (future.result() for future in geocoding)
+
+            if not from_coords or not to_coords:
+                # Fallback к простому расчёту
+                return ZoneDistanceService._fallback_calculation(from_address, to_address)
+
+            # Определяем зоны
+            from_zone = ZoneDistanceService._determine_zone(from_coords, from_address)
+            to_zone = ZoneDistanceService._determine_zone(to_coords, to_address)
+
+            # Если есть полигон КАДа и удалось получить геометрию маршрута через OSRM — используем посегментную разбивку
+            route_split = None
+            timed_out = False
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                routing = ZoneDistanceService._submit_blocking(
+                    ZoneDistanceService._split_route_by_zones, from_coords, to_coords
+                )
+                try:
+                    route_split = routing.result(timeout=remaining)
+                except FutureTimeoutError:
+                    timed_out = True
             else:
-                effective_city_km = city_km
-                effective_outside_km = 0.0
-                route_type = 'city_only'
-
-            route_analysis = {
-                'total_distance': round(total_km, 1),
-                'city_distance': round(effective_city_km, 1),
-                'outside_distance': round(effective_outside_km, 1),
-                'from_zone': from_zone,
-                'to_zone': to_zone,
-                'route_type': route_type,
-                'kad_toll_applied': effective_outside_km > 0
-            }
-        else:
-            # Fallback к приближённому анализу
-            route_analysis = ZoneDistanceService._analyze_route(from_coords, to_coords, from_zone, to_zone)
-        
+                timed_out = True
+
+        if route_split:
+            return ZoneDistanceService._build_route_analysis(route_split, from_zone, to_zone)
+
+        # Fallback к приближённому анализу
+        route_analysis = ZoneDistanceService._analyze_route(from_coords, to_coords, from_zone, to_zone)
+        if timed_out:
+            logger.warning("Step1 deadline exceeded while routing: %s -> %s", from_address, to_address)
+            route_analysis['approximate'] = True
         return route_analysis
-    
+
+    @staticmethod
+    def _build_route_analysis(route_split: Tuple[float, float, float], from_zone: str, to_zone: str) -> Dict[str, Any]:
+        """Анализ маршрута по посегментной разбивке (city_km, outside_km, total_km)"""
+        city_km, outside_km, total_km = route_split
+        # Новая логика: если есть и городские, и загородные километры — считаем только загородные
+        if city_km > 0 and outside_km > 0:
+            effective_city_km = 0.0
+            effective_outside_km = outside_km
+            route_type = 'outside_only'
+        elif outside_km > 0 and city_km == 0:
+            effective_city_km = 0.0
+            effective_outside_km = outside_km
+            route_type = 'outside_only'
+        else:
+            effective_city_km = city_km
+            effective_outside_km = 0.0
+            route_type = 'city_only'
+
+        return {
+            'total_distance': round(total_km, 1),
+            'city_distance': round(effective_city_km, 1),
+            'outside_distance': round(effective_outside_km, 1),
+            'from_zone': from_zone,
+            'to_zone': to_zone,
+            'route_type': route_type,
+            'kad_toll_applied': effective_outside_km > 0
+        }
+
+    @staticmethod
+    def _split_route_by_zones(from_coords: Dict[str, float], to_coords: Dict[str, float]) -> Optional[Tuple[float, float, float]]:
+        """Разбивка маршрута OSRM по полигону КАДа с кэшем по округлённым координатам.
+        Возвращает (city_km, outside_km, total_km) или None, если полигона или маршрута нет.
+        """
+        kad_index = ZoneDistanceService._get_kad_index()
+        if kad_index is None:
+            return None
+        segmentation_mode = ZoneDistanceService._get_segmentation_mode()
+
+        cached = route_cache.get(from_coords, to_coords, segmentation_mode)
+        if cached:
+            return cached
+
+        # Точной разбивке достаточно упрощённой геометрии: длина берётся из OSRM distance
+        overview = 'simplified' if segmentation_mode == 'exact' else 'full'
+        osrm_route = ZoneDistanceService._fetch_osrm_geometry(from_coords, to_coords, overview)
+        if not osrm_route:
+            return None
+        coordinates, road_distance_km = osrm_route
+        if segmentation_mode == 'exact':
+            route_split = segment_route_exact(coordinates, kad_index, road_distance_km)
+        else:
+            route_split = ZoneDistanceService._segment_route_by_polygon(coordinates, kad_index)
+
+        route_cache.set(from_coords, to_coords, segmentation_mode, route_split)
+        return route_split
+
     @staticmethod
     def _get_coordinates(address: str) -> Optional[Dict[str, float]]:
-        """Получение координат адреса через Nominatim (прямой запрос)."""
+        """Получение координат адреса: локальный кэш геокодирования, затем Nominatim.
+        Одновременные промахи по одному адресу объединяются в один запрос (single-flight).
+        """
+        cached = geocode_cache.get(address)
+        if cached:
+            return cached
+        coords = ZoneDistanceService._geocode_flight.do(
+            normalize_address(address), ZoneDistanceService._request_coordinates, address
+        )
+        return coords or ZoneDistanceService._fallback_coordinates(address)
+
+    @staticmethod
+    def _request_coordinates(address: str) -> Optional[Dict[str, float]]:
+        """Запрос координат к Nominatim с сохранением в кэш геокодирования (None при неудаче)."""
         try:
-            import urllib.parse
-            encoded = urllib.parse.quote(address)
-            nominatim_url = f"https://nominatim.openstreetmap.org/search?format=json&limit=1&q={encoded}"
+            params = {'format': 'json', 'limit': 1, 'q': address}
             headers = {"User-Agent": ZoneDistanceService._user_agent}
-            resp = requests.get(nominatim_url, headers=headers, timeout=10)
+            resp = http_client.get('nominatim', '/search', params=params, headers=headers)
             if resp.status_code == 200:
                 data = resp.json()
                 if isinstance(data, list) and len(data) > 0:
                     lat = float(data[0]['lat'])
                     lon = float(data[0]['lon'])
-                    return {"lat": lat, "lng": lon}
+                    coords = {"lat": lat, "lng": lon}
+                    geocode_cache_requests.labels(tier='network', result='hit').inc()
+                    geocode_cache.set(address, coords)
+                    return coords
+            geocode_cache_requests.labels(tier='network', result='miss').inc()
         except Exception as e:
-            print(f"Error getting coordinates for {address}: {e}")
-        # Заглушка как резерв
+            geocode_cache_requests.labels(tier='network', result='error').inc()
+            logger.warning("Error getting coordinates for %s: %s", address, e)
+        return None
+
+    @staticmethod
+    def _fallback_coordinates(address: str) -> Dict[str, float]:
+        """Заглушка как резерв, если Nominatim не ответил"""
         if "спб" in address.lower() or "петербург" in address.lower():
             return {"lat": 59.9311, "lng": 30.3609}
         elif "область" in address.lower():
@@ -266,17 +330,16 @@ class ZoneDistanceService:
     def _determine_zone(coords: Dict[str, float], address: str) -> str:
         """Определение зоны по координатам и адресу с приоритетом полигона КАДа."""
         try:
-            kad_polygon = ZoneDistanceService._get_kad_polygon()
-            if kad_polygon and coords:
+            kad_index = ZoneDistanceService._get_kad_index()
+            if kad_index is not None and coords:
                 # Shapely ожидает (x=lon, y=lat)
-                pt = Point(coords['lng'], coords['lat'])
-                return 'city' if kad_polygon.contains(pt) else 'outside'
+                return 'city' if kad_index.contains(coords['lng'], coords['lat']) else 'outside'
         except Exception:
             pass
 
         # Fallback: ключевые слова и расстояние от центра
-        zone_config = config_manager.get_pricing().get('zone_detection', {})
-        kad_keywords = zone_config.get('kad_keywords', [])
+        zone_config = config_manager.snapshot.zone_detection
+        kad_keywords = zone_config.get('kad_keywords', ())
         address_lower = address.lower()
         for keyword in kad_keywords:
             if keyword.lower() in address_lower:
@@ -291,21 +354,7 @@ class ZoneDistanceService:
     @staticmethod
     def _calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
         """Расчёт расстояния между двумя точками (формула гаверсинуса)"""
-        import math
-        
-        R = 6371  # Радиус Земли в километрах
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lng = math.radians(lng2 - lng1)
-        
-        a = (math.sin(delta_lat / 2) ** 2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * 
-             math.sin(delta_lng / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        return R * c
+        return haversine_km(lat1, lng1, lat2, lng2)
     
     @staticmethod
     def _analyze_route(from_coords: Dict[str, float], to_coords: Dict[str, float], 
@@ -361,26 +410,54 @@ class ZoneDistanceService:
                         geom = features[0].get('geometry')
                         if geom:
                             ZoneDistanceService._kad_polygon = shape(geom)
+                            # Подготовленная геометрия с сеточным индексом для пакетной классификации
+                            ZoneDistanceService._kad_index = build_kad_zone_index(ZoneDistanceService._kad_polygon)
             ZoneDistanceService._kad_polygon_loaded = True
         except Exception as e:
-            print(f"Error loading KAD polygon: {e}")
+            logger.error("Error loading KAD polygon: %s", e)
             ZoneDistanceService._kad_polygon_loaded = True
             ZoneDistanceService._kad_polygon = None
+            ZoneDistanceService._kad_index = None
         return ZoneDistanceService._kad_polygon
 
     @staticmethod
-    def _fetch_osrm_geometry(from_coords: Dict[str, float], to_coords: Dict[str, float]) -> Optional[List[List[float]]]:
-        """Запрос к OSRM для получения геометрии маршрута (список [lon, lat])."""
+    def _get_kad_index() -> Optional[KadZoneIndex]:
+        """Индекс зон КАД (загружает полигон при первом обращении)."""
+        ZoneDistanceService._get_kad_polygon()
+        return ZoneDistanceService._kad_index
+
+    @staticmethod
+    def _get_segmentation_mode() -> str:
+        """Режим разбивки маршрута по зонам: exact (пересечение с полигоном) или midpoint."""
+        mode = config_manager.snapshot.zone_detection.get('route_segmentation', 'exact')
+        return mode if mode in ('exact', 'midpoint') else 'exact'
+
+    @staticmethod
+    def _fetch_osrm_geometry(from_coords: Dict[str, float], to_coords: Dict[str, float],
+                             overview: str = 'full') -> Optional[Tuple[List[List[float]], Optional[float]]]:
+        """Запрос к OSRM для получения геометрии маршрута.
+        Одновременные запросы одного маршрута объединяются (single-flight).
+        Возвращает (список [lon, lat], дорожная длина маршрута в км или None).
+        """
+        return ZoneDistanceService._osrm_flight.do(
+            route_cache.make_key(from_coords, to_coords, overview),
+            ZoneDistanceService._request_osrm_geometry, from_coords, to_coords, overview
+        )
+
+    @staticmethod
+    def _request_osrm_geometry(from_coords: Dict[str, float], to_coords: Dict[str, float],
+                               overview: str) -> Optional[Tuple[List[List[float]], Optional[float]]]:
+        """HTTP-запрос маршрута к OSRM."""
         try:
             lon1, lat1 = from_coords['lng'], from_coords['lat']
             lon2, lat2 = to_coords['lng'], to_coords['lat']
-            url = f"https://router.project-osrm.org/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
+            path = f"/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
             params = {
-                'overview': 'full',
+                'overview': overview,
                 'geometries': 'geojson'
             }
             headers = {"User-Agent": ZoneDistanceService._user_agent}
-            resp = requests.get(url, params=params, headers=headers, timeout=10)
+            resp = http_client.get('osrm', path, params=params, headers=headers)
             if resp.status_code == 200:
                 data = resp.json()
                 routes = data.get('routes', [])
@@ -389,49 +466,20 @@ class ZoneDistanceService:
                     if geom and geom.get('type') == 'LineString':
                         coords = geom.get('coordinates', [])  # [[lon, lat], ...]
                         if isinstance(coords, list) and len(coords) >= 2:
-                            return coords
+                            distance_m = routes[0].get('distance')
+                            road_distance_km = distance_m / 1000.0 if isinstance(distance_m, (int, float)) and distance_m > 0 else None
+                            return coords, road_distance_km
         except Exception as e:
-            print(f"OSRM fetch geometry error: {e}")
+            logger.warning("OSRM fetch geometry error: %s", e)
         return None
 
     @staticmethod
-    def _segment_route_by_polygon(coordinates: List[List[float]], polygon: Polygon) -> Tuple[float, float, float]:
+    def _segment_route_by_polygon(coordinates: List[List[float]], kad_index: KadZoneIndex) -> Tuple[float, float, float]:
         """Разбивка маршрута по сегментам с классификацией внутри/вне полигона.
+        Длины сегментов и классификация средних точек считаются векторно по всему маршруту.
         Возвращает (city_km, outside_km, total_km).
         """
-        def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-            import math
-            R = 6371.0
-            dlat = math.radians(lat2 - lat1)
-            dlon = math.radians(lon2 - lon1)
-            a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-            return R * c
-
-        city_km = 0.0
-        outside_km = 0.0
-        total_km = 0.0
-
-        for i in range(len(coordinates) - 1):
-            lon1, lat1 = coordinates[i]
-            lon2, lat2 = coordinates[i + 1]
-            seg_km = haversine_km(lat1, lon1, lat2, lon2)
-            total_km += seg_km
-
-            # Классифицируем по средней точке сегмента
-            mid_lon = (lon1 + lon2) / 2.0
-            mid_lat = (lat1 + lat2) / 2.0
-            inside = False
-            try:
-                inside = polygon.contains(Point(mid_lon, mid_lat))
-            except Exception:
-                pass
-            if inside:
-                city_km += seg_km
-            else:
-                outside_km += seg_km
-
-        return city_km, outside_km, total_km
+        return segment_route(coordinates, kad_index)
     
     @staticmethod
     def _fallback_calculation(from_address: str, to_address: str) -> Dict[str, Any]:
@@ -472,70 +520,46 @@ class ZoneDistanceService:
                                        duration_hours: int, 
                                        urgent_pickup: bool = False) -> Dict[str, float]:
         """Расчёт стоимости маршрута с учётом зон"""
-        pricing = config_manager.get_pricing()
-        
-        # Расчёт стоимости за расстояние по зонам
-        city_cost_per_km = pricing.get('city_cost_per_km', pricing['base_cost_per_km'])
-        outside_cost_per_km = pricing.get('outside_cost_per_km', pricing['base_cost_per_km'])
-        
-        city_cost = route_analysis['city_distance'] * city_cost_per_km
-        outside_cost = route_analysis['outside_distance'] * outside_cost_per_km
-        
-        # Стоимость за длительность
-        duration_cost_per_hour = pricing['duration_cost_per_hour']
-        duration_cost = duration_hours * duration_cost_per_hour
-        
-        # Стоимость проезда по КАД
-        kad_cost = 0.0
-        if route_analysis['kad_toll_applied']:
-            kad_cost = pricing.get('kad_toll_cost', 0.0)
-        
-        # Общая стоимость без срочной подачи
-        base_total_cost = city_cost + outside_cost + duration_cost + kad_cost
-        
-        # Применяем срочную подачу
-        urgent_multiplier = pricing['urgent_pickup_multiplier'] if urgent_pickup else 1.0
-        total = round(base_total_cost * urgent_multiplier)
-        
-        return {
-            'city_cost': city_cost,
-            'outside_cost': outside_cost,
-            'duration_cost': duration_cost,
-            'kad_cost': kad_cost,
-            'base_total_cost': base_total_cost,
-            'urgent_multiplier': urgent_multiplier,
-            'total': total,
-            'route_analysis': route_analysis
-        }
+        result = get_pricing_kernel().route_breakdown(
+            route_analysis['city_distance'],
+            route_analysis['outside_distance'],
+            route_analysis['kad_toll_applied'],
+            duration_hours,
+            urgent_pickup
+        )
+        result['route_analysis'] = route_analysis
+        return result
 
 class CalculatorServiceV2:
     """Оптимизированный сервис калькулятора"""
     
     def __init__(self):
-        self.vehicle_db = VehicleDatabase()
         self.distance_service = DistanceService()
     
     @staticmethod
-    @cache.memoize(timeout=300)  # Кэширование на 5 минут
-    def calculate_step1(route_request: RouteRequest, time_request: TimeRequest) -> Dict[str, float]:
-        """Расчет стоимости этапа 1 (маршрут и время) с учётом зон"""
-        start_time = time.time()
-        
-        # Получаем анализ маршрута с зонами
-        route_analysis = ZoneDistanceService.get_distance_with_zones(
+    def analyze_step1_route(route_request: RouteRequest) -> Dict[str, Any]:
+        """Кэшируемая часть шага 1: анализ маршрута по зонам.
+
+        Ключ кэша строится из нормализованных адресов (см. get_distance_with_zones),
+        поэтому длительность, срочность и время подачи на него не влияют.
+        """
+        return ZoneDistanceService.get_distance_with_zones(
             route_request.from_address, 
             route_request.to_address
         )
-        
+    
+    @staticmethod
+    def price_step1(route_analysis: Dict[str, Any], time_request: TimeRequest) -> Dict[str, float]:
+        """Некэшируемая часть шага 1: стоимость по готовому анализу маршрута"""
         # [ИСПРАВЛЕНО] Дополнительная проверка на нулевую дистанцию
         if route_analysis['total_distance'] <= 0:
             # При нулевой дистанции создаем результат с нулевой стоимостью за путь
-            pricing = config_manager.get_pricing()
-            duration_cost_per_hour = pricing['duration_cost_per_hour']
-            urgent_multiplier = pricing['urgent_pickup_multiplier'] if time_request.urgent_pickup else 1.0
-            
-            duration_cost = time_request.duration_hours * duration_cost_per_hour
-            total = round(duration_cost * urgent_multiplier)
+            prices = get_pricing_kernel().route_breakdown(
+                0.0, 0.0, False, time_request.duration_hours, time_request.urgent_pickup
+            )
+            duration_cost = prices['duration_cost']
+            urgent_multiplier = prices['urgent_multiplier']
+            total = prices['total']
             
             # Логируем нулевую дистанцию
             try:
@@ -562,6 +586,16 @@ class CalculatorServiceV2:
         
         # Добавляем информацию о маршруте для совместимости
         result['distance'] = route_analysis['total_distance']
+        return result
+    
+    @staticmethod
+    def calculate_step1(route_request: RouteRequest, time_request: TimeRequest) -> Dict[str, float]:
+        """Расчет стоимости этапа 1 (маршрут и время) с учётом зон"""
+        start_time = time.time()
+        
+        # Получаем анализ маршрута с зонами (из кэша), цены считаем заново
+        route_analysis = CalculatorServiceV2.analyze_step1_route(route_request)
+        result = CalculatorServiceV2.price_step1(route_analysis, time_request)
         
         # Мониторинг производительности
         try:
@@ -576,17 +610,14 @@ class CalculatorServiceV2:
         return result
     
     @staticmethod
-    @cache.memoize(timeout=300)
-    def calculate_step2(vehicle_request: VehicleRequest) -> List[Dict]:
-        """Расчет доступного транспорта для этапа 2"""
+    def step2_answer(vehicle_request: VehicleRequest) -> Tuple[Tuple[Vehicle, ...], str]:
+        """Подходящий транспорт и готовый JSON-фрагмент {"vehicles": [...], "count": N}.
+
+        Ответы заранее посчитаны для текущей версии транспорта (Step2Table),
+        поэтому запрос не обращается к Redis и не фильтрует транспорт.
+        """
         start_time = time.time()
-        
-        # Получаем отфильтрованный список транспорта
-        vehicle_db = VehicleDatabase()
-        vehicles = vehicle_db.filter_vehicles(vehicle_request)
-        
-        # Конвертируем в словари для JSON
-        result = [vehicle.to_dict() for vehicle in vehicles]
+        answer = get_vehicle_database().step2_table.lookup(vehicle_request)
         
         # Мониторинг производительности
         try:
@@ -598,7 +629,13 @@ class CalculatorServiceV2:
         except AttributeError:
             pass
         
-        return result
+        return answer
+    
+    @staticmethod
+    def calculate_step2(vehicle_request: VehicleRequest) -> List[Dict]:
+        """Расчет доступного транспорта для этапа 2"""
+        vehicles, _ = CalculatorServiceV2.step2_answer(vehicle_request)
+        return [vehicle.to_dict() for vehicle in vehicles]
     
     @staticmethod
     def calculate_step3(
@@ -611,50 +648,27 @@ class CalculatorServiceV2:
         """Расчет итоговой стоимости"""
         start_time = time.time()
         
-        # Базовая стоимость из шага 1
-        base_cost = step1_result['total']
-        
-        # Стоимость транспорта
-        vehicle_cost = 0
-        if selected_vehicle:
-            # Получаем минимальную длительность для конкретного транспорта
-            vehicle_min_duration = getattr(selected_vehicle, 'min_base_duration_hours', 1)
-            
-            # Базовая цена + почасовая цена только для часов, превышающих минимальную длительность
-            extra_hours = max(0, duration_hours - vehicle_min_duration)
-            vehicle_cost = selected_vehicle.base_price + (
-                selected_vehicle.price_per_hour * extra_hours
-            )
-        
-        # Стоимость грузчиков
-        pricing = config_manager.get_pricing()
-        loader_price_per_hour = pricing.get('loader_price_per_hour', 750.0)
-        loaders_cost = loaders * loader_price_per_hour * duration_hours
+        kernel = get_pricing_kernel()
+        breakdown = kernel.final_breakdown(
+            step1_result['total'],
+            selected_vehicle,
+            loaders,
+            duration_hours,
+            additional_services_cost
+        )
         
         # Логируем расчёт стоимости грузчиков
         try:
             if hasattr(current_app, 'logger'):
                 current_app.logger.info(
                     f"Loaders cost calculation: loaders={loaders}, "
-                    f"price_per_hour={loader_price_per_hour}, "
+                    f"price_per_hour={kernel.loader_price_per_hour}, "
                     f"duration_hours={duration_hours}, "
-                    f"total_cost={loaders_cost}"
+                    f"total_cost={breakdown['loaders_cost']}"
                 )
         except AttributeError:
             pass
         
-        # Итоговая стоимость
-        total = base_cost + vehicle_cost + loaders_cost + additional_services_cost
-        
-        # Детализация
-        breakdown = {
-            'route_cost': base_cost,
-            'vehicle_cost': vehicle_cost,
-            'loaders_cost': loaders_cost,
-            'additional_services_cost': additional_services_cost,
-            'total': total
-        }
-        
         # Мониторинг производительности
         try:
             if hasattr(current_app, 'metrics'):
@@ -684,7 +698,7 @@ class CalculatorServiceV2:
         available_vehicles = CalculatorServiceV2.calculate_step2(vehicle_request)
         
         # Получаем выбранный транспорт
-        vehicle_db = VehicleDatabase()
+        vehicle_db = get_vehicle_database()
         selected_vehicle = vehicle_db.get_vehicle_by_id(selected_vehicle_id)
         
         if not selected_vehicle:
@@ -719,5 +733,77 @@ class CalculatorServiceV2:
         
         return result
 
+    @staticmethod
+    def calculate_quote_matrix(
+        route_request: RouteRequest,
+        durations: Sequence[int],
+        vehicles: Sequence[Vehicle],
+        loaders: Sequence[int],
+        urgency: Sequence[bool],
+        additional_services_cost: float = 0.0
+    ) -> Dict[str, Any]:
+        """Цены для всех сочетаний срочность × длительность × транспорт × грузчики.
+
+        Маршрут анализируется один раз, затем вся матрица считается одним
+        векторным проходом по тем же формулам, что шаги 1 и 3. Ячейки, где
+        грузчиков больше, чем вмещает транспорт, равны None.
+        """
+        start_time = time.time()
+        
+        route_analysis = ZoneDistanceService.get_distance_with_zones(
+            route_request.from_address,
+            route_request.to_address
+        )
+        kernel = get_pricing_kernel()
+        
+        # При нулевой дистанции путь не оплачивается, как в шаге 1
+        if route_analysis['total_distance'] <= 0:
+            city_km, outside_km, kad_toll = 0.0, 0.0, False
+        else:
+            city_km = route_analysis['city_distance']
+            outside_km = route_analysis['outside_distance']
+            kad_toll = route_analysis['kad_toll_applied']
+        
+        # Оси матрицы: срочность (U), длительность (D), транспорт (V), грузчики (L)
+        urgent_axis = np.asarray(urgency, dtype=bool)[:, None]
+        hours_axis = np.asarray(durations, dtype=float)[None, :]
+        # Ставки берутся из переданного транспорта, а не из таблицы ядра по id
+        rates = VehicleRates.from_vehicles(vehicles)
+        vehicle_axis = np.arange(len(vehicles))
+        loaders_axis = np.asarray(loaders)
+        
+        step1 = kernel.route_totals(city_km, outside_km, kad_toll, hours_axis, urgent_axis)      # (U, D)
+        totals = kernel.quote_many(
+            city_km, outside_km, kad_toll,
+            hours_axis[:, :, None, None], urgent_axis[:, :, None, None],
+            vehicle_axis[None, None, :, None], loaders_axis[None, None, None, :],
+            additional_services_cost, rates=rates
+        )                                                                                        # (U, D, V, L)
+        fits = loaders_axis[None, :] <= rates.max_loaders[:, None]                               # (V, L)
+        matrix = np.where(fits[None, None, :, :], totals, np.nan).tolist()
+        matrix = [[[[None if cell != cell else cell for cell in row] for row in by_vehicle]
+                   for by_vehicle in by_duration] for by_duration in matrix]
+        
+        try:
+            if hasattr(current_app, 'metrics'):
+                current_app.metrics.histogram(
+                    'calculator_quote_matrix_duration_seconds',
+                    time.time() - start_time
+                )
+        except AttributeError:
+            pass
+        
+        return {
+            'axes': {
+                'urgent_pickup': list(urgency),
+                'duration_hours': list(durations),
+                'vehicle_ids': [v.id for v in vehicles],
+                'loaders': list(loaders)
+            },
+            'step1_totals': step1.tolist(),
+            'totals': matrix,
+            'route_analysis': route_analysis
+        }
+
 # Глобальный экземпляр сервиса
-calculator_service = CalculatorServiceV2()
\ No newline at end of file
+calculator_service = CalculatorServiceV2()
@@ -1,8 +1,142 @@
+import copy
+import hashlib
 import json
 import os
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Dict, Any, List, Mapping, Optional, Tuple
 from pathlib import Path
 
+# Разделы конфигурации, по которым считаются хэши (для точечной инвалидации кэшей)
+CONFIG_SECTIONS = ('pricing', 'zone_detection', 'vehicles', 'calculator_limits', 'additional_services', 'rate_limits')
+
+
+def _section_hash(value: Any) -> str:
+    """Короткий хэш раздела по каноническому JSON"""
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:12]
+
+
+def _freeze(value: Any) -> Any:
+    """Неизменяемая копия JSON-структуры: dict -> MappingProxyType, list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Изменяемая копия замороженной структуры (для JSON-ответов и старого API)"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+@dataclass(frozen=True)
+class PricingRates:
+    """Ставки, вычисляемые один раз на версию конфигурации"""
+    base_cost_per_km: float
+    city_cost_per_km: float
+    outside_cost_per_km: float
+    duration_cost_per_hour: float
+    urgent_pickup_multiplier: float
+    loader_price_per_hour: float
+    kad_toll_cost: float
+
+    @classmethod
+    def from_pricing(cls, pricing: Mapping[str, Any]) -> 'PricingRates':
+        base_cost_per_km = float(pricing.get('base_cost_per_km', 0.0))
+        return cls(
+            base_cost_per_km=base_cost_per_km,
+            city_cost_per_km=float(pricing.get('city_cost_per_km', base_cost_per_km)),
+            outside_cost_per_km=float(pricing.get('outside_cost_per_km', base_cost_per_km)),
+            duration_cost_per_hour=float(pricing.get('duration_cost_per_hour', 0.0)),
+            urgent_pickup_multiplier=float(pricing.get('urgent_pickup_multiplier', 1.0)),
+            loader_price_per_hour=float(pricing.get('loader_price_per_hour', 750.0)),
+            kad_toll_cost=float(pricing.get('kad_toll_cost', 0.0))
+        )
+
+    def urgent_multiplier(self, urgent_pickup: bool) -> float:
+        return self.urgent_pickup_multiplier if urgent_pickup else 1.0
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """Неизменяемый снимок конфигурации.
+
+    Создаётся целиком при загрузке и подменяется одной операцией присваивания,
+    поэтому читатель, взявший ссылку на снимок, видит согласованную версию
+    до конца запроса без копирования.
+    """
+    version: int
+    loaded_at: float
+    pricing: Mapping[str, Any]
+    vehicles: Tuple[Mapping[str, Any], ...]
+    calculator_limits: Mapping[str, Any]
+    additional_services: Mapping[str, Mapping[str, Any]]
+    rate_limits: Mapping[str, Any]
+    # Производные значения
+    rates: PricingRates
+    zone_detection: Mapping[str, Any]
+    vehicles_by_id: Mapping[int, Mapping[str, Any]]
+    # Готовый ответ для фронтенда (обычный dict для сериализации — только чтение)
+    frontend_export: Dict[str, Any]
+    valid: bool
+    # Хэши содержимого: одинаковы во всех воркерах для одного и того же файла
+    content_hash: str
+    section_hashes: Mapping[str, str]
+
+    def cache_namespace(self, *sections: str) -> str:
+        """Пространство имён кэша по хэшам разделов, от которых зависит результат"""
+        return '.'.join(self.section_hashes[name] for name in sections)
+
+    def changed_sections(self, other: Optional['ConfigSnapshot']) -> Tuple[str, ...]:
+        """Разделы, отличающиеся от другого снимка"""
+        if other is None:
+            return CONFIG_SECTIONS
+        return tuple(name for name in CONFIG_SECTIONS
+                     if self.section_hashes[name] != other.section_hashes[name])
+
+    @classmethod
+    def build(cls, config: Dict[str, Any], version: int, valid: bool) -> 'ConfigSnapshot':
+        frozen = _freeze(config)
+        pricing = frozen.get('pricing', MappingProxyType({}))
+        vehicles = frozen.get('vehicles', ())
+        calculator_limits = frozen.get('calculator_limits', MappingProxyType({}))
+        additional_services = frozen.get('additional_services', MappingProxyType({}))
+        # zone_detection хэшируется отдельно от цен: от него зависит только гео-часть
+        raw_pricing = config.get('pricing', {})
+        section_hashes = {name: _section_hash(config.get(name)) for name in CONFIG_SECTIONS[2:]}
+        section_hashes['pricing'] = _section_hash({k: v for k, v in raw_pricing.items() if k != 'zone_detection'})
+        section_hashes['zone_detection'] = _section_hash(raw_pricing.get('zone_detection'))
+        return cls(
+            version=version,
+            loaded_at=time.time(),
+            pricing=pricing,
+            vehicles=vehicles,
+            calculator_limits=calculator_limits,
+            additional_services=additional_services,
+            rate_limits=frozen.get('rate_limits', MappingProxyType({})),
+            rates=PricingRates.from_pricing(pricing),
+            zone_detection=pricing.get('zone_detection', MappingProxyType({})),
+            vehicles_by_id=MappingProxyType({vehicle.get('id'): vehicle for vehicle in vehicles}),
+            frontend_export={
+                'pricing': thaw(pricing),
+                'vehicles': thaw(vehicles),
+                'calculator_limits': thaw(calculator_limits),
+                'additional_services': thaw(additional_services)
+            },
+            valid=valid,
+            content_hash=_section_hash(config),
+            section_hashes=MappingProxyType(section_hashes)
+        )
+
+
 class ConfigManager:
     """Менеджер конфигурации калькулятора"""
     
@@ -14,21 +148,76 @@ class ConfigManager:
         
         self.config_path = Path(config_path)
         self._config = None
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._version = 0
+        self._file_signature = None
+        # Причина, по которой последняя перезагрузка не применилась (None — применилась)
+        self.last_reload_error: Optional[str] = None
+        self._listeners: List[Callable[[Optional[ConfigSnapshot], ConfigSnapshot], None]] = []
+        self._reload_lock = threading.RLock()
         self._load_config()
     
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.config_path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+    
+    def _read_config(self) -> Dict[str, Any]:
+        if not self.config_path.exists():
+            raise FileNotFoundError(f"Config file not found: {self.config_path}")
+        
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
     def _load_config(self):
-        """Загрузка конфигурации из файла"""
+        """Первичная загрузка конфигурации из файла"""
         try:
-            if not self.config_path.exists():
-                raise FileNotFoundError(f"Config file not found: {self.config_path}")
-            
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                self._config = json.load(f)
-                
+            config = self._read_config()
         except Exception as e:
             print(f"Error loading config: {e}")
             # Загружаем дефолтную конфигурацию
-            self._config = self._get_default_config()
+            config = self._get_default_config()
+        
+        with self._reload_lock:
+            self._file_signature = self._file_stat()
+            self._publish(config)
+    
+    def _publish(self, config: Dict[str, Any]) -> bool:
+        """Атомарная подмена снимка; слушатели уведомляются, если содержимое изменилось"""
+        previous = self._snapshot
+        if previous is not None and previous.content_hash == _section_hash(config):
+            return False
+        self._version += 1
+        snapshot = ConfigSnapshot.build(config, self._version, self._validate(config))
+        self._config = config
+        self._snapshot = snapshot
+        for listener in list(self._listeners):
+            try:
+                listener(previous, snapshot)
+            except Exception as e:
+                print(f"Config listener error: {e}")
+        return True
+    
+    def add_listener(self, listener: Callable[[Optional[ConfigSnapshot], ConfigSnapshot], None]):
+        """Подписка на смену конфигурации: listener(старый снимок, новый снимок)"""
+        self._listeners.append(listener)
+    
+    def reload_if_changed(self) -> bool:
+        """Перезагрузка, если файл изменился с прошлой загрузки (mtime/размер)"""
+        if self._file_stat() == self._file_signature:
+            return False
+        return self.reload_config()
+    
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """Текущий снимок конфигурации (ссылку стоит взять один раз на запрос)"""
+        return self._snapshot
+    
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
     
     def _get_default_config(self) -> Dict[str, Any]:
         """Возвращает дефолтную конфигурацию"""
@@ -51,54 +240,81 @@ class ConfigManager:
             "additional_services": {}
         }
     
-    def reload_config(self):
-        """Перезагрузка конфигурации"""
-        self._load_config()
+    def reload_config(self) -> bool:
+        """Перезагрузка конфигурации.
+        
+        Недочитанный (в процессе записи) или невалидный файл не применяется —
+        продолжает работать текущий снимок. Возвращает True, если снимок сменился.
+        """
+        with self._reload_lock:
+            # Сигнатура запоминается и при ошибке: повторная попытка — когда файл снова изменится
+            self._file_signature = self._file_stat()
+            try:
+                config = self._read_config()
+            except Exception as e:
+                self.last_reload_error = f"Error reading config: {e}"
+                print(f"{self.last_reload_error}, keeping version {self._version}")
+                return False
+            if not self._validate(config):
+                self.last_reload_error = 'Invalid configuration'
+                print(f"Invalid config, keeping version {self._version}")
+                return False
+            self.last_reload_error = None
+            return self._publish(config)
     
+    # Методы get_* возвращают изменяемые копии для старого кода; на горячем пути
+    # используйте snapshot — он отдаётся без копирования
     def get_config(self) -> Dict[str, Any]:
         """Получить всю конфигурацию"""
-        return self._config.copy()
+        return copy.deepcopy(self._config)
     
     def get_pricing(self) -> Dict[str, float]:
         """Получить настройки цен"""
-        return self._config.get('pricing', {}).copy()
+        return thaw(self._snapshot.pricing)
     
     def get_vehicles(self) -> List[Dict[str, Any]]:
         """Получить список транспортных средств"""
-        return self._config.get('vehicles', []).copy()
+        return thaw(self._snapshot.vehicles)
     
     def get_vehicle_by_id(self, vehicle_id: int) -> Optional[Dict[str, Any]]:
         """Получить транспортное средство по ID"""
-        for vehicle in self._config.get('vehicles', []):
-            if vehicle.get('id') == vehicle_id:
-                return vehicle.copy()
-        return None
+        vehicle = self._snapshot.vehicles_by_id.get(vehicle_id)
+        return thaw(vehicle) if vehicle is not None else None
     
     def get_calculator_limits(self) -> Dict[str, int]:
         """Получить лимиты калькулятора"""
-        return self._config.get('calculator_limits', {}).copy()
+        return thaw(self._snapshot.calculator_limits)
     
     def get_additional_services(self) -> Dict[str, Dict[str, Any]]:
         """Получить дополнительные услуги"""
-        return self._config.get('additional_services', {}).copy()
+        return thaw(self._snapshot.additional_services)
+    
+    def get_rate_limits(self) -> Dict[str, Any]:
+        """Получить настройки ограничения частоты запросов"""
+        return thaw(self._snapshot.rate_limits)
     
     def get_service_price(self, service_key: str) -> float:
         """Получить цену дополнительной услуги"""
-        services = self.get_additional_services()
+        services = self._snapshot.additional_services
         return services.get(service_key, {}).get('price', 0.0)
     
     def validate_config(self) -> bool:
-        """Валидация конфигурации"""
+        """Валидация конфигурации (результат вычисляется один раз на версию)"""
+        return self._snapshot.valid
+    
+    @staticmethod
+    def _validate(config: Dict[str, Any]) -> bool:
+        """Проверка обязательных секций, цен и полей транспорта"""
         try:
             required_sections = ['pricing', 'vehicles', 'calculator_limits']
             
             for section in required_sections:
-                if section not in self._config:
+                if section not in config:
                     print(f"Missing required section: {section}")
                     return False
             
             # Проверяем цены
-            pricing = self._config['pricing']
+            pricing = config['pricing']
             required_prices = ['base_cost_per_km', 'duration_cost_per_hour', 'urgent_pickup_multiplier', 'loader_price_per_hour']
             
             for price_key in required_prices:
@@ -107,7 +323,7 @@ class ConfigManager:
                     return False
             
             # Проверяем транспорт
-            vehicles = self._config['vehicles']
+            vehicles = config['vehicles']
             if not isinstance(vehicles, list) or len(vehicles) == 0:
                 print("Vehicles must be a non-empty list")
                 return False
@@ -119,20 +335,46 @@ class ConfigManager:
                         print(f"Vehicle missing required field: {field}")
                         return False
             
+            # Проверяем ограничения частоты запросов (необязательная секция)
+            rate_limits_error = ConfigManager._validate_rate_limits(config.get('rate_limits', {}))
+            if rate_limits_error:
+                print(f"Invalid rate_limits: {rate_limits_error}")
+                return False
+            
             return True
             
         except Exception as e:
             print(f"Config validation error: {e}")
             return False
     
+    @staticmethod
+    def _validate_rate_limits(rate_limits: Dict[str, Any]) -> Optional[str]:
+        """Описание ошибки в секции rate_limits или None.
+        Лимиты, окна и стоимости — целые >= 1: нулевая стоимость делит на ноль,
+        отрицательная возвращала бы единицы в бюджет группы.
+        """
+        def positive_int(value) -> bool:
+            return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+        if not isinstance(rate_limits, dict):
+            return 'section must be an object'
+        for endpoint, override in rate_limits.get('endpoints', {}).items():
+            for field in ('max_requests', 'window_seconds'):
+                if field in override and not positive_int(override[field]):
+                    return f"endpoints.{endpoint}.{field} must be an integer >= 1"
+        for group_name, group in rate_limits.get('groups', {}).items():
+            if not positive_int(group.get('max_units')):
+                return f"groups.{group_name}.max_units must be an integer >= 1"
+            if 'window_seconds' in group and not positive_int(group['window_seconds']):
+                return f"groups.{group_name}.window_seconds must be an integer >= 1"
+            for endpoint, cost in group.get('endpoints', {}).items():
+                if not positive_int(cost):
+                    return f"groups.{group_name}.endpoints.{endpoint} cost must be an integer >= 1"
+        return None
+    
     def export_config_for_frontend(self) -> Dict[str, Any]:
-        """Экспорт конфигурации для фронтенда"""
-        return {
-            'pricing': self.get_pricing(),
-            'vehicles': self.get_vehicles(),
-            'calculator_limits': self.get_calculator_limits(),
-            'additional_services': self.get_additional_services()
-        }
+        """Экспорт конфигурации для фронтенда (общий на версию объект — не изменять)"""
+        return self._snapshot.frontend_export
 
 # Глобальный экземпляр менеджера конфигурации
 config_manager = ConfigManager()
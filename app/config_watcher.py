@@ -0,0 +1,129 @@
+"""Горячая перезагрузка конфигурации во всех воркерах: слежение за файлом и Redis pub/sub"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from prometheus_client import Counter
+
+from app import app, cache
+from app.config_manager import ConfigSnapshot, config_manager
+
+config_reloads = Counter(
+    'config_reloads_total',
+    'Calculator config reload attempts by source (file, pubsub, api) and result (changed, unchanged, error)',
+    ['source', 'result']
+)
+
+CONFIG_CHANNEL = 'config:reload'
+
+
+class ConfigWatcher:
+    """Фоновый поток воркера, применяющий новую конфигурацию без перезапуска.
+
+    Поток проверяет mtime/размер calculator_config.json каждые interval секунд
+    и слушает канал Redis, в который /api/v2/config/reload публикует хэш новой
+    версии, поэтому изменение доходит до всех воркеров быстрее секунды.
+    Поток запускается лениво в каждом процессе (gunicorn --preload форкает
+    воркеров после импорта, а потоки fork не переживают).
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Запуск потока в текущем процессе (дёшево вызывается на каждый запрос)"""
+        if self._pid == os.getpid() or self.interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='config-watcher', daemon=True).start()
+
+    def reload(self, source: str, force: bool = False) -> bool:
+        """Перезагрузка с учётом в config_reloads; возвращает True, если снимок сменился"""
+        try:
+            changed = config_manager.reload_config() if force else config_manager.reload_if_changed()
+        except Exception:
+            config_reloads.labels(source=source, result='error').inc()
+            raise
+        if changed:
+            config_reloads.labels(source=source, result='changed').inc()
+        elif force:
+            # Принудительная перезагрузка (pub/sub, API) учитывается и без изменений
+            result = 'error' if config_manager.last_reload_error else 'unchanged'
+            config_reloads.labels(source=source, result=result).inc()
+        return changed
+
+    def _apply(self, source: str, force: bool = False):
+        try:
+            self.reload(source, force)
+        except Exception as e:
+            print(f"Config reload error ({source}): {e}")
+
+    def _subscribe(self):
+        try:
+            pubsub = cache.cache._write_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(CONFIG_CHANNEL)
+            return pubsub
+        except Exception as e:
+            print(f"Config pub/sub unavailable, file watching only: {e}")
+            return None
+
+    def _run(self):
+        pubsub = self._subscribe()
+        next_resubscribe = time.monotonic() + 30
+        while True:
+            self._apply('file')
+
+            if pubsub is None:
+                time.sleep(self.interval)
+                if time.monotonic() >= next_resubscribe:
+                    pubsub = self._subscribe()
+                    next_resubscribe = time.monotonic() + 30
+                continue
+
+            try:
+                message = pubsub.get_message(timeout=self.interval)
+            except Exception as e:
+                print(f"Config pub/sub error: {e}")
+                pubsub = None
+                continue
+            if message and message.get('type') == 'message':
+                self._on_message(message.get('data'))
+
+    def _on_message(self, data):
+        try:
+            payload = json.loads(data)
+        except (TypeError, ValueError):
+            payload = {}
+        if payload.get('content_hash') == config_manager.snapshot.content_hash:
+            return
+        self._apply('pubsub', force=True)
+        expected = payload.get('content_hash')
+        if expected and expected != config_manager.snapshot.content_hash:
+            # Файл на этом хосте отличается от опубликованной версии
+            print(f"Config mismatch after reload: expected {expected}, "
+                  f"have {config_manager.snapshot.content_hash}")
+
+    def publish(self, snapshot: ConfigSnapshot):
+        """Оповестить остальные воркеры о новой версии"""
+        try:
+            cache.cache._write_client.publish(CONFIG_CHANNEL, json.dumps({
+                'content_hash': snapshot.content_hash,
+                'pid': os.getpid()
+            }))
+        except Exception as e:
+            print(f"Config publish error: {e}")
+
+
+config_watcher = ConfigWatcher(interval=float(os.getenv('CONFIG_WATCH_INTERVAL', 0.5)))
+
+
+@app.before_request
+def _start_config_watcher():
+    config_watcher.ensure_started()
@@ -0,0 +1,241 @@
+"""Гео-кэши: геокодирование (Redis + SQLite на диске) и разбивка маршрутов по зонам (Redis)"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter
+
+from app import cache
+
+logger = logging.getLogger(__name__)
+
+geocode_cache_requests = Counter(
+    'geocode_cache_requests_total',
+    'Geocode cache lookups by tier and result',
+    ['tier', 'result']
+)
+
+route_cache_requests = Counter(
+    'route_cache_requests_total',
+    'Route zone-split cache lookups by result',
+    ['result']
+)
+
+# Файл SQLite по умолчанию: каталог data/ проекта (в docker-compose — именованный том)
+DEFAULT_GEOCODE_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'geocode_cache.sqlite3'
+)
+
+# Точность last_access на диске: более свежие обращения не переписываются
+ACCESS_TIME_RESOLUTION = 300
+# Сколько отложенных обновлений last_access копится до записи пачкой
+ACCESS_FLUSH_BATCH = 100
+
+# Варианты написания города, приводимые к одному токену
+_CITY_VARIANTS = re.compile(
+    r'\b(?:г\s+)?(?:санкт\s*-?\s*петербург|с\s*-?\s*петербург|с\s*-?\s*пб|спб|петербург)\b'
+)
+_PUNCTUATION = re.compile(r'[.,;:!?"«»()\[\]{}\'`№#]+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_address(address: str) -> str:
+    """Нормализованный ключ адреса: регистр, ё, пунктуация, пробелы, варианты «СПб»"""
+    key = address.lower().replace('ё', 'е')
+    key = _PUNCTUATION.sub(' ', key)
+    key = _WHITESPACE.sub(' ', key).strip()
+    key = _CITY_VARIANTS.sub('спб', key)
+    # Город мог встретиться несколько раз («СПб, Санкт-Петербург») — оставляем один
+    tokens = []
+    for token in key.split(' '):
+        if token == 'спб' and 'спб' in tokens:
+            continue
+        tokens.append(token)
+    return ' '.join(tokens)
+
+
+class GeocodeCache:
+    """Двухуровневый кэш координат с TTL и LRU-вытеснением на диске"""
+
+    REDIS_PREFIX = 'geocode:'
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_entries: Optional[int] = None, redis_ttl_seconds: Optional[int] = None):
+        self.db_path = db_path or os.getenv('GEOCODE_CACHE_PATH', DEFAULT_GEOCODE_DB_PATH)
+        self.ttl_seconds = ttl_seconds or int(os.getenv('GEOCODE_CACHE_TTL', 30 * 24 * 3600))
+        self.max_entries = max_entries or int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', 50000))
+        self.redis_ttl_seconds = redis_ttl_seconds or int(os.getenv('GEOCODE_CACHE_REDIS_TTL', 24 * 3600))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_eviction = 0
+        # key -> время обращения; пишутся в SQLite пачкой, а не на каждое попадание
+        self._pending_access: Dict[str, float] = {}
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Ленивое открытие SQLite (WAL допускает чтение из нескольких воркеров)"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS geocode ('
+                ' key TEXT PRIMARY KEY, lat REAL NOT NULL, lng REAL NOT NULL,'
+                ' created_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS geocode_last_access ON geocode(last_access)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _redis_get(self, key: str) -> Optional[Dict[str, float]]:
+        try:
+            return cache.get(self.REDIS_PREFIX + key)
+        except Exception:
+            return None
+
+    def _redis_set(self, key: str, coords: Dict[str, float]):
+        try:
+            cache.set(self.REDIS_PREFIX + key, coords, timeout=self.redis_ttl_seconds)
+        except Exception:
+            pass
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, float]]:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                row = conn.execute(
+                    'SELECT lat, lng, created_at, last_access FROM geocode WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[2] > self.ttl_seconds:
+                    conn.execute('DELETE FROM geocode WHERE key = ?', (key,))
+                    conn.commit()
+                    self._pending_access.pop(key, None)
+                    return None
+                # Чтение не пишет в SQLite: время обращения откладывается до пачки
+                if now - row[3] > ACCESS_TIME_RESOLUTION:
+                    self._pending_access[key] = now
+                    if len(self._pending_access) >= ACCESS_FLUSH_BATCH:
+                        self._flush_access_times(conn)
+                        conn.commit()
+            return {'lat': row[0], 'lng': row[1]}
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Geocode cache read error: %s", e)
+            return None
+
+    def _flush_access_times(self, conn: sqlite3.Connection):
+        """Запись отложенных last_access одной пачкой (вызывается под self._lock)"""
+        if not self._pending_access:
+            return
+        pending, self._pending_access = self._pending_access, {}
+        conn.executemany(
+            'UPDATE geocode SET last_access = MAX(last_access, ?) WHERE key = ?',
+            [(accessed_at, key) for key, accessed_at in pending.items()]
+        )
+
+    def _disk_set(self, key: str, coords: Dict[str, float]):
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO geocode (key, lat, lng, created_at, last_access) VALUES (?, ?, ?, ?, ?)',
+                    (key, coords['lat'], coords['lng'], now, now)
+                )
+                self._writes_since_eviction += 1
+                # Вытеснение давно не использованных записей — пачками, не на каждую запись
+                if self._writes_since_eviction >= 100:
+                    self._writes_since_eviction = 0
+                    # Сначала отложенные обращения, иначе LRU вытеснит недавно читавшиеся записи
+                    self._flush_access_times(conn)
+                    conn.execute('DELETE FROM geocode WHERE created_at < ?', (now - self.ttl_seconds,))
+                    conn.execute(
+                        'DELETE FROM geocode WHERE key IN ('
+                        ' SELECT key FROM geocode ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                        (self.max_entries,)
+                    )
+                conn.commit()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning("Geocode cache write error: %s", e)
+
+    def get(self, address: str) -> Optional[Dict[str, float]]:
+        """Координаты из кэша: сначала Redis, затем SQLite (с прогревом Redis)"""
+        key = normalize_address(address)
+        if not key:
+            return None
+
+        coords = self._redis_get(key)
+        if coords:
+            geocode_cache_requests.labels(tier='redis', result='hit').inc()
+            return coords
+        geocode_cache_requests.labels(tier='redis', result='miss').inc()
+
+        coords = self._disk_get(key)
+        if coords:
+            geocode_cache_requests.labels(tier='disk', result='hit').inc()
+            self._redis_set(key, coords)
+            return coords
+        geocode_cache_requests.labels(tier='disk', result='miss').inc()
+        return None
+
+    def set(self, address: str, coords: Dict[str, float]):
+        """Сохранение координат в оба уровня"""
+        key = normalize_address(address)
+        if not key:
+            return
+        self._disk_set(key, coords)
+        self._redis_set(key, coords)
+
+
+class RouteCache:
+    """Кэш разбивки маршрута по зонам, ключ — округлённые координаты (from, to).
+
+    Хранится уже посчитанный результат (city_km, outside_km, total_km), поэтому
+    попадание избавляет и от запроса к OSRM, и от разбивки геометрии. Разные
+    написания адреса одного здания геокодируются в близкие точки и после
+    округления попадают в одну запись.
+    """
+
+    REDIS_PREFIX = 'route:'
+
+    def __init__(self, precision: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        # 4 знака после запятой ≈ 11 м по широте
+        self.precision = precision if precision is not None else int(os.getenv('ROUTE_CACHE_PRECISION', 4))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('ROUTE_CACHE_TTL', 7 * 24 * 3600))
+
+    def make_key(self, from_coords: Dict[str, float], to_coords: Dict[str, float], mode: str) -> str:
+        """Ключ маршрута: режим разбивки + округлённые координаты концов"""
+        p = self.precision
+        return (f"{self.REDIS_PREFIX}{mode}:"
+                f"{round(from_coords['lat'], p)},{round(from_coords['lng'], p)};"
+                f"{round(to_coords['lat'], p)},{round(to_coords['lng'], p)}")
+
+    def get(self, from_coords: Dict[str, float], to_coords: Dict[str, float],
+            mode: str) -> Optional[Tuple[float, float, float]]:
+        """Разбивка маршрута из кэша или None"""
+        try:
+            value = cache.get(self.make_key(from_coords, to_coords, mode))
+        except Exception:
+            value = None
+        route_cache_requests.labels(result='hit' if value else 'miss').inc()
+        return tuple(value) if value else None
+
+    def set(self, from_coords: Dict[str, float], to_coords: Dict[str, float], mode: str,
+            split: Tuple[float, float, float]):
+        """Сохранение разбивки (city_km, outside_km, total_km)"""
+        try:
+            cache.set(self.make_key(from_coords, to_coords, mode), list(split), timeout=self.ttl_seconds)
+        except Exception:
+            pass
+
+
+# Глобальные экземпляры гео-кэшей
+geocode_cache = GeocodeCache()
+route_cache = RouteCache()
@@ -0,0 +1,258 @@
+"""Общий HTTP-клиент для внешних сервисов (Nominatim, OSRM, Telegram)"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from prometheus_client import Counter, Gauge, Histogram
+from urllib3.exceptions import InvalidHeader, MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+outbound_request_duration = Histogram(
+    'outbound_request_duration_seconds',
+    'Outbound HTTP request latency per upstream',
+    ['upstream'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
+outbound_requests = Counter(
+    'outbound_requests_total',
+    'Outbound HTTP requests per upstream and outcome',
+    ['upstream', 'outcome']
+)
+outbound_in_flight = Gauge(
+    'outbound_requests_in_flight',
+    'Outbound HTTP requests currently holding a pool slot',
+    ['upstream'],
+    multiprocess_mode='livesum'
+)
+outbound_pool_wait = Histogram(
+    'outbound_pool_wait_seconds',
+    'Time spent waiting for a free upstream concurrency slot',
+    ['upstream'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+)
+
+
+class UpstreamBusyError(requests.exceptions.ConnectionError):
+    """Все слоты конкурентности апстрима заняты дольше допустимого"""
+
+
+# Срок (time.monotonic()) для всех запросов текущего контекста вместе с ретраями.
+# Копируется в потоки вместе с contextvars.copy_context()
+upstream_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Общий бюджет времени на запросы к апстримам внутри блока"""
+    token = upstream_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        upstream_deadline.reset(token)
+
+
+class UpstreamRetry(Retry):
+    """Retry с ограничениями по времени.
+
+    Повтор не выполняется, если Retry-After больше max_retry_after (ответ
+    отдаётся сразу, слот апстрима не держится во сне) или если ожидание
+    и ещё одна попытка (attempt_seconds) не укладываются в upstream_deadline.
+    """
+
+    def __init__(self, *args, max_retry_after: float = 2.0, attempt_seconds: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+        self.attempt_seconds = attempt_seconds
+
+    def new(self, **kw):
+        kw.setdefault('max_retry_after', self.max_retry_after)
+        kw.setdefault('attempt_seconds', self.attempt_seconds)
+        return super().new(**kw)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+
+        wait = new_retry.get_backoff_time()
+        if response is not None and self.respect_retry_after_header:
+            try:
+                retry_after = self.get_retry_after(response)
+            except InvalidHeader:
+                retry_after = None
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    raise MaxRetryError(_pool, url, ResponseError(f"Retry-After {retry_after:.0f}s exceeds the cap"))
+                wait = retry_after
+
+        deadline = upstream_deadline.get()
+        if deadline is not None and time.monotonic() + wait + self.attempt_seconds > deadline:
+            raise MaxRetryError(_pool, url, error or ResponseError('retry does not fit the deadline')) from error
+        return new_retry
+
+
+@dataclass(frozen=True)
+class UpstreamPolicy:
+    """Политика обращения к внешнему сервису"""
+    name: str
+    base_url: str
+    connect_timeout: float = 3.0
+    read_timeout: float = 10.0
+    pool_maxsize: int = 10
+    max_concurrency: int = 10
+    acquire_timeout: float = 5.0
+    retries: int = 2
+    backoff_factor: float = 0.3
+    retry_statuses: Tuple[int, ...] = (429, 502, 503, 504)
+    # Повторять ли запросы, которые могли дойти до сервера (для неидемпотентных POST — нет)
+    retry_reads: bool = True
+    # Дольше этого Retry-After не ждём — ответ с ошибкой отдаётся сразу
+    max_retry_after: float = 2.0
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+
+# Базовые URL переопределяются переменными окружения, например для локального стенда
+# upstream_stub (бенчмарки без доступа в сеть). Nominatim и OSRM вызываются из шага 1
+# с общим бюджетом 8 с: таймауты короче бюджета, таймаут чтения не повторяется
+DEFAULT_POLICIES = (
+    UpstreamPolicy(
+        name='nominatim',
+        base_url=os.getenv('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org'),
+        connect_timeout=2.0,
+        read_timeout=5.0,
+        max_concurrency=4,
+        retry_reads=False,
+        headers={'User-Agent': 'TransportCompany/1.0 (https://transportcompany.com)'}
+    ),
+    UpstreamPolicy(
+        name='osrm',
+        base_url=os.getenv('OSRM_BASE_URL', 'https://router.project-osrm.org'),
+        connect_timeout=2.0,
+        read_timeout=5.0,
+        max_concurrency=8,
+        retry_reads=False
+    ),
+    UpstreamPolicy(
+        name='telegram',
+        base_url=os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org'),
+        max_concurrency=4,
+        retries=2,
+        retry_statuses=(),
+        retry_reads=False
+    ),
+)
+
+
+class OutboundClient:
+    """Пулы keep-alive соединений по апстримам с ограничением конкурентности, ретраями и метриками.
+
+    Сессия создаётся лениво и пересоздаётся после fork, чтобы воркеры gunicorn
+    (--preload) не делили сокеты мастер-процесса.
+    """
+
+    def __init__(self, policies=DEFAULT_POLICIES):
+        self._policies: Dict[str, UpstreamPolicy] = {p.name: p for p in policies}
+        self._semaphores = {name: threading.BoundedSemaphore(p.max_concurrency) for name, p in self._policies.items()}
+        self._session: Optional[requests.Session] = None
+        self._session_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        for policy in self._policies.values():
+            retry = UpstreamRetry(
+                total=policy.retries,
+                connect=policy.retries,
+                # False (а не 0): таймаут чтения пробрасывается как есть и виден как ReadTimeout
+                read=policy.retries if policy.retry_reads else False,
+                status=policy.retries if policy.retry_statuses else 0,
+                backoff_factor=policy.backoff_factor,
+                status_forcelist=policy.retry_statuses,
+                allowed_methods=None if policy.retry_reads else frozenset(['GET']),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+                max_retry_after=policy.max_retry_after,
+                attempt_seconds=policy.connect_timeout + policy.read_timeout
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=policy.pool_maxsize, max_retries=retry)
+            session.mount(policy.base_url.rstrip('/') + '/', adapter)
+        return session
+
+    def _get_session(self) -> requests.Session:
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    self._session = self._build_session()
+                    self._session_pid = pid
+        return self._session
+
+    def policy(self, upstream: str) -> UpstreamPolicy:
+        return self._policies[upstream]
+
+    def url(self, upstream: str, path: str) -> str:
+        """Полный URL апстрима по относительному пути"""
+        return self._policies[upstream].base_url.rstrip('/') + '/' + path.lstrip('/')
+
+    def request(self, upstream: str, method: str, path: str, **kwargs) -> requests.Response:
+        """Запрос к апстриму через общий пул соединений.
+        Внутри deadline_scope таймауты урезаются до остатка бюджета.
+        """
+        policy = self._policies[upstream]
+        deadline = upstream_deadline.get()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                outbound_requests.labels(upstream=upstream, outcome='timeout').inc()
+                raise requests.exceptions.Timeout(f"{upstream}: deadline exceeded before the request")
+            timeout = kwargs.get('timeout') or policy.timeout
+            connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            kwargs['timeout'] = (min(connect_timeout, remaining), min(read_timeout, remaining))
+            acquire_timeout = min(policy.acquire_timeout, remaining)
+        else:
+            kwargs.setdefault('timeout', policy.timeout)
+            acquire_timeout = policy.acquire_timeout
+        if policy.headers:
+            kwargs['headers'] = {**policy.headers, **(kwargs.get('headers') or {})}
+
+        semaphore = self._semaphores[upstream]
+        wait_start = time.perf_counter()
+        if not semaphore.acquire(timeout=acquire_timeout):
+            outbound_requests.labels(upstream=upstream, outcome='busy').inc()
+            raise UpstreamBusyError(f"{upstream}: no free connection slot in {acquire_timeout:.1f}s")
+        outbound_pool_wait.labels(upstream=upstream).observe(time.perf_counter() - wait_start)
+
+        outbound_in_flight.labels(upstream=upstream).inc()
+        start = time.perf_counter()
+        try:
+            response = self._get_session().request(method, self.url(upstream, path), **kwargs)
+            outbound_requests.labels(upstream=upstream, outcome=str(response.status_code)).inc()
+            return response
+        except requests.exceptions.Timeout:
+            outbound_requests.labels(upstream=upstream, outcome='timeout').inc()
+            raise
+        except requests.exceptions.RequestException:
+            outbound_requests.labels(upstream=upstream, outcome='error').inc()
+            raise
+        finally:
+            outbound_request_duration.labels(upstream=upstream).observe(time.perf_counter() - start)
+            outbound_in_flight.labels(upstream=upstream).dec()
+            semaphore.release()
+
+    def get(self, upstream: str, path: str, **kwargs) -> requests.Response:
+        return self.request(upstream, 'GET', path, **kwargs)
+
+    def post(self, upstream: str, path: str, **kwargs) -> requests.Response:
+        return self.request(upstream, 'POST', path, **kwargs)
+
+
+# Глобальный клиент (один пул на процесс воркера)
+http_client = OutboundClient()
@@ -1,8 +1,23 @@
-from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Any, Iterable, Tuple
 from enum import Enum
+import itertools
 import json
-from app.config_manager import config_manager
+import os
+import threading
+from prometheus_client import Counter, Histogram
+from app.config_manager import ConfigSnapshot, config_manager
+
+vehicle_catalog_builds = Counter(
+    'vehicle_catalog_builds_total',
+    'Vehicle catalog builds after a change of the vehicles config section'
+)
+vehicle_catalog_build_seconds = Histogram(
+    'vehicle_catalog_build_seconds',
+    'Time to build the vehicle catalog from a config snapshot',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
 
 class BodyType(Enum):
     TENT = "tent"
@@ -16,8 +31,10 @@ class VehicleType(Enum):
     MINIBUS = "minibus"
     SPECIAL = "special"
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Vehicle:
+    """Транспорт из конфигурации: неизменяем в пределах версии, поэтому
+    JSON-фрагмент для ответов строится один раз при создании"""
     id: int
     name: str
     type: VehicleType
@@ -27,14 +44,26 @@ class Vehicle:
     base_price: float
     max_passengers: int
     max_loaders: int
-    dimensions: Dict[str, float]  # height, length, width
+    dimensions: Dict[str, float] = field(hash=False)  # height, length, width
     capacity: float  # в кубометрах
     image_url: str
     description: str
     is_available: bool = True
     min_base_duration_hours: int = 1
+    _json: str = field(init=False, repr=False, compare=False, hash=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, '_json', json.dumps(self._build_dict(), ensure_ascii=False, separators=(',', ':')))
     
     def to_dict(self) -> Dict[str, Any]:
+        """Новый словарь на каждый вызов: вызывающий код может его менять"""
+        return self._build_dict()
+    
+    def to_json(self) -> str:
+        """Готовый JSON-фрагмент для сборки ответов без повторной сериализации"""
+        return self._json
+    
+    def _build_dict(self) -> Dict[str, Any]:
         return {
             'id': self.id,
             'name': self.name,
@@ -45,7 +74,7 @@ class Vehicle:
             'base_price': self.base_price,
             'max_passengers': self.max_passengers,
             'max_loaders': self.max_loaders,
-            'dimensions': self.dimensions,
+            'dimensions': dict(self.dimensions),
             'capacity': self.capacity,
             'image_url': self.image_url,
             'description': self.description,
@@ -53,7 +82,7 @@ class Vehicle:
             'min_base_duration_hours': self.min_base_duration_hours
         }
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class RouteRequest:
     from_address: str
     to_address: str
@@ -66,7 +95,7 @@ class RouteRequest:
             'distance': self.distance
         }
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TimeRequest:
     pickup_time: str  # ISO format
     duration_hours: int
@@ -79,7 +108,7 @@ class TimeRequest:
             'urgent_pickup': self.urgent_pickup
         }
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class VehicleRequest:
     passengers: int
     loaders: int
@@ -96,7 +125,7 @@ class VehicleRequest:
             'body_type': self.body_type.value
         }
 
-@dataclass
+@dataclass(slots=True)
 class CalculationResult:
     step1_price: float
     step2_vehicles: List[Vehicle]
@@ -111,82 +140,244 @@ class CalculationResult:
             'breakdown': self.breakdown
         }
 
+
+def vehicles_json(vehicles: Iterable[Vehicle]) -> str:
+    """JSON-массив транспорта из готовых фрагментов"""
+    return '[' + ','.join(vehicle.to_json() for vehicle in vehicles) + ']'
+
+class _ThresholdIndex:
+    """Индекс «значение не меньше порога»: отсортированные значения + битовые маски суффиксов.
+
+    Бит i маски соответствует i-му транспорту каталога; маска для порога
+    находится одним bisect, а пересечение условий — побитовым AND.
+    """
+    
+    def __init__(self, values: Iterable[Tuple[float, int]]):
+        items = sorted(values)
+        self._values = [value for value, _ in items]
+        masks = [0] * (len(items) + 1)
+        for k in range(len(items) - 1, -1, -1):
+            masks[k] = masks[k + 1] | (1 << items[k][1])
+        self._masks = masks
+    
+    def bucket(self, threshold: float) -> int:
+        """Номер интервала между значениями, в который попадает порог"""
+        return bisect_left(self._values, threshold)
+    
+    def buckets(self) -> List[int]:
+        """Все достижимые номера интервалов (по одному на различное значение и «больше всех»)"""
+        return sorted({bisect_left(self._values, value) for value in self._values} | {len(self._values)})
+    
+    def mask(self, bucket: int) -> int:
+        return self._masks[bucket]
+
+
+class VehicleCatalog:
+    """Индекс транспорта: id -> Vehicle и битовые маски для фильтрации по VehicleRequest"""
+    
+    def __init__(self, vehicles: List[Vehicle]):
+        self.vehicles: Tuple[Vehicle, ...] = tuple(vehicles)
+        self.by_id: Dict[int, Vehicle] = {vehicle.id: vehicle for vehicle in self.vehicles}
+        
+        self._available = 0
+        self._by_body_type: Dict[BodyType, int] = {}
+        for position, vehicle in enumerate(self.vehicles):
+            if vehicle.is_available:
+                self._available |= 1 << position
+            self._by_body_type[vehicle.body_type] = self._by_body_type.get(vehicle.body_type, 0) | (1 << position)
+        
+        positions = list(enumerate(self.vehicles))
+        self._passengers = _ThresholdIndex((v.max_passengers, i) for i, v in positions)
+        self._loaders = _ThresholdIndex((v.max_loaders, i) for i, v in positions)
+        self._height = _ThresholdIndex((v.dimensions['height'], i) for i, v in positions)
+        self._length = _ThresholdIndex((v.dimensions['length'], i) for i, v in positions)
+        self._all_available = self._unpack(self._available)
+    
+    def _unpack(self, mask: int) -> List[Vehicle]:
+        """Транспорт по маске в исходном порядке конфигурации"""
+        result = []
+        while mask:
+            lowest = mask & -mask
+            result.append(self.vehicles[lowest.bit_length() - 1])
+            mask ^= lowest
+        return result
+    
+    def all_available(self) -> List[Vehicle]:
+        return list(self._all_available)
+    
+    def bucket_key(self, request: VehicleRequest) -> Tuple[int, int, int, int, Any]:
+        """Запрос, сведённый к интервалам между характеристиками транспорта.
+
+        Запросы с одинаковым ключом дают одинаковый набор транспорта; высота
+        и длина без фильтра (None или 0) попадают в интервал 0 — «подходят все».
+        """
+        return (
+            self._passengers.bucket(request.passengers),
+            self._loaders.bucket(request.loaders),
+            self._height.bucket(request.height) if request.height else 0,
+            self._length.bucket(request.length) if request.length else 0,
+            request.body_type
+        )
+    
+    def bucket_space(self) -> Iterable[Tuple[int, int, int, int, Any]]:
+        """Все достижимые ключи bucket_key"""
+        return itertools.product(self._passengers.buckets(), self._loaders.buckets(),
+                                 self._height.buckets(), self._length.buckets(), list(BodyType))
+    
+    def bucket_space_size(self) -> int:
+        return (len(self._passengers.buckets()) * len(self._loaders.buckets())
+                * len(self._height.buckets()) * len(self._length.buckets()) * len(BodyType))
+    
+    def mask_for_key(self, key: Tuple[int, int, int, int, Any]) -> int:
+        """Битовая маска транспорта для ключа bucket_key"""
+        passengers, loaders, height, length, body_type = key
+        mask = (self._available
+                & self._passengers.mask(passengers)
+                & self._loaders.mask(loaders)
+                & self._height.mask(height)
+                & self._length.mask(length))
+        if body_type != BodyType.ANY:
+            mask &= self._by_body_type.get(body_type, 0)
+        return mask
+    
+    def vehicles_for_mask(self, mask: int) -> List[Vehicle]:
+        return self._unpack(mask)
+    
+    def filter(self, request: VehicleRequest) -> List[Vehicle]:
+        """Транспорт, подходящий под запрос (те же условия, что и у прежнего перебора)"""
+        return self._unpack(self.mask_for_key(self.bucket_key(request)))
+
+
+class Step2Table:
+    """Готовые ответы шага 2 для всего пространства VehicleRequest одной версии транспорта.
+
+    Каждому ключу VehicleCatalog.bucket_key сопоставлен кортеж транспорта и
+    JSON-фрагмент {"vehicles": [...], "count": N}; одинаковые наборы транспорта
+    разделяют один фрагмент. Если пространство ключей больше max_entries
+    (сотни разных характеристик), ответы заполняются лениво при первом запросе.
+    """
+    
+    def __init__(self, catalog: VehicleCatalog, max_entries: int = 200_000):
+        self._catalog = catalog
+        self._answers: Dict[tuple, Tuple[Tuple[Vehicle, ...], str]] = {}
+        self._by_mask: Dict[int, Tuple[Tuple[Vehicle, ...], str]] = {}
+        self.precomputed = catalog.bucket_space_size() <= max_entries
+        if self.precomputed:
+            for key in catalog.bucket_space():
+                self._build(key)
+    
+    def _build(self, key: tuple) -> Tuple[Tuple[Vehicle, ...], str]:
+        mask = self._catalog.mask_for_key(key)
+        answer = self._by_mask.get(mask)
+        if answer is None:
+            vehicles = tuple(self._catalog.vehicles_for_mask(mask))
+            answer = (vehicles, f'{{"vehicles":{vehicles_json(vehicles)},"count":{len(vehicles)}}}')
+            self._by_mask[mask] = answer
+        self._answers[key] = answer
+        return answer
+    
+    def lookup(self, request: VehicleRequest) -> Tuple[Tuple[Vehicle, ...], str]:
+        """Подходящий транспорт и готовый JSON-фрагмент для запроса"""
+        key = self._catalog.bucket_key(request)
+        answer = self._answers.get(key)
+        return answer if answer is not None else self._build(key)
+    
+    def __len__(self) -> int:
+        return len(self._answers)
+
+
+def vehicles_from_config(config_vehicles: Iterable[Dict[str, Any]]) -> List[Vehicle]:
+    """Транспорт из раздела vehicles; некорректные записи пропускаются с сообщением"""
+    vehicles = []
+    
+    for vehicle_data in config_vehicles:
+        try:
+            # Преобразуем тип транспорта
+            vehicle_type = VehicleType(vehicle_data['type'])
+            body_type = BodyType(vehicle_data['body_type'])
+            
+            # Высота и длина нужны индексам каталога (VehicleCatalog)
+            dimensions = dict(vehicle_data['dimensions'])
+            for dimension in ('height', 'length'):
+                value = dimensions.get(dimension)
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"dimensions.{dimension} must be a number, got {value!r}")
+            
+            vehicle = Vehicle(
+                id=vehicle_data['id'],
+                name=vehicle_data['name'],
+                type=vehicle_type,
+                body_type=body_type,
+                price_per_hour=vehicle_data['price_per_hour'],
+                price_per_km=vehicle_data['price_per_km'],
+                base_price=vehicle_data['base_price'],
+                max_passengers=vehicle_data['max_passengers'],
+                max_loaders=vehicle_data['max_loaders'],
+                dimensions=dimensions,
+                capacity=vehicle_data['capacity'],
+                image_url=vehicle_data['image_url'],
+                description=vehicle_data['description'],
+                min_base_duration_hours=vehicle_data.get('min_base_duration_hours', 1)
+            )
+            vehicles.append(vehicle)
+            
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"Error creating vehicle from config: {e}, vehicle data: {vehicle_data}")
+            continue
+    
+    return vehicles
+
+
 class VehicleDatabase:
     """База данных транспорта с кэшированием"""
     
-    def __init__(self):
-        self._vehicles = self._initialize_vehicles()
+    def __init__(self, snapshot: Optional[ConfigSnapshot] = None):
+        snapshot = snapshot or config_manager.snapshot
+        # Версия раздела vehicles, из которой построен каталог
+        self.vehicles_hash = snapshot.section_hashes['vehicles']
+        self._vehicles = self._initialize_vehicles(snapshot)
+        self._catalog = VehicleCatalog(self._vehicles)
+        self.step2_table = Step2Table(self._catalog, max_entries=int(os.getenv('STEP2_TABLE_MAX_ENTRIES', 200_000)))
     
-    def _initialize_vehicles(self) -> List[Vehicle]:
+    def _initialize_vehicles(self, snapshot: ConfigSnapshot) -> List[Vehicle]:
         """Инициализация базы транспорта из конфигурации"""
-        vehicles = []
-        config_vehicles = config_manager.get_vehicles()
-        
-        for vehicle_data in config_vehicles:
-            try:
-                # Преобразуем тип транспорта
-                vehicle_type = VehicleType(vehicle_data['type'])
-                body_type = BodyType(vehicle_data['body_type'])
-                
-                vehicle = Vehicle(
-                    id=vehicle_data['id'],
-                    name=vehicle_data['name'],
-                    type=vehicle_type,
-                    body_type=body_type,
-                    price_per_hour=vehicle_data['price_per_hour'],
-                    price_per_km=vehicle_data['price_per_km'],
-                    base_price=vehicle_data['base_price'],
-                    max_passengers=vehicle_data['max_passengers'],
-                    max_loaders=vehicle_data['max_loaders'],
-                    dimensions=vehicle_data['dimensions'],
-                    capacity=vehicle_data['capacity'],
-                    image_url=vehicle_data['image_url'],
-                    description=vehicle_data['description'],
-                    min_base_duration_hours=vehicle_data.get('min_base_duration_hours', 1)
-                )
-                vehicles.append(vehicle)
-                
-            except (KeyError, ValueError) as e:
-                print(f"Error creating vehicle from config: {e}, vehicle data: {vehicle_data}")
-                continue
-        
-        return vehicles
+        return vehicles_from_config(snapshot.vehicles)
     
     def get_all_vehicles(self) -> List[Vehicle]:
         """Получить все доступные транспортные средства"""
-        return [v for v in self._vehicles if v.is_available]
+        return self._catalog.all_available()
     
     def filter_vehicles(self, request: VehicleRequest) -> List[Vehicle]:
         """Фильтрация транспорта по параметрам"""
-        filtered = []
-        
-        for vehicle in self._vehicles:
-            if not vehicle.is_available:
-                continue
-                
-            # Проверка пассажиров и грузчиков
-            if vehicle.max_passengers < request.passengers:
-                continue
-            if vehicle.max_loaders < request.loaders:
-                continue
-            
-            # Проверка типа кузова
-            if request.body_type != BodyType.ANY and vehicle.body_type != request.body_type:
-                continue
-            
-            # Проверка размеров (если указаны)
-            if request.height and vehicle.dimensions['height'] < request.height:
-                continue
-            if request.length and vehicle.dimensions['length'] < request.length:
-                continue
-            
-            filtered.append(vehicle)
-        
-        return filtered
+        return list(self.step2_table.lookup(request)[0])
     
     def get_vehicle_by_id(self, vehicle_id: int) -> Optional[Vehicle]:
         """Получить транспорт по ID"""
-        for vehicle in self._vehicles:
-            if vehicle.id == vehicle_id:
-                return vehicle
-        return None 
\ No newline at end of file
+        return self._catalog.by_id.get(vehicle_id)
+
+
+_vehicle_db: Optional[VehicleDatabase] = None
+_vehicle_db_lock = threading.Lock()
+
+
+def get_vehicle_database() -> VehicleDatabase:
+    """Общий для процесса каталог транспорта текущей версии конфигурации.
+
+    Строится лениво при первом обращении и заново — только когда меняется
+    раздел vehicles; остальные запросы получают готовый экземпляр.
+    """
+    global _vehicle_db
+    snapshot = config_manager.snapshot
+    vehicles_hash = snapshot.section_hashes['vehicles']
+    db = _vehicle_db
+    if db is not None and db.vehicles_hash == vehicles_hash:
+        return db
+    
+    with _vehicle_db_lock:
+        db = _vehicle_db
+        if db is None or db.vehicles_hash != vehicles_hash:
+            with vehicle_catalog_build_seconds.time():
+                db = VehicleDatabase(snapshot)
+            vehicle_catalog_builds.inc()
+            _vehicle_db = db
+    return db
@@ -0,0 +1,189 @@
+"""Ядро расчёта цены: таблица ставок, скомпилированная из снимка конфигурации.
+
+Не использует контекст Flask, логирование и метрики — принимает числа и
+возвращает числа или детализацию, поэтому подходит для скриптов и пакетных
+расчётов. Формулы и порядок операций совпадают с шагами 1 и 3 калькулятора,
+включая округление стоимости шага 1 (половины — к чётному).
+
+    from app.pricing_kernel import get_pricing_kernel
+    kernel = get_pricing_kernel()
+    kernel.quote(city_km=12.0, outside_km=25.3, kad_toll=True, duration_hours=3,
+                 urgent=False, vehicle_id=1, loaders=2)
+"""
+import threading
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+from prometheus_client import Counter
+
+from app.config_manager import ConfigSnapshot, config_manager
+from app.models import Vehicle, vehicles_from_config
+
+pricing_kernel_builds = Counter(
+    'pricing_kernel_builds_total',
+    'Pricing kernel compilations after a change of the pricing or vehicles config sections'
+)
+
+# Разделы конфигурации, из которых компилируется таблица ставок
+KERNEL_CONFIG_SECTIONS = ('pricing', 'vehicles')
+
+
+class VehicleRates(NamedTuple):
+    """Ставки набора транспорта массивами: позиция i — i-й транспорт набора"""
+    base_prices: np.ndarray
+    hourly_prices: np.ndarray
+    min_hours: np.ndarray
+    max_loaders: np.ndarray
+
+    @classmethod
+    def from_vehicles(cls, vehicles: Iterable[Vehicle]) -> 'VehicleRates':
+        vehicles = list(vehicles)
+        return cls(
+            base_prices=np.array([v.base_price for v in vehicles], dtype=float),
+            hourly_prices=np.array([v.price_per_hour for v in vehicles], dtype=float),
+            min_hours=np.array([v.min_base_duration_hours for v in vehicles], dtype=float),
+            max_loaders=np.array([v.max_loaders for v in vehicles], dtype=np.int64)
+        )
+
+
+class PricingKernel:
+    """Таблица ставок одной версии конфигурации и формулы расчёта"""
+
+    __slots__ = (
+        'namespace', 'city_cost_per_km', 'outside_cost_per_km', 'duration_cost_per_hour',
+        'urgent_pickup_multiplier', 'loader_price_per_hour', 'kad_toll_cost',
+        'vehicles', '_positions', 'vehicle_ids', 'rates'
+    )
+
+    def __init__(self, snapshot: ConfigSnapshot):
+        rates = snapshot.rates
+        self.namespace = snapshot.cache_namespace(*KERNEL_CONFIG_SECTIONS)
+        self.city_cost_per_km = rates.city_cost_per_km
+        self.outside_cost_per_km = rates.outside_cost_per_km
+        self.duration_cost_per_hour = rates.duration_cost_per_hour
+        self.urgent_pickup_multiplier = rates.urgent_pickup_multiplier
+        self.loader_price_per_hour = rates.loader_price_per_hour
+        self.kad_toll_cost = rates.kad_toll_cost
+
+        # Тот же набор транспорта, что и в VehicleDatabase: некорректные записи пропущены
+        self.vehicles: Dict[int, Vehicle] = {vehicle.id: vehicle for vehicle in vehicles_from_config(snapshot.vehicles)}
+        self._positions = {vehicle_id: position for position, vehicle_id in enumerate(self.vehicles)}
+        self.vehicle_ids = np.array(list(self.vehicles), dtype=np.int64)
+        self.rates = VehicleRates.from_vehicles(self.vehicles.values())
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'PricingKernel':
+        """Ядро из словаря конфигурации (для скриптов, работающих с другим файлом)"""
+        return cls(ConfigSnapshot.build(config, version=0, valid=True))
+
+    # ---- Скалярные расчёты ----
+
+    def route_breakdown(self, city_km: float, outside_km: float, kad_toll: bool,
+                        duration_hours: float, urgent: bool) -> Dict[str, float]:
+        """Шаг 1: стоимость маршрута и времени с детализацией"""
+        city_cost = city_km * self.city_cost_per_km
+        outside_cost = outside_km * self.outside_cost_per_km
+        duration_cost = duration_hours * self.duration_cost_per_hour
+        kad_cost = self.kad_toll_cost if kad_toll else 0.0
+        base_total_cost = city_cost + outside_cost + duration_cost + kad_cost
+        urgent_multiplier = self.urgent_pickup_multiplier if urgent else 1.0
+        return {
+            'city_cost': city_cost,
+            'outside_cost': outside_cost,
+            'duration_cost': duration_cost,
+            'kad_cost': kad_cost,
+            'base_total_cost': base_total_cost,
+            'urgent_multiplier': urgent_multiplier,
+            'total': round(base_total_cost * urgent_multiplier)
+        }
+
+    @staticmethod
+    def vehicle_cost(vehicle: Optional[Vehicle], duration_hours: float) -> float:
+        """Базовая цена транспорта + часы сверх его минимальной длительности"""
+        if vehicle is None:
+            return 0
+        return vehicle.base_price + vehicle.price_per_hour * max(0, duration_hours - vehicle.min_base_duration_hours)
+
+    def loaders_cost(self, loaders: int, duration_hours: float) -> float:
+        return loaders * self.loader_price_per_hour * duration_hours
+
+    def final_breakdown(self, route_total: float, vehicle: Optional[Vehicle], loaders: int,
+                        duration_hours: float, additional_services_cost: float = 0.0) -> Dict[str, float]:
+        """Шаг 3: итог по стоимости шага 1, выбранному транспорту, грузчикам и доп. услугам"""
+        vehicle_cost = self.vehicle_cost(vehicle, duration_hours)
+        loaders_cost = self.loaders_cost(loaders, duration_hours)
+        return {
+            'route_cost': route_total,
+            'vehicle_cost': vehicle_cost,
+            'loaders_cost': loaders_cost,
+            'additional_services_cost': additional_services_cost,
+            'total': route_total + vehicle_cost + loaders_cost + additional_services_cost
+        }
+
+    def quote(self, city_km: float, outside_km: float, kad_toll: bool, duration_hours: float,
+              urgent: bool, vehicle_id: Optional[int], loaders: int,
+              additional_services_cost: float = 0.0) -> float:
+        """Итоговая цена одной заявки по id транспорта ядра (быстрый путь без промежуточных словарей)"""
+        base_total_cost = (city_km * self.city_cost_per_km
+                           + outside_km * self.outside_cost_per_km
+                           + duration_hours * self.duration_cost_per_hour
+                           + (self.kad_toll_cost if kad_toll else 0.0))
+        total = round(base_total_cost * (self.urgent_pickup_multiplier if urgent else 1.0))
+        if vehicle_id is not None:
+            vehicle = self.vehicles[vehicle_id]
+            extra_hours = duration_hours - vehicle.min_base_duration_hours
+            total += vehicle.base_price + vehicle.price_per_hour * (extra_hours if extra_hours > 0 else 0)
+        return total + loaders * self.loader_price_per_hour * duration_hours + additional_services_cost
+
+    # ---- Векторные расчёты ----
+
+    def vehicle_index(self, vehicle_ids) -> np.ndarray:
+        """Позиции транспорта в массивах ставок (KeyError для неизвестного id)"""
+        return np.array([self._positions[vehicle_id] for vehicle_id in vehicle_ids], dtype=np.int64)
+
+    def route_totals(self, city_km, outside_km, kad_toll, duration_hours, urgent) -> np.ndarray:
+        """Стоимость шага 1 для массивов входных данных (с поддержкой broadcasting NumPy)"""
+        hours = np.asarray(duration_hours, dtype=float)
+        base_total_cost = (np.asarray(city_km, dtype=float) * self.city_cost_per_km
+                           + np.asarray(outside_km, dtype=float) * self.outside_cost_per_km
+                           + hours * self.duration_cost_per_hour
+                           + np.where(kad_toll, self.kad_toll_cost, 0.0))
+        return np.rint(base_total_cost * np.where(urgent, self.urgent_pickup_multiplier, 1.0))
+
+    def quote_many(self, city_km, outside_km, kad_toll, duration_hours, urgent,
+                   vehicle_index, loaders, additional_services_cost=0.0,
+                   rates: Optional[VehicleRates] = None) -> np.ndarray:
+        """Итоговые цены для массивов входных данных (с поддержкой broadcasting NumPy).
+
+        vehicle_index — позиции в rates (по умолчанию — в транспорте ядра,
+        из vehicle_index()), а не id транспорта.
+        """
+        rates = self.rates if rates is None else rates
+        hours = np.asarray(duration_hours, dtype=float)
+        route_total = self.route_totals(city_km, outside_km, kad_toll, hours, urgent)
+        index = np.asarray(vehicle_index)
+        vehicle_cost = (rates.base_prices[index]
+                        + rates.hourly_prices[index] * np.maximum(0.0, hours - rates.min_hours[index]))
+        loaders_cost = np.asarray(loaders, dtype=float) * self.loader_price_per_hour * hours
+        return route_total + vehicle_cost + loaders_cost + additional_services_cost
+
+_kernel: Optional[PricingKernel] = None
+_kernel_lock = threading.Lock()
+
+
+def get_pricing_kernel() -> PricingKernel:
+    """Ядро для текущей версии конфигурации (перекомпилируется при смене ставок или транспорта)"""
+    global _kernel
+    snapshot = config_manager.snapshot
+    namespace = snapshot.cache_namespace(*KERNEL_CONFIG_SECTIONS)
+    kernel = _kernel
+    if kernel is not None and kernel.namespace == namespace:
+        return kernel
+
+    with _kernel_lock:
+        kernel = _kernel
+        if kernel is None or kernel.namespace != namespace:
+            kernel = PricingKernel(snapshot)
+            pricing_kernel_builds.inc()
+            _kernel = kernel
+    return kernel
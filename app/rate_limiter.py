@@ -0,0 +1,517 @@
+"""Ограничение частоты запросов: скользящее окно в Redis, проверка одним атомарным скриптом"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import g, request
+from prometheus_client import Counter
+from redis.commands.core import Script
+
+from app import cache
+from app.config_manager import config_manager
+
+logger = logging.getLogger(__name__)
+
+rate_limit_decisions = Counter(
+    'rate_limit_decisions_total',
+    'Rate limit decisions by tier (local pre-filter or Redis) and result',
+    ['tier', 'result']
+)
+rate_limit_local_overshoot = Counter(
+    'rate_limit_local_overshoot_total',
+    'Requests admitted by the local pre-filter that Redis found over the limit on sync'
+)
+
+# Скользящее окно на отсортированном множестве: score — время запроса в мс,
+# каждая единица стоимости — отдельный элемент. Запрос проверяется сразу по
+# всем своим окнам (эндпоинт и группы) и записывается только если проходит
+# во всех. Очистка, подсчёт, добавление и TTL выполняются атомарно, время
+# берётся с сервера Redis, чтобы часы воркеров не расходились.
+# KEYS — окна; ARGV[1] — уникальный id запроса, далее по четыре значения на
+# окно: длина (мс), лимит (единиц), стоимость запроса и число единиц, уже
+# пропущенных локальным уровнем (записываются без проверки).
+# Возвращает {allowed, затем по окну: remaining, reset_ms, count}.
+_SLIDING_WINDOW_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local member = ARGV[1]
+local counts = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 4
+    local window = tonumber(ARGV[base + 1])
+    local limit = tonumber(ARGV[base + 2])
+    local cost = tonumber(ARGV[base + 3])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    for j = 1, tonumber(ARGV[base + 4]) do
+        redis.call('ZADD', key, now, member .. ':p' .. j)
+    end
+    counts[i] = redis.call('ZCARD', key)
+    if counts[i] + cost > limit then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local base = 1 + (i - 1) * 4
+    local window = tonumber(ARGV[base + 1])
+    local limit = tonumber(ARGV[base + 2])
+    local cost = tonumber(ARGV[base + 3])
+    if allowed == 1 then
+        for j = 1, cost do
+            redis.call('ZADD', key, now, member .. ':' .. j)
+        end
+        counts[i] = counts[i] + cost
+    end
+    if counts[i] > 0 then
+        redis.call('PEXPIRE', key, window)
+    end
+    local reset = 0
+    local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+    if oldest[2] then
+        reset = tonumber(oldest[2]) + window - now
+    end
+    table.insert(result, math.max(limit - counts[i], 0))
+    table.insert(result, reset)
+    table.insert(result, counts[i])
+end
+return result
+"""
+
+# Состояние одного окна без записи — для эндпоинта статуса
+_PEEK_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local count = redis.call('ZCOUNT', KEYS[1], '(' .. (now - window), '+inf')
+local reset = 0
+local oldest = redis.call('ZRANGEBYSCORE', KEYS[1], '(' .. (now - window), '+inf', 'WITHSCORES', 'LIMIT', 0, 1)
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+return {count < limit and 1 or 0, math.max(limit - count, 0), reset, count}
+"""
+
+# Скрипты вызываются через EVALSHA: тело передаётся в Redis один раз на процесс,
+# а при NOSCRIPT (перезапуск Redis, SCRIPT FLUSH) redis-py загружает его заново
+_scripts: Dict[str, Script] = {}
+
+
+def _lua(source: str) -> Script:
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = RateLimiter._redis().register_script(source)
+    return script
+
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    """Результат проверки лимита"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # секунд до освобождения самого старого слота окна
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.reset_after))
+
+
+@dataclass(frozen=True)
+class RateLimitBucket:
+    """Окно лимита: собственное окно эндпоинта или общий бюджет группы эндпоинтов"""
+    name: str
+    max_units: int
+    window_seconds: int
+
+    def key(self, client_id: str) -> str:
+        return f"rate_limit:{self.name}:{client_id}"
+
+
+class _LocalWindow:
+    """Состояние клиента в локальном уровне: счётчик окна на момент синхронизации и неотправленные единицы"""
+    __slots__ = ('synced_count', 'synced_at', 'reset_at', 'pending')
+
+    def __init__(self):
+        self.synced_count = 0
+        self.synced_at = 0.0
+        self.reset_at = 0.0
+        self.pending = 0
+
+
+class LocalRateTier:
+    """Внутрипроцессный предфильтр перед Redis (токен-бакет на воркер).
+
+    После каждой синхронизации воркер получает локальный бюджет — долю
+    local_fraction от оставшегося в Redis запаса. Пока бюджет не исчерпан и
+    синхронизация не старше sync_interval, запросы пропускаются без обращения
+    к Redis; пропущенные запросы дописываются в окно при следующей проверке
+    в Redis. Отказ всегда выносит Redis, поэтому у клиентов далеко от лимита
+    запросы идут без сетевых вызовов, а у лимита — точная проверка.
+
+    Компромисс точность/задержка: при N воркерах превышение лимита не больше
+    (N * local_fraction - 1) * остаток; local_fraction = 1 / N исключает его,
+    local_fraction = 0 отключает локальный уровень.
+    """
+
+    def __init__(self, local_fraction: float, sync_interval: float, max_clients: int = 10000):
+        self.local_fraction = local_fraction
+        self.sync_interval = sync_interval
+        self.max_clients = max_clients
+        self._windows: "OrderedDict[str, _LocalWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.local_fraction > 0
+
+    def try_acquire(self, entries: Sequence[Tuple[str, int, int]]) -> Optional[RateLimitDecision]:
+        """Решение без Redis по всем окнам запроса (ключ, лимит, стоимость) или None, если нужна синхронизация"""
+        now = time.monotonic()
+        with self._lock:
+            windows = []
+            for key, limit, cost in entries:
+                window = self._windows.get(key)
+                if window is None or now - window.synced_at >= self.sync_interval:
+                    return None
+                budget = int((limit - window.synced_count) * self.local_fraction)
+                if window.pending + cost > budget:
+                    return None
+                windows.append(window)
+
+            remaining = None
+            reset_after = 0.0
+            for (key, limit, cost), window in zip(entries, windows):
+                window.pending += cost
+                self._windows.move_to_end(key)
+                left = max(limit - window.synced_count - window.pending, 0) // cost
+                remaining = left if remaining is None else min(remaining, left)
+                reset_after = max(reset_after, window.reset_at - now)
+            return RateLimitDecision(
+                allowed=True,
+                limit=min(limit // cost for _, limit, cost in entries),
+                remaining=remaining,
+                reset_after=reset_after
+            )
+
+    def pending(self, key: str) -> int:
+        """Число пропущенных локально единиц, ещё не записанных в Redis"""
+        window = self._windows.get(key)
+        return window.pending if window is not None else 0
+
+    def take_pending(self, key: str) -> int:
+        """Забрать неотправленные единицы для записи в Redis"""
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                return 0
+            pending, window.pending = window.pending, 0
+            return pending
+
+    def restore_pending(self, key: str, pending: int):
+        """Вернуть единицы, если Redis недоступен"""
+        if pending:
+            with self._lock:
+                window = self._windows.get(key)
+                if window is not None:
+                    window.pending += pending
+
+    def record_sync(self, key: str, count: int, reset_after: float):
+        """Запомнить состояние окна, полученное из Redis"""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _LocalWindow()
+                if len(self._windows) > self.max_clients:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+            window.synced_count = count
+            window.synced_at = now
+            window.reset_at = now + reset_after
+
+
+# Общий для всех эндпоинтов локальный уровень воркера
+_local_tier = LocalRateTier(
+    local_fraction=float(os.getenv('RATE_LIMIT_LOCAL_FRACTION', 0.25)),
+    sync_interval=float(os.getenv('RATE_LIMIT_SYNC_INTERVAL', 1.0))
+)
+
+
+class RateLimiter:
+    """Система ограничения частоты запросов (скользящее окно, один запрос к Redis на проверку).
+
+    Кроме собственного окна эндпоинта запрос может списывать стоимость
+    из общих бюджетов групп (groups — пары окно группы / стоимость).
+    """
+
+    def __init__(self, max_requests: int = 10, window_seconds: int = 60, name: str = 'default',
+                 groups: Sequence[Tuple[RateLimitBucket, int]] = ()):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.name = name
+        self.groups = tuple(groups)
+        self.buckets = ((RateLimitBucket(name, max_requests, window_seconds), 1),) + self.groups
+
+    def _get_client_key(self, client_id: str) -> str:
+        """Генерация ключа для клиента"""
+        return self.buckets[0][0].key(client_id)
+
+    @staticmethod
+    def _redis():
+        # Клиент Redis из flask-caching (RedisCache хранит его в _write_client)
+        return cache.cache._write_client
+
+    def _fail_open(self) -> RateLimitDecision:
+        return RateLimitDecision(True, self.max_requests, self.max_requests, 0.0)
+
+    def check(self, client_id: str) -> RateLimitDecision:
+        """Проверка с учётом запроса: локально, если клиент далеко от лимитов, иначе атомарно в Redis.
+
+        При недоступности Redis запрос пропускается.
+        """
+        entries = [(bucket.key(client_id), bucket.max_units, cost) for bucket, cost in self.buckets]
+        if _local_tier.enabled:
+            decision = _local_tier.try_acquire(entries)
+            if decision is not None:
+                rate_limit_decisions.labels(tier='local', result='allowed').inc()
+                return decision
+
+        pending = [_local_tier.take_pending(key) for key, _, _ in entries]
+        args = [uuid.uuid4().hex]
+        for (bucket, cost), units in zip(self.buckets, pending):
+            args.extend([bucket.window_seconds * 1000, bucket.max_units, cost, units])
+        try:
+            result = _lua(_SLIDING_WINDOW_SCRIPT)(
+                keys=[key for key, _, _ in entries], args=args, client=self._redis()
+            )
+        except Exception as e:
+            logger.warning("Rate limiter error: %s", e)
+            for (key, _, _), units in zip(entries, pending):
+                _local_tier.restore_pending(key, units)
+            return self._fail_open()
+
+        allowed = bool(result[0])
+        remaining = None
+        reset_after = 0.0
+        for i, ((key, limit, cost), units) in enumerate(zip(entries, pending)):
+            left, reset_ms, count = (int(v) for v in result[1 + i * 3:4 + i * 3])
+            if count > limit:
+                # Локально пропущенные запросы вывели окно за лимит
+                rate_limit_local_overshoot.inc(min(units, count - limit))
+            if _local_tier.enabled:
+                _local_tier.record_sync(key, count, reset_ms / 1000.0)
+            requests_left = left // cost
+            remaining = requests_left if remaining is None else min(remaining, requests_left)
+            # Повторять имеет смысл, когда освободится самое «занятое» из окон
+            if allowed or left < cost:
+                reset_after = max(reset_after, reset_ms / 1000.0)
+
+        rate_limit_decisions.labels(tier='redis', result='allowed' if allowed else 'rejected').inc()
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=min(limit // cost for _, limit, cost in entries),
+            remaining=remaining,
+            reset_after=reset_after
+        )
+
+    def peek(self, client_id: str) -> RateLimitDecision:
+        """Состояние собственного окна эндпоинта без учёта запроса"""
+        try:
+            allowed, remaining, reset_ms, _ = _lua(_PEEK_SCRIPT)(
+                keys=[self._get_client_key(client_id)],
+                args=[self.window_seconds * 1000, self.max_requests],
+                client=self._redis()
+            )
+        except Exception as e:
+            logger.warning("Rate limiter error: %s", e)
+            return self._fail_open()
+        return RateLimitDecision(bool(allowed), self.max_requests, int(remaining), int(reset_ms) / 1000.0)
+
+    def is_allowed(self, client_id: str) -> bool:
+        """Проверка, разрешен ли запрос"""
+        return self.check(client_id).allowed
+
+    def get_remaining_requests(self, client_id: str) -> int:
+        """Получить количество оставшихся запросов"""
+        return self.peek(client_id).remaining
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """Лимит эндпоинта"""
+    name: str
+    max_requests: int
+    window_seconds: int
+
+
+class RateLimitRegistry:
+    """Реестр политик ограничения запросов по эндпоинтам.
+
+    Политики по умолчанию регистрируются декоратором rate_limit при импорте
+    маршрутов; секция rate_limits в calculator_config.json переопределяет их
+    без изменения кода. Группы (rate_limits.groups) задают общий бюджет в
+    единицах на несколько эндпоинтов и стоимость запроса к каждому, например
+    один бюджет на все эндпоинты, обращающиеся к геокодеру и OSRM. Лимитеры
+    создаются один раз на политику и пересоздаются только при reload().
+    """
+
+    def __init__(self):
+        self._defaults: Dict[str, RateLimitPolicy] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._groups: Dict[str, RateLimitBucket] = {}
+        self._memberships: Dict[str, Tuple[Tuple[RateLimitBucket, int], ...]] = {}
+        # FLASK_DEBUG=TRUE отключает ограничения (проверяется один раз при старте)
+        self._debug_bypass = os.environ.get('FLASK_DEBUG', 'FALSE').upper() == 'TRUE'
+        self._load_settings()
+
+    def _load_settings(self):
+        """Лимиты эндпоинтов и группы из конфигурации"""
+        settings = config_manager.snapshot.rate_limits
+        self._overrides = settings.get('endpoints', {})
+
+        groups = {}
+        memberships: Dict[str, list] = {}
+        for group_name, group in settings.get('groups', {}).items():
+            bucket = RateLimitBucket(
+                name=f"group:{group_name}",
+                max_units=int(group['max_units']),
+                window_seconds=int(group.get('window_seconds', 60))
+            )
+            groups[group_name] = bucket
+            for endpoint, cost in group.get('endpoints', {}).items():
+                # Перезагрузку с такой стоимостью отклоняет ConfigManager; здесь — защита первичной загрузки
+                if int(cost) < 1:
+                    logger.warning("Rate limit group %s: ignoring cost %s for %s", group_name, cost, endpoint)
+                    continue
+                memberships.setdefault(endpoint, []).append((bucket, int(cost)))
+        self._groups = groups
+        self._memberships = {endpoint: tuple(items) for endpoint, items in memberships.items()}
+        self.enabled = settings.get('enabled', True) and not self._debug_bypass
+
+    def _build(self, policy: RateLimitPolicy) -> RateLimiter:
+        override = self._overrides.get(policy.name, {})
+        return RateLimiter(
+            max_requests=int(override.get('max_requests', policy.max_requests)),
+            window_seconds=int(override.get('window_seconds', policy.window_seconds)),
+            name=policy.name,
+            groups=self._memberships.get(policy.name, ())
+        )
+
+    def register(self, name: str, max_requests: int, window_seconds: int):
+        """Регистрация политики по умолчанию и лимитера с учётом конфигурации"""
+        self._defaults[name] = RateLimitPolicy(name, max_requests, window_seconds)
+        self._limiters[name] = self._build(self._defaults[name])
+
+    def reload(self):
+        """Перечитать лимиты из конфигурации (атомарная замена словаря лимитеров)"""
+        self._load_settings()
+        self._limiters = {name: self._build(policy) for name, policy in self._defaults.items()}
+
+    def limiter(self, name: str) -> RateLimiter:
+        return self._limiters[name]
+
+    def _peek_all(self, buckets: List[RateLimitBucket], client_id: str) -> list:
+        try:
+            pipe = RateLimiter._redis().pipeline(transaction=False)
+            peek = _lua(_PEEK_SCRIPT)
+            for bucket in buckets:
+                peek(keys=[bucket.key(client_id)], args=[bucket.window_seconds * 1000, bucket.max_units], client=pipe)
+            return pipe.execute()
+        except Exception as e:
+            logger.warning("Rate limiter status error: %s", e)
+            return [(1, bucket.max_units, 0, 0) for bucket in buckets]
+
+    def status(self, client_id: str) -> Tuple[List[dict], List[dict]]:
+        """Состояние всех политик и групп для клиента (одним пайплайном в Redis)"""
+        limiters = list(self._limiters.values())
+        groups = list(self._groups.items())
+        buckets = [limiter.buckets[0][0] for limiter in limiters] + [bucket for _, bucket in groups]
+        results = self._peek_all(buckets, client_id)
+
+        def remaining(bucket, result):
+            return max(int(result[1]) - _local_tier.pending(bucket.key(client_id)), 0)
+
+        policies = [{
+            'endpoint': limiter.name,
+            'max_requests': limiter.max_requests,
+            'window_seconds': limiter.window_seconds,
+            'remaining_requests': remaining(limiter.buckets[0][0], result),
+            'reset_after': int(result[2]) / 1000.0,
+            'groups': {bucket.name.split(':', 1)[1]: cost for bucket, cost in limiter.groups}
+        } for limiter, result in zip(limiters, results)]
+
+        group_status = [{
+            'group': name,
+            'max_units': bucket.max_units,
+            'window_seconds': bucket.window_seconds,
+            'remaining_units': remaining(bucket, result),
+            'reset_after': int(result[2]) / 1000.0
+        } for (name, bucket), result in zip(groups, results[len(limiters):])]
+        return policies, group_status
+
+
+# Глобальный реестр политик
+rate_limit_registry = RateLimitRegistry()
+
+
+def _reload_rate_limits(previous, snapshot):
+    if 'rate_limits' in snapshot.changed_sections(previous):
+        rate_limit_registry.reload()
+
+
+config_manager.add_listener(_reload_rate_limits)
+
+
+def get_client_id() -> str:
+    """Получение идентификатора клиента (вычисляется один раз на запрос)"""
+    client_id = g.get('client_id')
+    if client_id is None:
+        # Используем IP адрес или X-Forwarded-For
+        client_ip = request.headers.get('X-Forwarded-For', request.remote_addr)
+        user_agent = request.headers.get('User-Agent', '')
+
+        # Создаем уникальный идентификатор
+        identifier = f"{client_ip}:{user_agent}"
+        client_id = g.client_id = hashlib.md5(identifier.encode()).hexdigest()
+    return client_id
+
+
+def rate_limit(max_requests: int = 10, window_seconds: int = 60, name: Optional[str] = None):
+    """Декоратор для ограничения частоты запросов.
+
+    Политика регистрируется в реестре под именем view-функции (или name);
+    лимиты и участие в группах задаются в секции rate_limits конфигурации.
+    """
+    def decorator(f):
+        policy_name = name or f.__name__
+        rate_limit_registry.register(policy_name, max_requests, window_seconds)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not rate_limit_registry.enabled:
+                return f(*args, **kwargs)
+
+            decision = rate_limit_registry.limiter(policy_name).check(get_client_id())
+
+            if not decision.allowed:
+                return {
+                    'error': 'Rate limit exceeded',
+                    'remaining_requests': decision.remaining,
+                    'retry_after': decision.retry_after
+                }, 429, {'Retry-After': str(decision.retry_after)}
+
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
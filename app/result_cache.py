@@ -0,0 +1,109 @@
+"""Кэш результатов калькулятора с режимом stale-while-revalidate"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter
+
+from app import app, cache
+from app.cache_keys import CacheNamespace
+
+logger = logging.getLogger(__name__)
+
+result_cache_refreshes = Counter(
+    'result_cache_refreshes_total',
+    'Background refreshes of stale calculator results by namespace and outcome',
+    ['namespace', 'outcome']
+)
+
+# Общий пул фоновых обновлений (один на процесс воркера)
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='swr-refresh')
+
+
+class StaleWhileRevalidateCache:
+    """Кэш с мягким и жёстким TTL.
+
+    До soft_ttl значение отдаётся как свежее. Между soft_ttl и hard_ttl
+    устаревшее значение отдаётся сразу, а пересчёт ставится в фоновый пул;
+    аренда в Redis гарантирует, что пересчёт запустит только один воркер.
+    После hard_ttl запись исчезает из Redis и считается промахом.
+    Ключи строит пространство имён keys (CacheNamespace.key), TTL берутся из него.
+    """
+
+    def __init__(self, keys: CacheNamespace):
+        self.keys = keys
+        self.namespace = keys.name
+        self.hard_ttl = keys.ttl_seconds
+        self.soft_ttl = min(keys.soft_ttl_seconds or keys.ttl_seconds, self.hard_ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            entry = cache.get(key)
+        except Exception:
+            return None
+        return entry if isinstance(entry, dict) and 'stored_at' in entry else None
+
+    def _store(self, key: str, value: Any):
+        try:
+            cache.set(key, {'value': value, 'stored_at': time.time()}, timeout=self.hard_ttl)
+        except Exception:
+            return
+        self.keys.track_key(key)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any],
+                       should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Значение из кэша (возможно устаревшее) или результат compute()"""
+        entry = self._load(key)
+        if entry is None:
+            self.keys.record('miss')
+            value = compute()
+            if should_cache(value):
+                self._store(key, value)
+            return value
+
+        if time.time() - entry['stored_at'] < self.soft_ttl:
+            self.keys.record('hit')
+        else:
+            self.keys.record('stale')
+            self._schedule_refresh(key, compute, should_cache)
+        return entry['value']
+
+    def _schedule_refresh(self, key: str, compute: Callable[[], Any], should_cache: Callable[[Any], bool]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        try:
+            # Между воркерами пересчёт запускает только владелец аренды
+            acquired = cache.add(f"{key}:refresh", 1, timeout=60)
+        except Exception:
+            acquired = True
+        if not acquired:
+            with self._lock:
+                self._refreshing.discard(key)
+            return
+        _refresh_executor.submit(self._refresh, key, compute, should_cache)
+
+    def _refresh(self, key: str, compute: Callable[[], Any], should_cache: Callable[[Any], bool]):
+        try:
+            with app.app_context():
+                value = compute()
+                if should_cache(value):
+                    self._store(key, value)
+                    result_cache_refreshes.labels(namespace=self.namespace, outcome='updated').inc()
+                else:
+                    result_cache_refreshes.labels(namespace=self.namespace, outcome='skipped').inc()
+                try:
+                    cache.delete(f"{key}:refresh")
+                except Exception:
+                    pass
+        except Exception as e:
+            result_cache_refreshes.labels(namespace=self.namespace, outcome='error').inc()
+            logger.warning("Background refresh error (%s:%s): %s", self.namespace, key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
@@ -1,20 +1,26 @@
 from flask import Response, render_template, request, jsonify
 from app import app, metrics, cache
-from app.calculator import CalculatorServiceV2, ZoneDistanceService, rate_limit, get_client_id
+from app.calculator import CalculatorServiceV2, ZoneDistanceService
 from app.models import (
     RouteRequest, TimeRequest, VehicleRequest, BodyType, 
-    VehicleDatabase, CalculationResult
+    CalculationResult, get_vehicle_database, vehicles_json
 )
 from app.order_models import order_storage, OrderStatus, PaymentMethod, Order
 from app.media_models import media_database, MediaType, MediaCategory
 from app.config_manager import config_manager
+from app.cache_keys import cache_namespaces
+from app.config_watcher import config_watcher
+from app.http_client import http_client
+from app.rate_limiter import get_client_id, rate_limit, rate_limit_registry
 from pathlib import Path
+import hmac
 import json
+import math
 
 def validate_duration_hours(duration_hours: int) -> tuple[bool, str]:
     """Валидация длительности на основе конфигурации"""
     try:
-        limits = config_manager.get_calculator_limits()
+        limits = config_manager.snapshot.calculator_limits
         min_duration = limits.get('min_duration_hours', 1)
         max_duration = limits.get('max_duration_hours', 24)
         
@@ -28,6 +34,14 @@ def validate_duration_hours(duration_hours: int) -> tuple[bool, str]:
         if duration_hours < 1 or duration_hours > 24:
             return False, 'Duration must be between 1 and 24 hours'
         return True, ''
+
+def is_admin_request() -> bool:
+    """Служебный запрос: режим отладки или заголовок X-Admin-Token, совпадающий с ADMIN_API_TOKEN"""
+    if os.environ.get('FLASK_DEBUG', 'FALSE').upper() == 'TRUE':
+        return True
+    admin_token = os.getenv('ADMIN_API_TOKEN')
+    provided = request.headers.get('X-Admin-Token', '')
+    return bool(admin_token) and hmac.compare_digest(provided.encode(), admin_token.encode())
 # Импорт функции для отправки в телеграм (опционально)
 try:
     from telegram_service.telegram_bot_standalone import send_order_to_telegram
@@ -195,20 +209,14 @@ def api_step2_v2():
             body_type=body_type
         )
         
-        # Получение доступного транспорта
-        vehicles = CalculatorServiceV2.calculate_step2(vehicle_request)
+        # Получение доступного транспорта (готовый JSON-фрагмент из таблицы ответов)
+        vehicles, data_json = CalculatorServiceV2.step2_answer(vehicle_request)
         
         # Логирование
         app.logger.info(f"Step2 vehicles found: {len(vehicles)} for {passengers} passengers, {loaders} loaders")
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'vehicles': vehicles,
-                'count': len(vehicles)
-            },
-            'client_id': get_client_id()
-        })
+        body = f'{{"success":true,"data":{data_json},"client_id":{json.dumps(get_client_id())}}}'
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         app.logger.error(f"Step2 error: {str(e)}")
@@ -251,7 +259,7 @@ def api_step3_v2():
             return jsonify({'error': 'Valid vehicle ID is required'}), 400
         
         # Получение выбранного транспорта
-        vehicle_db = VehicleDatabase()
+        vehicle_db = get_vehicle_database()
         selected_vehicle = vehicle_db.get_vehicle_by_id(selected_vehicle_id)
         
         if not selected_vehicle:
@@ -373,21 +381,129 @@ def api_complete_calculation():
         app.logger.error(f"Complete calculation error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+# Ограничение размера матрицы цен (ячеек на запрос)
+MAX_QUOTE_MATRIX_CELLS = 2000
+
+def _as_list(value, default: list) -> list:
+    """Одиночное значение или список из JSON -> список без повторов (порядок сохраняется)"""
+    if value is None:
+        return list(default)
+    values = value if isinstance(value, list) else [value]
+    return list(dict.fromkeys(values))
+
+def _as_int(value) -> int:
+    """Целое из JSON: число без дробной части или строка с целым; bool и 2.7 отклоняются"""
+    if isinstance(value, bool):
+        raise TypeError(f'Expected integer, got {value!r}')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'Expected integer, got {value!r}')
+        return int(value)
+    if isinstance(value, (int, str)):
+        return int(value)
+    raise TypeError(f'Expected integer, got {value!r}')
+
+@app.route('/api/v2/calculator/quote-matrix', methods=['POST'])
+@rate_limit(max_requests=10, window_seconds=60)
+def api_quote_matrix():
+    """API для расчета цен по всем сочетаниям длительности, транспорта, грузчиков и срочности"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        from_address = data.get('from_address', '').strip()
+        to_address = data.get('to_address', '').strip()
+        if not from_address or not to_address:
+            return jsonify({'error': 'From and to addresses are required'}), 400
+        
+        try:
+            min_duration = config_manager.snapshot.calculator_limits.get('min_duration_hours', 1)
+            durations = list(dict.fromkeys(_as_int(d) for d in _as_list(data.get('duration_hours'), [min_duration])))
+            loaders = list(dict.fromkeys(_as_int(l) for l in _as_list(data.get('loaders'), [0])))
+            additional_services_cost = float(data.get('additional_services_cost', 0))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid duration_hours, loaders or additional_services_cost'}), 400
+        # NaN и Infinity дали бы NaN в итогах и невалидный JSON
+        if not math.isfinite(additional_services_cost) or additional_services_cost < 0:
+            return jsonify({'error': 'additional_services_cost must be a finite non-negative number'}), 400
+        
+        # Срочность — только JSON true/false: bool("false") дал бы срочный заказ
+        urgency = _as_list(data.get('urgent_pickup'), [False])
+        if not all(isinstance(u, bool) for u in urgency):
+            return jsonify({'error': 'urgent_pickup must be true or false'}), 400
+        
+        # Пустая ось дала бы пустую матрицу после анализа маршрута
+        if not durations or not loaders or not urgency:
+            return jsonify({'error': 'duration_hours, loaders and urgent_pickup must not be empty'}), 400
+        
+        for duration_hours in durations:
+            is_valid, error_message = validate_duration_hours(duration_hours)
+            if not is_valid:
+                return jsonify({'error': error_message}), 400
+        if any(l < 0 for l in loaders):
+            return jsonify({'error': 'Loaders must be non-negative'}), 400
+        
+        # Транспорт: явный список id или фильтр шага 2 (без учета грузчиков — они ось матрицы)
+        vehicle_db = get_vehicle_database()
+        if data.get('vehicle_ids') is not None:
+            try:
+                vehicle_ids = list(dict.fromkeys(_as_int(v) for v in _as_list(data.get('vehicle_ids'), [])))
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid vehicle_ids'}), 400
+            vehicles = [vehicle_db.get_vehicle_by_id(vehicle_id) for vehicle_id in vehicle_ids]
+            if None in vehicles:
+                return jsonify({'error': 'Vehicle not found'}), 404
+        else:
+            try:
+                body_type = BodyType(data.get('body_type', 'any'))
+            except ValueError:
+                body_type = BodyType.ANY
+            try:
+                vehicle_request = VehicleRequest(
+                    passengers=int(data.get('passengers', 0)),
+                    loaders=0,
+                    height=float(data['height']) if data.get('height') not in (None, '', 'any') else None,
+                    length=float(data['length']) if data.get('length') not in (None, '', 'any') else None,
+                    body_type=body_type
+                )
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid vehicle filter'}), 400
+            vehicles = vehicle_db.filter_vehicles(vehicle_request)
+        
+        cells = len(urgency) * len(durations) * len(vehicles) * len(loaders)
+        if cells > MAX_QUOTE_MATRIX_CELLS:
+            return jsonify({'error': f'Quote matrix too large: {cells} cells (max {MAX_QUOTE_MATRIX_CELLS})'}), 400
+        
+        route_request = RouteRequest(from_address=from_address, to_address=to_address)
+        result = CalculatorServiceV2.calculate_quote_matrix(
+            route_request, durations, vehicles, loaders, urgency, additional_services_cost
+        )
+        
+        app.logger.info(f"Quote matrix: {from_address} -> {to_address}, {cells} cells")
+        
+        return jsonify({
+            'success': True,
+            'data': result,
+            'client_id': get_client_id()
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Quote matrix error: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @app.route('/api/v2/vehicles', methods=['GET'])
 @rate_limit(max_requests=50, window_seconds=60)
 def api_get_vehicles():
     """API для получения всех доступных транспортных средств"""
     try:
-        vehicle_db = VehicleDatabase()
+        vehicle_db = get_vehicle_database()
         vehicles = vehicle_db.get_all_vehicles()
         
-        return jsonify({
-            'success': True,
-            'data': {
-                'vehicles': [v.to_dict() for v in vehicles],
-                'count': len(vehicles)
-            }
-        })
+        # Ответ собирается из готовых JSON-фрагментов транспорта
+        body = f'{{"success":true,"data":{{"vehicles":{vehicles_json(vehicles)},"count":{len(vehicles)}}}}}'
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         app.logger.error(f"Get vehicles error: {str(e)}")
@@ -398,16 +514,13 @@ def api_get_vehicles():
 def api_get_vehicle(vehicle_id: int):
     """API для получения конкретного транспортного средства"""
     try:
-        vehicle_db = VehicleDatabase()
+        vehicle_db = get_vehicle_database()
         vehicle = vehicle_db.get_vehicle_by_id(vehicle_id)
         
         if not vehicle:
             return jsonify({'error': 'Vehicle not found'}), 404
         
-        return jsonify({
-            'success': True,
-            'data': vehicle.to_dict()
-        })
+        return Response(f'{{"success":true,"data":{vehicle.to_json()}}}', mimetype='application/json')
         
     except Exception as e:
         app.logger.error(f"Get vehicle error: {str(e)}")
@@ -493,18 +606,22 @@ def api_rate_limit_status():
     try:
         client_id = get_client_id()
         
-        # Создаем временный лимитер для проверки
-        from app.calculator import RateLimiter
-        limiter = RateLimiter(max_requests=10, window_seconds=60)
-        remaining = limiter.get_remaining_requests(client_id)
+        # Состояние всех политик и групп клиента (без учета этого запроса)
+        policies, groups = rate_limit_registry.status(client_id)
+        endpoint = request.args.get('endpoint')
+        if endpoint:
+            policies = [p for p in policies if p['endpoint'] == endpoint]
+            if not policies:
+                return jsonify({'error': f'Unknown endpoint: {endpoint}'}), 404
+            groups = [group for group in groups if group['group'] in policies[0]['groups']]
         
         return jsonify({
             'success': True,
             'data': {
                 'client_id': client_id,
-                'remaining_requests': remaining,
-                'max_requests': 10,
-                'window_seconds': 60
+                'enabled': rate_limit_registry.enabled,
+                'policies': policies,
+                'groups': groups
             }
         })
         
@@ -512,6 +629,28 @@ def api_rate_limit_status():
         app.logger.error(f"Rate limit status error: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/v2/cache/stats', methods=['GET'])
+@rate_limit(max_requests=5, window_seconds=60)
+def api_cache_stats():
+    """API для просмотра кэшей калькулятора: счётчики обращений и доля попаданий (только для админов)"""
+    try:
+        if not is_admin_request():
+            return jsonify({'error': 'Forbidden'}), 403
+        
+        name = request.args.get('namespace')
+        if name and name not in cache_namespaces:
+            return jsonify({'error': f'Unknown cache namespace: {name}'}), 404
+        
+        names = [name] if name else sorted(cache_namespaces)
+        return jsonify({
+            'success': True,
+            'data': {name: cache_namespaces[name].stats() for name in names}
+        })
+        
+    except Exception as e:
+        app.logger.error(f"Cache stats error: {str(e)}")
+        return jsonify({'error': 'Cache statistics unavailable'}), 503
+
 @app.route('/api/v2/health', methods=['GET'])
 def api_health_v2():
     """API для проверки здоровья системы"""
@@ -527,7 +666,7 @@ def api_health_v2():
             cache_status = "unhealthy"
         
         # Проверяем базу транспорта
-        vehicle_db = VehicleDatabase()
+        vehicle_db = get_vehicle_database()
         vehicles_count = len(vehicle_db.get_all_vehicles())
         
         return jsonify({
@@ -561,8 +700,8 @@ def api_proxy_osrm():
         if not coordinates:
             return jsonify({'error': 'Coordinates parameter is required'}), 400
         
-        # Формируем URL для OSRM API
-        osrm_url = f"https://router.project-osrm.org/route/v1/{profile}/{coordinates}"
+        # Формируем путь для OSRM API
+        osrm_path = f"/route/v1/{profile}/{coordinates}"
         
         # Добавляем параметры запроса
         params = {
@@ -572,8 +711,8 @@ def api_proxy_osrm():
         if geometries:
             params['geometries'] = geometries
         
-        # Выполняем запрос к OSRM API
-        response = requests.get(osrm_url, params=params, timeout=10)
+        # Выполняем запрос к OSRM API через общий пул соединений
+        response = http_client.get('osrm', osrm_path, params=params)
         
         # Проверяем статус ответа
         if response.status_code != 200:
@@ -627,8 +766,8 @@ def api_proxy_nominatim():
         if not q and not (lat and lon):
             return jsonify({'error': 'Either q parameter or lat/lon parameters are required'}), 400
         
-        # Формируем URL для Nominatim API
-        nominatim_url = "https://nominatim.openstreetmap.org/search"
+        # Формируем путь для Nominatim API
+        nominatim_path = "/search"
         
         # Добавляем параметры запроса
         params = {
@@ -642,15 +781,15 @@ def api_proxy_nominatim():
         else:
             params['lat'] = lat
             params['lon'] = lon
-            nominatim_url = "https://nominatim.openstreetmap.org/reverse"
+            nominatim_path = "/reverse"
         
         # Добавляем User-Agent для соблюдения правил использования Nominatim
         headers = {
             'User-Agent': 'TransportCompany/1.0 (https://transportcompany.com)'
         }
         
-        # Выполняем запрос к Nominatim API
-        response = requests.get(nominatim_url, params=params, headers=headers, timeout=10)
+        # Выполняем запрос к Nominatim API через общий пул соединений
+        response = http_client.get('nominatim', nominatim_path, params=params, headers=headers)
         
         # Проверяем статус ответа
         if response.status_code != 200:
@@ -965,7 +1104,7 @@ def api_create_order():
             step2_result = CalculatorServiceV2.calculate_step2(vehicle_request)
             
             # Получаем выбранный транспорт
-            vehicle_db = VehicleDatabase()
+            vehicle_db = get_vehicle_database()
             selected_vehicle = vehicle_db.get_vehicle_by_id(selected_vehicle_id)
             
             if not selected_vehicle:
@@ -1252,15 +1391,15 @@ def send_telegram_message_direct(order_data: Dict[str, Any]) -> bool:
         app.logger.info(f"Formatted Telegram message length: {len(message)} characters")
         
         # Отправляем через Telegram API
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        telegram_path = f"/bot{bot_token}/sendMessage"
         data = {
             'chat_id': chat_id,
             'text': message,
             'parse_mode': 'HTML'
         }
         
-        app.logger.info(f"Sending Telegram request to: {url}")
-        response = requests.post(url, json=data, timeout=10)
+        app.logger.info(f"Sending Telegram request to: {http_client.url('telegram', telegram_path)}")
+        response = http_client.post('telegram', telegram_path, json=data)
         
         app.logger.info(f"Telegram API response status: {response.status_code}")
         
@@ -1465,7 +1604,10 @@ def api_calculate_price():
         else:
             length = None
             
-        body_type = data.get('body_type', 'any')
+        try:
+            body_type = BodyType(data.get('body_type', 'any'))
+        except ValueError:
+            body_type = BodyType.ANY
         
         try:
             selected_vehicle_id = int(data.get('selected_vehicle_id'))
@@ -1515,7 +1657,7 @@ def api_calculate_price():
         
         # Если выбран конкретный транспорт, используем его
         if selected_vehicle_id:
-            vehicle_db = VehicleDatabase()
+            vehicle_db = get_vehicle_database()
             selected_vehicle = vehicle_db.get_vehicle_by_id(selected_vehicle_id)
             if selected_vehicle:
                 step3_result = CalculatorServiceV2.calculate_step3(step1_result, selected_vehicle, loaders, duration_hours, additional_services_cost)
@@ -1688,15 +1830,21 @@ def api_reload_config():
         # Здесь можно добавить проверку авторизации
         # Пока что просто перезагружаем конфигурацию
         
-        config_manager.reload_config()
+        changed = config_watcher.reload('api', force=True)
         
-        # Проверяем валидность после перезагрузки
-        if not config_manager.validate_config():
+        # Невалидный файл не применяется — продолжает работать текущая версия
+        if config_manager.last_reload_error:
             return jsonify({'error': 'Invalid configuration after reload'}), 500
         
+        # Остальные воркеры подхватят новую версию по pub/sub
+        snapshot = config_manager.snapshot
+        config_watcher.publish(snapshot)
+        
         return jsonify({
             'success': True,
-            'message': 'Configuration reloaded successfully'
+            'message': 'Configuration reloaded successfully',
+            'changed': changed,
+            'version': snapshot.content_hash
         })
         
     except Exception as e:
@@ -1732,8 +1880,7 @@ def api_calculate_loaders_cost():
             return jsonify({'error': 'Duration must be at least 1 hour'}), 400
         
         # Получаем цену за грузчика в час из конфигурации
-        pricing = config_manager.get_pricing()
-        loader_price_per_hour = pricing.get('loader_price_per_hour', 750.0)
+        loader_price_per_hour = config_manager.snapshot.rates.loader_price_per_hour
         
         # Рассчитываем стоимость
         total_cost = loaders * loader_price_per_hour * duration_hours
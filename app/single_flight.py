@@ -0,0 +1,176 @@
+"""Single-flight: объединение одинаковых одновременных запросов к внешним сервисам"""
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from prometheus_client import Counter
+from redis.commands.core import Script
+
+from app import cache
+from app.http_client import upstream_deadline
+
+single_flight_calls = Counter(
+    'single_flight_calls_total',
+    'Single-flight calls by namespace and role (leader, local/remote follower, lease or wait timeout)',
+    ['namespace', 'role']
+)
+
+# Снятие аренды только её владельцем: GET и DEL одним атомарным шагом, иначе
+# между ними аренда может истечь и достаться другому воркеру, а DEL снимет уже её.
+# KEYS[1] — ключ аренды; ARGV[1] — токен лидера. Возвращает 1, если аренда снята.
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# Зарегистрированный скрипт (EVALSHA с автоматической загрузкой при NOSCRIPT)
+_release_script: Optional[Script] = None
+
+
+class _Call:
+    """Выполняющийся в процессе вызов, которого ждут остальные потоки"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Для одного ключа одновременно выполняется только один вызов.
+
+    Внутри процесса потоки ждут лидера на threading.Event. Между воркерами
+    gunicorn лидерство закрепляется арендой в Redis (атомарный SET NX EX, снятие —
+    Lua-скриптом с проверкой токена); остальные воркеры опрашивают ключ результата, который лидер
+    публикует на короткое время. Если Redis недоступен, работает только
+    внутрипроцессное объединение.
+
+    Ожидание ограничено арендой и сроком upstream_deadline текущего запроса:
+    не дождавшись лидера, поток выполняет вызов сам. Результаты, для которых
+    should_publish ложно (резервные и приближённые ответы), другим воркерам
+    не публикуются.
+    """
+
+    def __init__(self, namespace: str, lease_seconds: int = 15, result_ttl: int = 5,
+                 poll_interval: float = 0.05, should_publish: Callable[[Any], bool] = lambda value: True):
+        self.namespace = namespace
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.should_publish = should_publish
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """Выполнить fn(*args, **kwargs) или дождаться результата уже идущего вызова с тем же ключом"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            single_flight_calls.labels(namespace=self.namespace, role='local_follower').inc()
+            if not call.event.wait(self._wait_seconds()):
+                # Лидер не уложился в срок запроса — выполняем сами, не занимая его результат
+                single_flight_calls.labels(namespace=self.namespace, role='wait_timeout').inc()
+                return fn(*args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn, args, kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def _wait_seconds(self) -> float:
+        """Сколько ждать чужой вызов: не дольше аренды и остатка upstream_deadline"""
+        deadline = upstream_deadline.get()
+        if deadline is None:
+            return self.lease_seconds
+        return max(0.0, min(self.lease_seconds, deadline - time.monotonic()))
+
+    def _lock_key(self, key: str) -> str:
+        # Аренда пишется напрямую в Redis (токен без сериализации flask-caching), с префиксом кэша
+        return f"{cache.cache.key_prefix}single_flight:{self.namespace}:{key}:lease"
+
+    def _result_key(self, key: str) -> str:
+        return f"single_flight:{self.namespace}:{key}:result"
+
+    def _do_shared(self, key: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        lock_key = self._lock_key(key)
+        result_key = self._result_key(key)
+        token = uuid.uuid4().hex
+        wait_until = time.monotonic() + self._wait_seconds()
+
+        while True:
+            found, value = self._get_result(result_key)
+            if found:
+                single_flight_calls.labels(namespace=self.namespace, role='remote_follower').inc()
+                return value
+            if self._try_lease(lock_key, token):
+                single_flight_calls.labels(namespace=self.namespace, role='leader').inc()
+                break
+            if time.monotonic() >= wait_until:
+                # Лидер в другом воркере не уложился в аренду или срок запроса — выполняем сами
+                single_flight_calls.labels(namespace=self.namespace, role='lease_timeout').inc()
+                token = None
+                break
+            time.sleep(self.poll_interval)
+
+        try:
+            value = fn(*args, **kwargs)
+            if self.should_publish(value):
+                self._publish(result_key, value)
+            return value
+        finally:
+            if token:
+                self._release(lock_key, token)
+
+    @staticmethod
+    def _redis():
+        # Клиент Redis из flask-caching (RedisCache хранит его в _write_client)
+        return cache.cache._write_client
+
+    def _try_lease(self, lock_key: str, token: str) -> bool:
+        try:
+            return bool(self._redis().set(lock_key, token, nx=True, ex=self.lease_seconds))
+        except Exception:
+            # Redis недоступен — объединяем только внутри процесса
+            return True
+
+    def _get_result(self, result_key: str) -> Tuple[bool, Any]:
+        try:
+            # Результат обёрнут в кортеж, чтобы отличать сохранённый None от отсутствия ключа
+            wrapped = cache.get(result_key)
+        except Exception:
+            return False, None
+        if isinstance(wrapped, tuple) and len(wrapped) == 1:
+            return True, wrapped[0]
+        return False, None
+
+    def _publish(self, result_key: str, value: Any):
+        try:
+            cache.set(result_key, (value,), timeout=self.result_ttl)
+        except Exception:
+            pass
+
+    def _release(self, lock_key: str, token: str):
+        try:
+            global _release_script
+            client = self._redis()
+            if _release_script is None:
+                _release_script = client.register_script(_RELEASE_SCRIPT)
+            _release_script(keys=[lock_key], args=[token], client=client)
+        except Exception:
+            pass
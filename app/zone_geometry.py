@@ -0,0 +1,181 @@
+"""Геометрия зон: подготовленный полигон КАД с пространственным индексом и векторные расчёты расстояний"""
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class KadZoneIndex:
+    """Подготовленный полигон КАД с сеточным индексом для пакетной классификации точек.
+
+    Ограничивающий прямоугольник полигона разбивается на сетку ячеек. Для ячеек,
+    целиком лежащих внутри или снаружи полигона, ответ берётся из таблицы за O(1);
+    точный предикат на подготовленной геометрии вызывается только для ячеек,
+    через которые проходит граница.
+    """
+
+    CELL_OUTSIDE = 0
+    CELL_INSIDE = 1
+    CELL_BOUNDARY = 2
+
+    def __init__(self, polygon: Polygon, grid_size: int = 64):
+        self.polygon = polygon
+        # Подготовка строит внутренний индекс рёбер GEOS, ускоряя contains/intersects
+        shapely.prepare(self.polygon)
+        self.grid_size = grid_size
+        self.min_x, self.min_y, self.max_x, self.max_y = polygon.bounds
+        self._cell_w = (self.max_x - self.min_x) / grid_size or 1e-12
+        self._cell_h = (self.max_y - self.min_y) / grid_size or 1e-12
+        self._cells = self._build_grid()
+
+    def _build_grid(self) -> np.ndarray:
+        """Классификация ячеек сетки: внутри / снаружи / граница"""
+        n = self.grid_size
+        ix, iy = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+        x0 = self.min_x + ix.ravel() * self._cell_w
+        y0 = self.min_y + iy.ravel() * self._cell_h
+        boxes = shapely.box(x0, y0, x0 + self._cell_w, y0 + self._cell_h)
+
+        inside = shapely.contains_properly(self.polygon, boxes)
+        touches = shapely.intersects(self.polygon, boxes)
+
+        cells = np.full(n * n, self.CELL_OUTSIDE, dtype=np.int8)
+        cells[touches] = self.CELL_BOUNDARY
+        cells[inside] = self.CELL_INSIDE
+        return cells.reshape(n, n)
+
+    def classify_points(self, lons: Sequence[float], lats: Sequence[float]) -> np.ndarray:
+        """Пакетная проверка принадлежности точек полигону. Возвращает массив bool."""
+        x = np.asarray(lons, dtype=np.float64)
+        y = np.asarray(lats, dtype=np.float64)
+        result = np.zeros(x.shape, dtype=bool)
+        if x.size == 0:
+            return result
+
+        in_bounds = (x >= self.min_x) & (x <= self.max_x) & (y >= self.min_y) & (y <= self.max_y)
+        if not in_bounds.any():
+            return result
+
+        n = self.grid_size
+        ix = np.clip(((x[in_bounds] - self.min_x) / self._cell_w).astype(np.int64), 0, n - 1)
+        iy = np.clip(((y[in_bounds] - self.min_y) / self._cell_h).astype(np.int64), 0, n - 1)
+        states = self._cells[ix, iy]
+
+        bounded = result[in_bounds]
+        bounded[states == self.CELL_INSIDE] = True
+
+        # Точный предикат только для точек в граничных ячейках
+        boundary = states == self.CELL_BOUNDARY
+        if boundary.any():
+            bx = x[in_bounds][boundary]
+            by = y[in_bounds][boundary]
+            bounded[boundary] = shapely.contains_xy(self.polygon, bx, by)
+
+        result[in_bounds] = bounded
+        return result
+
+    def contains(self, lon: float, lat: float) -> bool:
+        """Проверка одной точки (x=lon, y=lat)"""
+        return bool(self.classify_points([lon], [lat])[0])
+
+
+def build_kad_zone_index(polygon: Optional[Polygon]) -> Optional[KadZoneIndex]:
+    """Построение индекса; None, если полигон отсутствует или пуст"""
+    if polygon is None or polygon.is_empty:
+        return None
+    return KadZoneIndex(polygon)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками по формуле гаверсинуса (км)"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def segment_lengths_km(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """Длины всех сегментов ломаной (км) одним векторным проходом"""
+    lat_rad = np.radians(lats)
+    dlat = np.diff(lat_rad)
+    dlon = np.radians(np.diff(lons))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad[:-1]) * np.cos(lat_rad[1:]) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def route_to_arrays(coordinates: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Список [lon, lat] из OSRM -> два массива (lons, lats)"""
+    arr = np.asarray(coordinates, dtype=np.float64)
+    if arr.ndim != 2 or arr.shape[0] < 2:
+        return np.empty(0), np.empty(0)
+    return arr[:, 0], arr[:, 1]
+
+
+def segment_route(coordinates: Sequence[Sequence[float]], kad_index: KadZoneIndex) -> Tuple[float, float, float]:
+    """Векторная разбивка маршрута по средним точкам сегментов.
+    Возвращает (city_km, outside_km, total_km).
+    """
+    lons, lats = route_to_arrays(coordinates)
+    if lons.size < 2:
+        return 0.0, 0.0, 0.0
+
+    seg_km = segment_lengths_km(lons, lats)
+    inside = kad_index.classify_points((lons[:-1] + lons[1:]) / 2.0, (lats[:-1] + lats[1:]) / 2.0)
+
+    total_km = float(seg_km.sum())
+    city_km = float(seg_km[inside].sum())
+    return city_km, total_km - city_km, total_km
+
+
+def linework_length_km(geometry) -> float:
+    """Геодезическая длина всех линейных частей геометрии (LineString/Multi/Collection), км"""
+    if geometry is None or shapely.is_empty(geometry):
+        return 0.0
+    parts = shapely.get_parts(shapely.get_parts(geometry))
+    lines = parts[shapely.get_type_id(parts) == 1]  # 1 = LineString; точки касания отбрасываем
+    if lines.size == 0:
+        return 0.0
+    coords, part_index = shapely.get_coordinates(lines, return_index=True)
+    seg_km = segment_lengths_km(coords[:, 0], coords[:, 1])
+    # Сегменты между концом одной части и началом следующей не считаем
+    same_part = part_index[1:] == part_index[:-1]
+    return float(seg_km[same_part].sum())
+
+
+def segment_route_exact(coordinates: Sequence[Sequence[float]], kad_index: KadZoneIndex,
+                        road_distance_km: Optional[float] = None) -> Tuple[float, float, float]:
+    """Точная разбивка маршрута: пересечение LineString с полигоном КАД.
+
+    Части маршрута внутри и снаружи полигона измеряются геодезически, поэтому
+    длинные сегменты, пересекающие КАД, делятся по точке пересечения, а не
+    целиком относятся к зоне своей средней точки. Если известна дорожная
+    длина маршрута (OSRM distance), доли зон масштабируются на неё — это
+    позволяет запрашивать упрощённую геометрию без потери точности итога.
+    Возвращает (city_km, outside_km, total_km).
+    """
+    lons, lats = route_to_arrays(coordinates)
+    if lons.size < 2:
+        return 0.0, 0.0, 0.0
+
+    total_km = float(segment_lengths_km(lons, lats).sum())
+    polygon = kad_index.polygon
+    line = shapely.linestrings(lons, lats)
+
+    # Быстрые проверки на подготовленной геометрии
+    if not shapely.intersects(polygon, line):
+        city_km = 0.0
+    elif shapely.contains_properly(polygon, line):
+        city_km = total_km
+    else:
+        city_km = min(linework_length_km(shapely.intersection(line, polygon)), total_km)
+
+    if road_distance_km and total_km > 0:
+        scale = road_distance_km / total_km
+        city_km *= scale
+        total_km = road_distance_km
+
+    return city_km, total_km - city_km, total_km
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк эндпоинтов калькулятора: пропускная способность и перцентили задержки.
+
+Рассчитан на запуск против приложения, направленного на стенд upstream_stub
+(NOMINATIM_BASE_URL / OSRM_BASE_URL), чтобы результаты не зависели от сети
+и лимитов публичных сервисов:
+
+    python upstream_stub/server.py --port 5055 &
+    NOMINATIM_BASE_URL=http://localhost:5055/nominatim \\
+    OSRM_BASE_URL=http://localhost:5055/osrm flask run &
+    python benchmarks/benchmark_calculator_endpoints.py --base-url http://localhost:5000
+
+Каждый запрос уходит с собственным X-Forwarded-For, чтобы ограничение частоты
+запросов по клиенту не искажало замер. Длительности берутся в пределах
+calculator_limits из config/calculator_config.json; любой ответ кроме 2xx и 429
+проваливает прогон (код выхода 1), чтобы быстрые 400 не завышали rps.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+ADDRESSES = [
+    'Невский проспект, 1, Санкт-Петербург',
+    'Московский проспект, 220, Санкт-Петербург',
+    'Пулково, Санкт-Петербург',
+    'Кронштадт',
+    'Гатчина',
+    'Всеволожск',
+    'Лиговский проспект, 30, Санкт-Петербург',
+    'Комендантский проспект, 9, Санкт-Петербург',
+]
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'calculator_config.json')
+
+ENDPOINTS = {
+    'step1': '/api/v2/calculator/step1',
+    'zone-analysis': '/api/v2/calculator/zone-analysis',
+    'calculate-price': '/api/v2/calculate-price',
+}
+
+
+def valid_durations(config_path: str = CONFIG_PATH) -> list:
+    """Типичные длительности заказа, допустимые по calculator_limits"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        limits = json.load(f)['calculator_limits']
+    low, high = limits['min_duration_hours'], limits['max_duration_hours']
+    return [hours for hours in (2, 3, 4, 8, 12) if low <= hours <= high] or [low]
+
+
+def make_payload(rng: random.Random, durations: list) -> dict:
+    """Случайная пара адресов из небольшого набора (повторы прогревают кэши, как в проде)"""
+    from_address, to_address = rng.sample(ADDRESSES, 2)
+    pickup_time = (datetime.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    return {
+        'from_address': from_address,
+        'to_address': to_address,
+        'pickup_time': pickup_time.isoformat(),
+        'duration_hours': rng.choice(durations),
+        'urgent_pickup': rng.random() < 0.2,
+    }
+
+
+def unexpected_statuses(statuses: dict) -> dict:
+    """Ответы, которых в корректном прогоне быть не должно (всё, кроме 2xx и 429)"""
+    return {status: count for status, count in statuses.items()
+            if not (isinstance(status, int) and (200 <= status < 300 or status == 429))}
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_endpoint(base_url: str, path: str, total: int, concurrency: int, seed: int, durations: list) -> dict:
+    """Прогон одного эндпоинта: total запросов в concurrency потоков"""
+    rng = random.Random(seed)
+    payloads = [make_payload(rng, durations) for _ in range(total)]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def call(index: int):
+        headers = {'X-Forwarded-For': f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}'}
+        start = time.perf_counter()
+        try:
+            resp = session.post(base_url + path, json=payloads[index], headers=headers, timeout=30)
+            status = resp.status_code
+        except requests.exceptions.RequestException:
+            status = 'error'
+        return time.perf_counter() - start, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, status in results if isinstance(status, int) and 200 <= status < 300)
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'rps': total / elapsed,
+        'ok': len(latencies),
+        'statuses': statuses,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк эндпоинтов калькулятора')
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--requests', type=int, default=200, help='запросов на эндпоинт')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument('--config', default=CONFIG_PATH, help='конфигурация с calculator_limits')
+    args = parser.parse_args()
+    durations = valid_durations(args.config)
+
+    print(f"Бенчмарк {args.base_url}: {args.requests} запросов, {args.concurrency} потоков, "
+          f"длительности {durations}\n")
+    print(f"{'эндпоинт':<16} {'rps':>8} {'ok':>6} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9}  статусы")
+    print('-' * 80)
+    failures = {}
+    for name in args.endpoints:
+        stats = run_endpoint(args.base_url, ENDPOINTS[name], args.requests, args.concurrency, args.seed, durations)
+        print(f"{name:<16} {stats['rps']:>8.1f} {stats['ok']:>6} "
+              f"{stats['p50'] * 1000:>9.1f} {stats['p95'] * 1000:>9.1f} {stats['p99'] * 1000:>9.1f}  "
+              f"{stats['statuses']}")
+        unexpected = unexpected_statuses(stats['statuses'])
+        if unexpected:
+            failures[name] = unexpected
+
+    if failures:
+        print(f"\n❌ Неожиданные ответы (не 2xx и не 429), замер недостоверен: {failures}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
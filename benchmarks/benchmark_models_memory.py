@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти и аллокаций моделей калькулятора (tracemalloc):
+прежние dataclass с __dict__ против slots/frozen и готовых JSON-фрагментов транспорта
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import BodyType, RouteRequest, TimeRequest, VehicleRequest, get_vehicle_database, vehicles_json
+
+INSTANCES = 100_000
+RESPONSES = 2_000
+
+
+@dataclass
+class LegacyRouteRequest:
+    from_address: str
+    to_address: str
+    distance: Optional[float] = None
+
+
+@dataclass
+class LegacyTimeRequest:
+    pickup_time: str
+    duration_hours: int
+    urgent_pickup: bool = False
+
+
+@dataclass
+class LegacyVehicleRequest:
+    passengers: int
+    loaders: int
+    height: Optional[float] = None
+    length: Optional[float] = None
+    body_type: BodyType = BodyType.ANY
+
+
+def legacy_vehicle_dict(vehicle) -> Dict[str, Any]:
+    """Прежний Vehicle.to_dict: новый словарь из 15 ключей на каждый вызов"""
+    return {
+        'id': vehicle.id,
+        'name': vehicle.name,
+        'type': vehicle.type.value,
+        'body_type': vehicle.body_type.value,
+        'price_per_hour': vehicle.price_per_hour,
+        'price_per_km': vehicle.price_per_km,
+        'base_price': vehicle.base_price,
+        'max_passengers': vehicle.max_passengers,
+        'max_loaders': vehicle.max_loaders,
+        'dimensions': vehicle.dimensions,
+        'capacity': vehicle.capacity,
+        'image_url': vehicle.image_url,
+        'description': vehicle.description,
+        'is_available': vehicle.is_available,
+        'min_base_duration_hours': vehicle.min_base_duration_hours
+    }
+
+
+def measure(build):
+    """Время, удерживаемая память и пик аллокаций при вызове build()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, current, peak
+
+
+def build_requests(route_cls, time_cls, vehicle_cls):
+    def build():
+        return [
+            (route_cls('Невский проспект, 1', 'Пулково', 18.5),
+             time_cls('2025-01-01T10:00:00', 2, False),
+             vehicle_cls(2, 1, 1.8, 3.0, BodyType.VAN))
+            for _ in range(INSTANCES)
+        ]
+    return build
+
+
+def main():
+    vehicles = get_vehicle_database().get_all_vehicles()
+
+    print(f"Запросы калькулятора: {INSTANCES:,} троек RouteRequest/TimeRequest/VehicleRequest\n")
+    print(f"{'вариант':<22} {'время, мс':>10} {'байт/тройку':>12} {'пик, МБ':>9}")
+    print('-' * 56)
+    for name, classes in (('dataclass (__dict__)', (LegacyRouteRequest, LegacyTimeRequest, LegacyVehicleRequest)),
+                          ('slots + frozen', (RouteRequest, TimeRequest, VehicleRequest))):
+        elapsed, current, peak = measure(build_requests(*classes))
+        print(f"{name:<22} {elapsed * 1000:>10.1f} {current / INSTANCES:>12.0f} {peak / 2 ** 20:>9.1f}")
+
+    def legacy_responses():
+        for _ in range(RESPONSES):
+            body = json.dumps([legacy_vehicle_dict(v) for v in vehicles], ensure_ascii=False)
+        return body
+
+    def fragment_responses():
+        for _ in range(RESPONSES):
+            body = vehicles_json(vehicles)
+        return body
+
+    print(f"\nСериализация step2: {RESPONSES:,} ответов по {len(vehicles)} ТС\n")
+    print(f"{'вариант':<22} {'время, мс':>10} {'мкс/ответ':>12} {'пик, КБ':>9}")
+    print('-' * 56)
+    for name, build in (('to_dict + json.dumps', legacy_responses), ('JSON-фрагменты', fragment_responses)):
+        elapsed, _, peak = measure(build)
+        print(f"{name:<22} {elapsed * 1000:>10.1f} {elapsed / RESPONSES * 1e6:>12.1f} {peak / 1024:>9.1f}")
+
+    legacy = json.loads(json.dumps([legacy_vehicle_dict(v) for v in vehicles], ensure_ascii=False))
+    assert json.loads(vehicles_json(vehicles)) == legacy, 'JSON-фрагменты расходятся с to_dict'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк ядра расчёта цены (app/pricing_kernel.py): котировок в секунду на одном ядре
+для прежнего пути через сервис калькулятора, скалярного quote() и векторного quote_many()
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from app.calculator import CalculatorServiceV2, ZoneDistanceService
+from app.models import get_vehicle_database
+from app.pricing_kernel import get_pricing_kernel
+
+
+def make_inputs(count: int, vehicle_ids, seed: int = 42):
+    """Случайные заявки: км по городу/за КАД, КАД, длительность, срочность, транспорт, грузчики"""
+    rng = np.random.default_rng(seed)
+    return {
+        'city_km': np.round(rng.uniform(0, 60, count), 2),
+        'outside_km': np.round(rng.exponential(25, count), 2),
+        'kad_toll': rng.random(count) < 0.4,
+        'duration_hours': rng.integers(2, 13, count),
+        'urgent': rng.random(count) < 0.2,
+        'vehicle_id': rng.choice(np.asarray(vehicle_ids), count),
+        'loaders': rng.integers(0, 4, count),
+    }
+
+
+def service_quotes(inputs, count: int):
+    """Прежний путь: calculate_route_price_with_zones + calculate_step3 в контексте приложения"""
+    vehicle_db = get_vehicle_database()
+    with app.app_context():
+        for i in range(count):
+            route_analysis = {
+                'city_distance': float(inputs['city_km'][i]),
+                'outside_distance': float(inputs['outside_km'][i]),
+                'kad_toll_applied': bool(inputs['kad_toll'][i]),
+            }
+            hours = int(inputs['duration_hours'][i])
+            step1 = ZoneDistanceService.calculate_route_price_with_zones(route_analysis, hours, bool(inputs['urgent'][i]))
+            CalculatorServiceV2.calculate_step3(step1, vehicle_db.get_vehicle_by_id(int(inputs['vehicle_id'][i])),
+                                                int(inputs['loaders'][i]), hours)
+
+
+def scalar_quotes(kernel, rows):
+    quote = kernel.quote
+    for row in rows:
+        quote(*row)
+
+
+def vector_quotes(kernel, inputs):
+    kernel.quote_many(inputs['city_km'], inputs['outside_km'], inputs['kad_toll'], inputs['duration_hours'],
+                      inputs['urgent'], kernel.vehicle_index(inputs['vehicle_id'].tolist()), inputs['loaders'])
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк ядра расчёта цены')
+    parser.add_argument('--quotes', type=int, default=1_000_000, help='котировок для ядра')
+    parser.add_argument('--service-quotes', type=int, default=20_000, help='котировок для прежнего пути')
+    args = parser.parse_args()
+
+    kernel = get_pricing_kernel()
+    inputs = make_inputs(args.quotes, kernel.vehicle_ids)
+    rows = list(zip(inputs['city_km'].tolist(), inputs['outside_km'].tolist(), inputs['kad_toll'].tolist(),
+                    inputs['duration_hours'].tolist(), inputs['urgent'].tolist(), inputs['vehicle_id'].tolist(),
+                    inputs['loaders'].tolist()))
+
+    results = [
+        ('сервис (шаги 1 + 3)', args.service_quotes, timed(service_quotes, inputs, args.service_quotes)),
+        ('kernel.quote()', args.quotes, timed(scalar_quotes, kernel, rows)),
+        ('kernel.quote_many()', args.quotes, timed(vector_quotes, kernel, inputs)),
+    ]
+
+    print(f"{'вариант':<22} {'котировок':>10} {'время, с':>9} {'котировок/с':>13}")
+    print('-' * 58)
+    for name, count, elapsed in results:
+        print(f"{name:<22} {count:>10,} {elapsed:>9.3f} {count / elapsed:>13,.0f}")
+
+
+if __name__ == '__main__':
+    main()
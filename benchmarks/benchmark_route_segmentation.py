@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк разбивки маршрута по зонам: прежний цикл по сегментам против векторного расчёта
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from shapely.geometry import Point, shape
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.zone_geometry import build_kad_zone_index, segment_route
+
+ROUTE_SIZES = [100, 1_000, 10_000]
+REPEATS = 5
+
+
+def load_kad_polygon():
+    """Загрузка полигона КАД из config/kad_polygon.geojson"""
+    geojson_path = Path(__file__).parent.parent / 'config' / 'kad_polygon.geojson'
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return shape(data['features'][0]['geometry'])
+
+
+def make_route(points: int, seed: int = 42):
+    """Синтетический маршрут из центра города за КАД (список [lon, lat], как у OSRM)"""
+    rng = np.random.default_rng(seed)
+    lons = np.linspace(30.3609, 30.75, points) + rng.normal(0, 0.0005, points)
+    lats = np.linspace(59.9311, 60.15, points) + rng.normal(0, 0.0005, points)
+    return np.column_stack([lons, lats]).tolist()
+
+
+def legacy_segment_route(coordinates, polygon):
+    """Прежняя реализация: цикл Python, math и Point на каждый сегмент"""
+    def haversine_km(lat1, lon1, lat2, lon2):
+        R = 6371.0
+        dlat = math.radians(lat2 - lat1)
+        dlon = math.radians(lon2 - lon1)
+        a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        return R * c
+
+    city_km = 0.0
+    outside_km = 0.0
+    total_km = 0.0
+    for i in range(len(coordinates) - 1):
+        lon1, lat1 = coordinates[i]
+        lon2, lat2 = coordinates[i + 1]
+        seg_km = haversine_km(lat1, lon1, lat2, lon2)
+        total_km += seg_km
+        if polygon.contains(Point((lon1 + lon2) / 2.0, (lat1 + lat2) / 2.0)):
+            city_km += seg_km
+        else:
+            outside_km += seg_km
+    return city_km, outside_km, total_km
+
+
+def best_of(func, *args):
+    """Лучшее время из REPEATS запусков (секунды) и результат"""
+    best = float('inf')
+    result = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    """Запуск бенчмарка"""
+    print("🛣️ Бенчмарк разбивки маршрута по зонам")
+    print("=" * 60)
+
+    legacy_polygon = load_kad_polygon()
+    kad_index = build_kad_zone_index(load_kad_polygon())
+
+    print(f"{'Точек':>8} | {'Цикл, мс':>10} | {'Вектор, мс':>10} | {'Ускорение':>9} | Совпадение")
+    for points in ROUTE_SIZES:
+        route = make_route(points)
+        legacy_time, legacy_result = best_of(legacy_segment_route, route, legacy_polygon)
+        vector_time, vector_result = best_of(segment_route, route, kad_index)
+        same = all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) for a, b in zip(legacy_result, vector_result))
+        print(f"{points:>8} | {legacy_time * 1000:>10.2f} | {vector_time * 1000:>10.2f} | "
+              f"{legacy_time / vector_time:>8.1f}x | {'✅' if same else '❌'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки статистики кэшей калькулятора: оценка числа
+ключей (HyperLogLog) по версиям конфигурации, счётчики обращений и поведение
+/api/v2/cache/stats при недоступном Redis.
+
+Redis заменяется на fakeredis.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+import app.routes  # noqa: F401 — регистрация эндпоинтов
+from app import app as flask_app, cache
+from app.cache_keys import CacheNamespace, cache_namespaces
+from app.result_cache import StaleWhileRevalidateCache
+
+
+@pytest.fixture
+def namespace(monkeypatch):
+    """Пространство имён теста на чистом fakeredis (удаляется из реестра после теста)"""
+    redis = fakeredis.FakeStrictRedis()
+    with flask_app.app_context():
+        monkeypatch.setattr(cache.cache, '_write_client', redis)
+        monkeypatch.setattr(cache.cache, '_read_client', redis)
+        keys = CacheNamespace('test_stats', fields=('address',), config_sections=('zone_detection',),
+                              ttl_seconds=600)
+        yield keys
+        cache_namespaces.pop('test_stats', None)
+
+
+def test_key_cardinality_by_version(namespace):
+    """Записанные ключи считаются по версиям; повторная запись ключа не увеличивает оценку"""
+    store = StaleWhileRevalidateCache(namespace)
+    computed = [store.get_or_compute(namespace.key(address=f"адрес {i}"), lambda: {'km': 1}) for i in range(20)]
+    assert len(computed) == 20
+    store._store(namespace.key(address="адрес 0"), {'km': 2})
+    namespace.track_key(f"calc:test_stats:oldversion:{'0' * 16}")
+
+    stats = namespace.stats()
+    assert stats['keys'] == 21
+    assert stats['keys_by_config_version'] == {namespace.config_version(): 20, 'oldversion': 1}
+    assert stats['requests'] == {'miss': 20}
+    assert stats['hit_ratio'] == 0.0
+
+    store.get_or_compute(namespace.key(address="адрес 1"), lambda: pytest.fail('должно быть попадание'))
+    assert namespace.stats()['requests'] == {'miss': 20, 'hit': 1}
+    print(f"✅ Оценка ключей: {stats['keys_by_config_version']}")
+
+
+def test_stats_endpoint_survives_redis_outage(namespace, monkeypatch):
+    """Без Redis эндпоинт отдаёт пустую статистику, а не 500"""
+    namespace.record('hit')
+    monkeypatch.setenv('FLASK_DEBUG', 'TRUE')
+
+    class Down:
+        def __getattr__(self, name):
+            raise ConnectionError('redis down')
+
+    monkeypatch.setattr(cache.cache, '_write_client', Down())
+    response = flask_app.test_client().get('/api/v2/cache/stats?namespace=test_stats')
+    assert response.status_code == 200, response.get_json()
+    stats = response.get_json()['data']['test_stats']
+    assert stats['keys'] is None and stats['keys_by_config_version'] == {}
+    assert stats['requests'] == {'hit': 1}   # локальные счётчики воркера не потеряны
+    print("✅ Redis недоступен: пустая статистика вместо 500")
+
+
+def main():
+    """Основная функция тестирования"""
+    sys.exit(pytest.main([__file__, '-q']))
+
+
+if __name__ == "__main__":
+    main()
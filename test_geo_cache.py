@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки нормализации адресов и дискового кэша геокодирования
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.geo_cache import ACCESS_TIME_RESOLUTION, GeocodeCache, normalize_address
+
+
+def test_normalize_address():
+    """Разные написания одного адреса дают один ключ"""
+    print("=== Тестирование normalize_address ===")
+
+    same_key = [
+        ("Невский проспект, 1, Санкт-Петербург", "невский проспект 1 спб"),
+        ("  НЕВСКИЙ   проспект 1,  СПб ", "невский проспект 1 спб"),
+        ("Невский проспект 1, г. Санкт Петербург", "невский проспект 1 спб"),
+        ("Невский проспект 1, С.-Петербург", "невский проспект 1 спб"),
+        ("СПб, Невский проспект 1, Санкт-Петербург", "спб невский проспект 1"),
+        ("Пр. Просвещения, 33 «А»", "пр просвещения 33 а"),
+        ("Улица Савушкина, д. 12 (ёлки)", "улица савушкина д 12 елки"),
+        ("", ""),
+    ]
+    for address, expected in same_key:
+        key = normalize_address(address)
+        status = "✅" if key == expected else "❌"
+        print(f"{status} {address!r} -> {key!r}")
+        assert key == expected
+
+    # Цифры и названия улиц не теряются
+    assert normalize_address("Садовая 10") != normalize_address("Садовая 1")
+    assert normalize_address("Спасский переулок") != normalize_address("переулок")
+
+
+def test_disk_access_times_batched():
+    """Попадание в дисковый кэш не пишет last_access сразу, а копит его до пачки"""
+    print("\n=== Тестирование отложенного last_access ===")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        geo = GeocodeCache(db_path=os.path.join(tmp, 'geocode.sqlite3'), max_entries=10)
+        geo._disk_set('a', {'lat': 59.9, 'lng': 30.3})
+        conn = geo._get_connection()
+        conn.execute('UPDATE geocode SET last_access = ?', (1000.0,))
+        conn.commit()
+
+        assert geo._disk_get('a') == {'lat': 59.9, 'lng': 30.3}
+        assert 'a' in geo._pending_access
+        assert conn.execute('SELECT last_access FROM geocode').fetchone()[0] == 1000.0
+
+        geo._flush_access_times(conn)
+        conn.commit()
+        touched = conn.execute('SELECT last_access FROM geocode').fetchone()[0]
+        assert touched > 1000.0 + ACCESS_TIME_RESOLUTION
+        assert not geo._pending_access
+
+        # Свежее обращение не ставится в очередь повторно
+        assert geo._disk_get('a') is not None
+        assert not geo._pending_access
+        print("✅ last_access пишется пачкой")
+
+
+def main():
+    """Основная функция тестирования"""
+    print("🗺️ Тестирование кэша геокодирования")
+    print("=" * 50)
+
+    try:
+        test_normalize_address()
+        test_disk_access_times_batched()
+
+        print("\n✅ Все тесты завершены!")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки ядра расчёта цены: скалярные и векторные
+расчёты сравниваются с прежними формулами шагов 1 и 3
+"""
+
+import copy
+import os
+import random
+import sys
+from dataclasses import replace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.config_manager import config_manager
+from app.models import get_vehicle_database
+from app.pricing_kernel import PricingKernel, VehicleRates
+
+
+def baseline_route_total(pricing, city_km, outside_km, kad_toll, hours, urgent):
+    """Шаг 1 до ядра: calculate_route_price_with_zones"""
+    base_total_cost = (city_km * pricing['city_cost_per_km']
+                       + outside_km * pricing['outside_cost_per_km']
+                       + hours * pricing['duration_cost_per_hour']
+                       + (pricing['kad_toll_cost'] if kad_toll else 0))
+    return round(base_total_cost * (pricing['urgent_pickup_multiplier'] if urgent else 1.0))
+
+
+def baseline_final_total(pricing, route_total, vehicle, loaders, hours, additional=0.0):
+    """Шаг 3 до ядра: calculate_step3"""
+    vehicle_cost = 0
+    if vehicle:
+        extra_hours = max(0, hours - vehicle.min_base_duration_hours)
+        vehicle_cost = vehicle.base_price + vehicle.price_per_hour * extra_hours
+    loaders_cost = loaders * pricing['loader_price_per_hour'] * hours
+    return route_total + vehicle_cost + loaders_cost + additional
+
+
+def random_orders(count, vehicle_ids, seed=22):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield (round(rng.uniform(0, 60), 2), round(rng.expovariate(1 / 25), 2), rng.random() < 0.4,
+               rng.randint(1, 24), rng.random() < 0.2, rng.choice(vehicle_ids), rng.randint(0, 4),
+               rng.choice([0.0, 500.0]))
+
+
+def test_kernel_matches_baseline_formulas():
+    """route_breakdown, final_breakdown, quote и quote_many совпадают с прежними формулами"""
+    print("=== Тестирование PricingKernel ===")
+
+    config = config_manager.get_config()
+    pricing = config['pricing']
+    kernel = PricingKernel.from_config(config)
+    vehicles = get_vehicle_database()
+    orders = list(random_orders(2000, [int(v) for v in kernel.vehicle_ids]))
+
+    for city_km, outside_km, kad_toll, hours, urgent, vehicle_id, loaders, additional in orders:
+        vehicle = vehicles.get_vehicle_by_id(vehicle_id)
+        route_total = baseline_route_total(pricing, city_km, outside_km, kad_toll, hours, urgent)
+        expected = baseline_final_total(pricing, route_total, vehicle, loaders, hours, additional)
+
+        step1 = kernel.route_breakdown(city_km, outside_km, kad_toll, hours, urgent)
+        assert step1['total'] == route_total
+        step3 = kernel.final_breakdown(step1['total'], vehicle, loaders, hours, additional)
+        assert abs(step3['total'] - expected) < 1e-6
+        assert abs(kernel.quote(city_km, outside_km, kad_toll, hours, urgent, vehicle_id, loaders, additional)
+                   - expected) < 1e-6
+
+    columns = list(zip(*orders))
+    totals = kernel.quote_many(*columns[:5], kernel.vehicle_index(columns[5]), np.array(columns[6]),
+                               np.array(columns[7]))
+    expected = [
+        baseline_final_total(pricing, baseline_route_total(pricing, *order[:5]),
+                             vehicles.get_vehicle_by_id(order[5]), order[6], order[3], order[7])
+        for order in orders
+    ]
+    assert np.allclose(totals, expected, rtol=0, atol=1e-6)
+    assert kernel.final_breakdown(1000, None, 0, 3)['total'] == 1000
+    print(f"✅ {len(orders)} заявок: скалярный и векторный расчёт совпадают с формулами шагов 1 и 3")
+
+
+def test_selected_vehicle_prices_used():
+    """Шаг 3 и матрица считают по ставкам переданного транспорта, а не по таблице ядра"""
+    kernel = PricingKernel.from_config(config_manager.get_config())
+    vehicle = get_vehicle_database().get_all_vehicles()[0]
+    repriced = replace(vehicle, base_price=vehicle.base_price + 1000, price_per_hour=vehicle.price_per_hour * 2)
+
+    hours = vehicle.min_base_duration_hours + 2
+    breakdown = kernel.final_breakdown(0, repriced, 0, hours)
+    assert breakdown['vehicle_cost'] == repriced.base_price + repriced.price_per_hour * 2
+
+    rates = VehicleRates.from_vehicles([repriced])
+    totals = kernel.quote_many(0.0, 0.0, False, hours, False, 0, 0, rates=rates)
+    assert float(totals) == kernel.route_breakdown(0.0, 0.0, False, hours, False)['total'] + breakdown['vehicle_cost']
+    print("✅ Ставки выбранного транспорта")
+
+
+def test_malformed_vehicles_skipped():
+    """Запись транспорта без цены пропускается, как в VehicleDatabase, а не ломает ядро"""
+    config = copy.deepcopy(config_manager.get_config())
+    broken = config['vehicles'][0]
+    del broken['base_price']
+    kernel = PricingKernel.from_config(config)
+    assert broken['id'] not in kernel.vehicles
+    assert len(kernel.vehicle_ids) == len(config['vehicles']) - 1
+    assert len(kernel.rates.base_prices) == len(kernel.vehicle_ids)
+    print("✅ Некорректная запись транспорта пропущена")
+
+
+def main():
+    """Основная функция тестирования"""
+    print("💰 Тестирование ядра расчёта цены")
+    print("=" * 50)
+
+    try:
+        test_kernel_matches_baseline_formulas()
+        test_selected_vehicle_prices_used()
+        test_malformed_vehicles_skipped()
+
+        print("\n✅ Все тесты завершены!")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
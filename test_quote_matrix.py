@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки валидации /api/v2/calculator/quote-matrix:
+некорректные оси отклоняются с 400 до анализа маршрута.
+
+Анализ маршрута подменяется фиксированным ответом, Redis — fakeredis.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from app import app, cache
+from app.calculator import ZoneDistanceService
+from app.config_manager import config_manager
+
+ROUTE_ANALYSIS = {
+    'total_distance': 20.0,
+    'city_distance': 12.0,
+    'outside_distance': 8.0,
+    'from_zone': 'city',
+    'to_zone': 'outside',
+    'route_type': 'mixed',
+    'kad_toll_applied': True
+}
+
+
+@pytest.fixture
+def analyze_calls(monkeypatch):
+    """Клиент Flask с fakeredis и подменённым анализом маршрута; возвращает журнал вызовов анализа"""
+    calls = []
+
+    def fake_analysis(from_address, to_address):
+        calls.append((from_address, to_address))
+        return dict(ROUTE_ANALYSIS)
+
+    with app.app_context():
+        monkeypatch.setattr(cache.cache, '_write_client', fakeredis.FakeStrictRedis())
+        monkeypatch.setattr(ZoneDistanceService, 'get_distance_with_zones', staticmethod(fake_analysis))
+        yield calls
+
+
+def post_matrix(**fields):
+    payload = {'from_address': 'Невский проспект, 1', 'to_address': 'Пушкин', 'vehicle_ids': [1]}
+    payload.update(fields)
+    return app.test_client().post('/api/v2/calculator/quote-matrix', json=payload)
+
+
+def test_valid_matrix(analyze_calls):
+    """Корректный запрос считает матрицу по всем осям за один анализ маршрута"""
+    limits = config_manager.snapshot.calculator_limits
+    durations = [limits['min_duration_hours'], limits['min_duration_hours'] + 1]
+    response = post_matrix(duration_hours=durations, loaders=[0, 1], urgent_pickup=[False, True])
+    assert response.status_code == 200, response.get_json()
+    axes = response.get_json()['data']['axes']
+    assert axes == {'urgent_pickup': [False, True], 'duration_hours': durations,
+                    'vehicle_ids': [1], 'loaders': [0, 1]}
+    assert len(analyze_calls) == 1
+    print("✅ Корректная матрица 2×2×1×2")
+
+
+@pytest.mark.parametrize('fields', [
+    {'duration_hours': []},
+    {'loaders': []},
+    {'urgent_pickup': []},
+    {'urgent_pickup': 'false'},
+    {'urgent_pickup': [False, 1]},
+    {'duration_hours': [3, 2.7]},
+    {'duration_hours': True},
+    {'duration_hours': '3.5'},
+    {'loaders': [1.5]},
+    {'loaders': [False]},
+    {'loaders': [-1]},
+    {'duration_hours': [0]},
+    {'duration_hours': [3, 1000]},
+    {'vehicle_ids': [1.9]},
+    {'vehicle_ids': [True]},
+    {'vehicle_ids': 'первый'},
+    {'additional_services_cost': 'NaN'},
+    {'additional_services_cost': 'Infinity'},
+    {'additional_services_cost': -100},
+    {'additional_services_cost': float('nan')},
+    {'additional_services_cost': 'x'},
+])
+def test_invalid_axes_rejected_before_analysis(analyze_calls, fields):
+    """Пустые оси, не-bool срочность, дробные и вне лимитов значения, некорректная стоимость услуг — 400 без анализа маршрута"""
+    response = post_matrix(**fields)
+    assert response.status_code == 400, (fields, response.get_json())
+    assert not analyze_calls
+    print(f"✅ {fields} -> 400: {response.get_json()['error']}")
+
+
+def test_integer_values_accepted(analyze_calls):
+    """Целые в виде 3.0 и "3" принимаются и сводятся к одному значению оси"""
+    duration = config_manager.snapshot.calculator_limits['min_duration_hours'] + 1
+    response = post_matrix(duration_hours=[duration, float(duration), str(duration)], loaders='2')
+    assert response.status_code == 200, response.get_json()
+    axes = response.get_json()['data']['axes']
+    assert axes['duration_hours'] == [duration] and axes['loaders'] == [2]
+
+
+def main():
+    """Основная функция тестирования"""
+    sys.exit(pytest.main([__file__, '-q']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки ограничения частоты запросов: скользящее окно
+в Redis (Lua-скрипт), общие бюджеты групп со стоимостью запросов и проверка
+секции rate_limits конфигурации.
+
+Redis заменяется на fakeredis (Lua выполняется через lupa).
+"""
+
+import copy
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from app import app, cache
+from app import rate_limiter
+from app.config_manager import ConfigManager, config_manager
+from app.rate_limiter import LocalRateTier, RateLimitBucket, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Чистый fakeredis вместо Redis и отключённый локальный уровень (все решения — в Lua)"""
+    redis = fakeredis.FakeStrictRedis()
+    with app.app_context():
+        monkeypatch.setattr(cache.cache, '_write_client', redis)
+        monkeypatch.setattr(rate_limiter, '_local_tier', LocalRateTier(local_fraction=0, sync_interval=1.0))
+        yield redis
+
+
+def test_sliding_window_limit():
+    """Окно пропускает max_requests запросов, затем отказывает до освобождения слота"""
+    limiter = RateLimiter(max_requests=3, window_seconds=60, name='test_window')
+
+    decisions = [limiter.check('client') for _ in range(4)]
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions] == [2, 1, 0, 0]
+    assert decisions[-1].limit == 3
+    assert 0 < decisions[-1].reset_after <= 60
+    assert decisions[-1].retry_after >= 1
+
+    # Окна клиентов независимы, отказ не занимает слот
+    assert limiter.check('other').allowed
+    assert limiter.peek('client').remaining == 0
+    print("✅ Скользящее окно: 3 из 4 запросов пропущены")
+
+
+def test_group_budget_with_costs():
+    """Запросы разных эндпоинтов списывают стоимость из общего бюджета группы"""
+    group = RateLimitBucket('group:upstream', max_units=10, window_seconds=60)
+    expensive = RateLimiter(max_requests=100, window_seconds=60, name='test_expensive', groups=((group, 4),))
+    cheap = RateLimiter(max_requests=100, window_seconds=60, name='test_cheap', groups=((group, 1),))
+
+    first = expensive.check('client')
+    assert first.allowed
+    assert first.limit == 10 // 4           # ограничивает самое узкое окно в запросах
+    assert first.remaining == (10 - 4) // 4
+    assert expensive.check('client').allowed      # 8 единиц из 10
+    assert not expensive.check('client').allowed  # 12 > 10: отказ бюджетом группы
+
+    # Отказ ничего не записал: в группе осталось ровно 2 единицы
+    assert [cheap.check('client').allowed for _ in range(3)] == [True, True, False]
+    # Собственное окно эндпоинта не тронуто отказами группы
+    assert expensive.peek('client').remaining == 100 - 2
+    print("✅ Бюджет группы: стоимость 4 и 1 из общего бюджета 10")
+
+
+def test_local_tier_spends_share_of_remaining(fake_redis, monkeypatch):
+    """Локальный уровень пропускает долю остатка без Redis и дописывает её при синхронизации"""
+    monkeypatch.setattr(rate_limiter, '_local_tier', LocalRateTier(local_fraction=0.5, sync_interval=60.0))
+    limiter = RateLimiter(max_requests=10, window_seconds=60, name='test_local')
+    key = limiter._get_client_key('client')
+
+    assert limiter.check('client').allowed          # синхронизация: в окне 1 из 10
+    for _ in range(4):                              # локальный бюджет: (10 - 1) * 0.5 = 4
+        assert limiter.check('client').allowed
+    assert fake_redis.zcard(key) == 1
+    assert rate_limiter._local_tier.pending(key) == 4
+
+    assert limiter.check('client').allowed          # бюджет исчерпан — проверка в Redis
+    assert fake_redis.zcard(key) == 6
+    assert rate_limiter._local_tier.pending(key) == 0
+
+
+def test_rate_limit_costs_validated():
+    """Нулевая, отрицательная или дробная стоимость и нулевые лимиты отклоняют конфигурацию"""
+    config = copy.deepcopy(config_manager.get_config())
+    config['rate_limits'] = {
+        'endpoints': {'api_step1_v2': {'max_requests': 30, 'window_seconds': 60}},
+        'groups': {'upstream': {'max_units': 100, 'window_seconds': 60, 'endpoints': {'api_step1_v2': 5}}}
+    }
+    assert ConfigManager._validate(config)
+
+    for cost in (0, -1, 1.5, True, '5'):
+        broken = copy.deepcopy(config)
+        broken['rate_limits']['groups']['upstream']['endpoints']['api_step1_v2'] = cost
+        assert not ConfigManager._validate(broken), cost
+
+    broken = copy.deepcopy(config)
+    broken['rate_limits']['groups']['upstream']['max_units'] = 0
+    assert not ConfigManager._validate(broken)
+
+    broken = copy.deepcopy(config)
+    broken['rate_limits']['endpoints']['api_step1_v2']['max_requests'] = 0
+    assert not ConfigManager._validate(broken)
+    print("✅ Некорректные стоимости и лимиты отклоняются")
+
+
+def main():
+    """Основная функция тестирования"""
+    sys.exit(pytest.main([__file__, '-q']))
+
+
+if __name__ == "__main__":
+    main()
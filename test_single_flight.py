@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки single-flight: лидер и ожидающие в процессе и
+между воркерами, истечение аренды, срок запроса, ошибки лидера и запрет
+публикации резервных результатов.
+
+Redis заменяется на fakeredis (Lua выполняется через lupa).
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from app import app, cache
+from app.http_client import deadline_scope
+from app.single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Чистый fakeredis для чтения и записи кэша"""
+    redis = fakeredis.FakeStrictRedis()
+    with app.app_context():
+        monkeypatch.setattr(cache.cache, '_write_client', redis)
+        monkeypatch.setattr(cache.cache, '_read_client', redis)
+        yield redis
+
+
+def in_thread(func, *args):
+    """Запуск в отдельном потоке с контекстом приложения; возвращает (поток, словарь результата)"""
+    outcome = {}
+
+    def run():
+        with app.app_context():
+            try:
+                outcome['value'] = func(*args)
+            except Exception as e:
+                outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+class BlockingCall:
+    """fn, который ждёт разрешения и считает вызовы"""
+
+    def __init__(self, value='result', error=None):
+        self.value = value
+        self.error = error
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def hold_lease(redis, flight, key, seconds):
+    """Аренда ключа «другим воркером»"""
+    redis.set(flight._lock_key(key), 'other-worker', ex=seconds)
+
+
+def test_local_follower_shares_leader_result(fake_redis):
+    """Поток-ведомый получает результат лидера, fn выполняется один раз"""
+    flight = SingleFlight('test_local')
+    fn = BlockingCall()
+
+    leader, leader_out = in_thread(flight.do, 'k', fn)
+    assert fn.started.wait(2)
+    follower, follower_out = in_thread(flight.do, 'k', fn)
+    time.sleep(0.05)
+    fn.release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert leader_out == {'value': 'result'} and follower_out == {'value': 'result'}
+    assert fn.calls == 1
+    assert fake_redis.get(flight._lock_key('k')) is None   # аренда снята
+    print("✅ Лидер и ведомый в процессе: один вызов")
+
+
+def test_remote_follower_reads_published_result(fake_redis):
+    """Воркер без аренды дожидается опубликованного результата чужого лидера"""
+    flight = SingleFlight('test_remote', poll_interval=0.01)
+    hold_lease(fake_redis, flight, 'k', 5)
+
+    def publish_later():
+        time.sleep(0.1)
+        with app.app_context():
+            flight._publish(flight._result_key('k'), 'remote')
+
+    threading.Thread(target=publish_later).start()
+    assert flight.do('k', lambda: pytest.fail('fn не должен вызываться')) == 'remote'
+    print("✅ Ведомый другого воркера получает опубликованный результат")
+
+
+def test_lease_expiry_runs_call(fake_redis):
+    """Аренда чужого лидера истекла без результата — ведомый выполняет вызов сам"""
+    flight = SingleFlight('test_expiry', lease_seconds=1, poll_interval=0.01)
+    hold_lease(fake_redis, flight, 'k', 30)
+    start = time.monotonic()
+    assert flight.do('k', lambda: 'own') == 'own'
+    assert 0.9 < time.monotonic() - start < 3
+
+
+def test_waits_bounded_by_deadline(fake_redis):
+    """Ожидание чужого лидера (в процессе и между воркерами) не дольше срока запроса"""
+    flight = SingleFlight('test_deadline', lease_seconds=15, poll_interval=0.01)
+    hold_lease(fake_redis, flight, 'remote', 30)
+    with deadline_scope(0.2):
+        start = time.monotonic()
+        assert flight.do('remote', lambda: 'own') == 'own'
+        assert time.monotonic() - start < 1
+
+    fn = BlockingCall()
+    leader, _ = in_thread(flight.do, 'local', fn)
+    assert fn.started.wait(2)
+    try:
+        with deadline_scope(0.2):
+            start = time.monotonic()
+            assert flight.do('local', lambda: 'own') == 'own'
+            assert time.monotonic() - start < 1
+    finally:
+        fn.release.set()
+        leader.join(2)
+    print("✅ Ожидание ограничено deadline_scope")
+
+
+def test_leader_error_propagates(fake_redis):
+    """Ошибка лидера получают и ведомые; аренда снимается, результат не публикуется"""
+    flight = SingleFlight('test_error')
+    fn = BlockingCall(error=ValueError('upstream down'))
+
+    leader, leader_out = in_thread(flight.do, 'k', fn)
+    assert fn.started.wait(2)
+    follower, follower_out = in_thread(flight.do, 'k', fn)
+    time.sleep(0.05)
+    fn.release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert isinstance(leader_out.get('error'), ValueError)
+    assert follower_out.get('error') is leader_out['error']
+    assert fn.calls == 1
+    assert fake_redis.get(flight._lock_key('k')) is None
+    assert flight._get_result(flight._result_key('k')) == (False, None)
+
+
+def test_rejected_results_not_published(fake_redis):
+    """Результат, не прошедший should_publish, другим воркерам не достаётся"""
+    flight = SingleFlight('test_publish', should_publish=lambda value: not value.get('approximate'))
+    assert flight.do('bad', lambda: {'approximate': True}) == {'approximate': True}
+    assert flight._get_result(flight._result_key('bad')) == (False, None)
+
+    assert flight.do('good', lambda: {'total': 1}) == {'total': 1}
+    assert flight._get_result(flight._result_key('good')) == (True, {'total': 1})
+    print("✅ Приближённые результаты не публикуются")
+
+
+def main():
+    """Основная функция тестирования"""
+    sys.exit(pytest.main([__file__, '-q']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки индексированного каталога транспорта (шаг 2):
+VehicleCatalog и Step2Table сравниваются с прежним перебором списка
+"""
+
+import copy
+import json
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.config_manager import config_manager
+from app.models import (BodyType, Step2Table, Vehicle, VehicleCatalog, VehicleDatabase, VehicleRequest,
+                        VehicleType, vehicles_from_config, vehicles_json)
+
+
+def brute_force_filter(vehicles, request):
+    """Прежний перебор VehicleDatabase.filter_vehicles"""
+    filtered = []
+    for vehicle in vehicles:
+        if not vehicle.is_available:
+            continue
+        if vehicle.max_passengers < request.passengers:
+            continue
+        if vehicle.max_loaders < request.loaders:
+            continue
+        if request.body_type != BodyType.ANY and vehicle.body_type != request.body_type:
+            continue
+        if request.height and vehicle.dimensions['height'] < request.height:
+            continue
+        if request.length and vehicle.dimensions['length'] < request.length:
+            continue
+        filtered.append(vehicle)
+    return filtered
+
+
+def random_vehicles(rng, count):
+    """Случайный парк с повторяющимися характеристиками и недоступными машинами"""
+    body_types = [BodyType.TENT, BodyType.VAN, BodyType.BOARD]
+    return [
+        Vehicle(
+            id=i + 1,
+            name=f"Машина {i + 1}",
+            type=rng.choice(list(VehicleType)),
+            body_type=rng.choice(body_types),
+            price_per_hour=1000.0,
+            price_per_km=20.0,
+            base_price=2000.0,
+            max_passengers=rng.randint(0, 3),
+            max_loaders=rng.randint(0, 4),
+            dimensions={'height': rng.choice([1.5, 2.0, 2.2, 2.5]),
+                        'length': rng.choice([3.0, 4.2, 6.0]),
+                        'width': 2.0},
+            capacity=10.0,
+            image_url='',
+            description='',
+            is_available=rng.random() > 0.2
+        )
+        for i in range(count)
+    ]
+
+
+def request_grid():
+    """Запросы на границах характеристик, между ними и без фильтра по размерам"""
+    for passengers in range(0, 5):
+        for loaders in range(0, 6):
+            for height in (None, 0, 1.0, 1.5, 1.7, 2.2, 2.5, 3.0):
+                for length in (None, 0, 3.0, 4.0, 4.2, 6.0, 7.0):
+                    for body_type in BodyType:
+                        yield VehicleRequest(passengers=passengers, loaders=loaders,
+                                             height=height, length=length, body_type=body_type)
+
+
+def test_catalog_matches_brute_force():
+    """VehicleCatalog.filter и Step2Table.lookup совпадают с перебором"""
+    print("=== Тестирование VehicleCatalog и Step2Table ===")
+
+    rng = random.Random(18)
+    for max_entries in (200_000, 0):    # заранее посчитанная и ленивая таблица
+        vehicles = random_vehicles(rng, 40)
+        catalog = VehicleCatalog(vehicles)
+        table = Step2Table(catalog, max_entries=max_entries)
+        assert table.precomputed == (max_entries > 0)
+
+        checked = 0
+        for request in request_grid():
+            expected = brute_force_filter(vehicles, request)
+            assert catalog.filter(request) == expected, request
+            found, fragment = table.lookup(request)
+            assert list(found) == expected, request
+            assert json.loads(fragment) == {'vehicles': [v.to_dict() for v in expected], 'count': len(expected)}
+            checked += 1
+
+        assert catalog.all_available() == [v for v in vehicles if v.is_available]
+        print(f"✅ {checked} запросов, таблица {'заранее' if table.precomputed else 'лениво'}: {len(table)} ключей")
+
+
+def test_database_from_config():
+    """Каталог из конфигурации отвечает так же, как перебор её транспорта"""
+    db = VehicleDatabase()
+    vehicles = db._vehicles
+    assert vehicles, "в конфигурации нет транспорта"
+    for request in request_grid():
+        assert db.filter_vehicles(request) == brute_force_filter(vehicles, request), request
+    for vehicle in vehicles:
+        assert db.get_vehicle_by_id(vehicle.id) is vehicle
+    assert db.get_vehicle_by_id(-1) is None
+    print(f"✅ Конфигурация: {len(vehicles)} машин")
+
+
+def test_incomplete_dimensions_skipped():
+    """Транспорт без высоты или длины пропускается, а не ломает весь каталог"""
+    config_vehicles = copy.deepcopy(config_manager.get_config()['vehicles'])
+    del config_vehicles[0]['dimensions']['height']
+    config_vehicles[1]['dimensions']['length'] = None
+    config_vehicles[2]['dimensions'] = 'большой'
+
+    vehicles = vehicles_from_config(config_vehicles)
+    skipped = {config_vehicles[i]['id'] for i in range(3)}
+    assert [v.id for v in vehicles] == [v['id'] for v in config_vehicles if v['id'] not in skipped]
+
+    catalog = VehicleCatalog(vehicles)
+    request = VehicleRequest(passengers=0, loaders=0, height=1.0, length=1.0)
+    assert catalog.filter(request) == brute_force_filter(vehicles, request)
+    print(f"✅ Пропущено {len(skipped)} записей с неполными размерами")
+
+
+def test_vehicle_dict_is_a_copy():
+    """Изменение результата to_dict не портит транспорт и готовый JSON"""
+    vehicle = random_vehicles(random.Random(1), 1)[0]
+    data = vehicle.to_dict()
+    data['name'] = 'изменено'
+    data['dimensions']['height'] = 100
+    assert vehicle.to_dict()['name'] == vehicle.name
+    assert vehicle.dimensions['height'] != 100
+    assert json.loads(vehicles_json([vehicle])) == [vehicle.to_dict()]
+    print("✅ to_dict возвращает независимую копию")
+
+
+def main():
+    """Основная функция тестирования"""
+    print("🚚 Тестирование каталога транспорта")
+    print("=" * 50)
+
+    try:
+        test_catalog_matches_brute_force()
+        test_database_from_config()
+        test_incomplete_dimensions_skipped()
+        test_vehicle_dict_is_a_copy()
+
+        print("\n✅ Все тесты завершены!")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
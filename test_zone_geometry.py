@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки сеточного индекса КАД и векторной разбивки маршрутов
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from app.zone_geometry import KadZoneIndex, haversine_km, segment_lengths_km, segment_route_exact
+
+KAD_GEOJSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'kad_polygon.geojson')
+
+
+def load_kad_polygon():
+    with open(KAD_GEOJSON, 'r', encoding='utf-8') as f:
+        return shape(json.load(f)['features'][0]['geometry'])
+
+
+def test_classify_points_matches_shapely():
+    """Сеточная классификация совпадает с shapely.contains_xy"""
+    print("=== Тестирование KadZoneIndex.classify_points ===")
+
+    polygon = load_kad_polygon()
+    index = KadZoneIndex(polygon)
+    rng = np.random.default_rng(7)
+    min_x, min_y, max_x, max_y = polygon.bounds
+    # Точки в прямоугольнике чуть шире полигона + точки на самой границе
+    lons = rng.uniform(min_x - 0.05, max_x + 0.05, 50_000)
+    lats = rng.uniform(min_y - 0.05, max_y + 0.05, 50_000)
+    boundary = np.asarray(polygon.exterior.coords)
+    lons = np.concatenate([lons, boundary[:, 0]])
+    lats = np.concatenate([lats, boundary[:, 1]])
+
+    expected = shapely.contains_xy(polygon, lons, lats)
+    actual = index.classify_points(lons, lats)
+    mismatches = int((expected != actual).sum())
+    status = "✅" if mismatches == 0 else "❌"
+    print(f"{status} {lons.size} точек, расхождений: {mismatches}, внутри: {int(expected.sum())}")
+    assert mismatches == 0
+
+    assert index.contains(30.3158, 59.9390)       # Дворцовая площадь
+    assert not index.contains(30.4108, 59.7133)   # Пушкин
+    assert index.classify_points([], []).size == 0
+
+
+def test_segment_lengths_match_haversine():
+    """Векторные длины сегментов совпадают со скалярным гаверсинусом"""
+    lons = np.array([30.30, 30.35, 30.50, 30.10])
+    lats = np.array([59.90, 59.95, 60.05, 59.80])
+    expected = [haversine_km(lats[i], lons[i], lats[i + 1], lons[i + 1]) for i in range(len(lons) - 1)]
+    assert np.allclose(segment_lengths_km(lons, lats), expected)
+
+
+def test_segment_route_exact_splits_crossing():
+    """Маршрут через КАД делится по точке пересечения, сумма зон равна длине"""
+    polygon = load_kad_polygon()
+    index = KadZoneIndex(polygon)
+    route = [[30.3158, 59.9390], [30.4108, 59.7133]]  # центр -> Пушкин, одним сегментом
+    city_km, outside_km, total_km = segment_route_exact(route, index)
+    assert 0 < city_km < total_km
+    assert abs(city_km + outside_km - total_km) < 1e-9
+    assert abs(total_km - haversine_km(59.9390, 30.3158, 59.7133, 30.4108)) < 1e-9
+
+    # Масштабирование на дорожную длину OSRM сохраняет долю города
+    scaled = segment_route_exact(route, index, road_distance_km=2 * total_km)
+    assert abs(scaled[0] - 2 * city_km) < 1e-9 and abs(scaled[2] - 2 * total_km) < 1e-9
+    print(f"✅ Центр -> Пушкин: город {city_km:.2f} км, за КАД {outside_km:.2f} км")
+
+
+def main():
+    """Основная функция тестирования"""
+    print("🗺️ Тестирование геометрии зон")
+    print("=" * 50)
+
+    try:
+        test_classify_points_matches_shapely()
+        test_segment_lengths_match_haversine()
+        test_segment_route_exact_splits_crossing()
+
+        print("\n✅ Все тесты завершены!")
+
+    except Exception as e:
+        print(f"\n❌ Ошибка при тестировании: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
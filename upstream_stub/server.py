@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Локальный стенд внешних сервисов (Nominatim, OSRM, Telegram) для офлайн-бенчмарков.
+
+Для адресов бенчмарка отдаёт заранее подготовленные ответы Nominatim
+(upstream_stub/recordings/nominatim.json), для остальных геокодов и для всех
+маршрутов OSRM генерирует детерминированные синтетические ответы — записей OSRM
+в репозитории нет, пока они не сделаны с --record. Задержки и ошибки моделируются
+по профилю (upstream_stub/profile.json): логнормальная задержка с заданными
+медианой и p95, доли ответов 429/503 и зависаний дольше таймаута клиента.
+Генератор задержек и ошибок свой у каждого запроса: зерно — --seed, апстрим,
+ключ запроса и номер его повтора, поэтому повторный прогон с тем же зерном
+даёт те же ошибки тем же запросам независимо от порядка потоков.
+
+Приложение направляется на стенд переменными окружения:
+    NOMINATIM_BASE_URL=http://localhost:5055/nominatim
+    OSRM_BASE_URL=http://localhost:5055/osrm
+    TELEGRAM_API_BASE_URL=http://localhost:5055/telegram
+
+Запуск:
+    python upstream_stub/server.py --port 5055 [--seed 42] [--record]
+
+С флагом --record незаписанные запросы Nominatim/OSRM проксируются к настоящим
+сервисам, а ответы дописываются в recordings/ (nominatim.json, osrm.json).
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+
+import requests
+from flask import Flask, Response, jsonify, request
+
+BASE_DIR = Path(__file__).parent
+RECORDINGS_DIR = BASE_DIR / 'recordings'
+PROFILE_PATH = BASE_DIR / 'profile.json'
+
+REAL_UPSTREAMS = {
+    'nominatim': 'https://nominatim.openstreetmap.org',
+    'osrm': 'https://router.project-osrm.org',
+}
+
+# Центр города — вокруг него раскладываются синтетические адреса
+CITY_CENTER = (59.9311, 30.3609)
+
+stub = Flask(__name__)
+
+
+class Recordings:
+    """Записанные ответы по апстримам: ключ запроса -> JSON-тело"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._data = {}
+        for name in ('nominatim', 'osrm'):
+            path = directory / f'{name}.json'
+            if path.exists():
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._data[name] = json.load(f)
+            else:
+                self._data[name] = {}
+
+    def get(self, upstream: str, key: str):
+        return self._data[upstream].get(key)
+
+    def put(self, upstream: str, key: str, body):
+        with self._lock:
+            self._data[upstream][key] = body
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f'{upstream}.json', 'w', encoding='utf-8') as f:
+                json.dump(self._data[upstream], f, ensure_ascii=False, indent=1)
+
+
+class FaultProfile:
+    """Модель задержек и ошибок апстрима"""
+
+    def __init__(self, config: dict):
+        median_ms = config.get('latency_median_ms', 100)
+        p95_ms = max(config.get('latency_p95_ms', 300), median_ms)
+        # Логнормальное распределение: mu по медиане, sigma по p95 (z(0.95) = 1.645)
+        self.mu = math.log(median_ms / 1000.0)
+        self.sigma = math.log(p95_ms / median_ms) / 1.645 if p95_ms > median_ms else 0.0
+        self.rate_limit_rate = config.get('rate_limit_rate', 0.0)
+        self.error_rate = config.get('error_rate', 0.0)
+        self.hang_rate = config.get('hang_rate', 0.0)
+        self.hang_seconds = config.get('hang_seconds', 15.0)
+
+    def apply(self, rng: random.Random):
+        """Задержка ответа; возвращает (status, body) при инъекции ошибки или None"""
+        roll = rng.random()
+        if roll < self.hang_rate:
+            time.sleep(self.hang_seconds)
+            return 504, {'error': 'stub: upstream hang'}
+        time.sleep(rng.lognormvariate(self.mu, self.sigma))
+        roll -= self.hang_rate
+        if roll < self.rate_limit_rate:
+            return 429, {'error': 'stub: rate limited'}
+        roll -= self.rate_limit_rate
+        if roll < self.error_rate:
+            return 503, {'error': 'stub: service unavailable'}
+        return None
+
+
+def inject_fault(upstream: str, key: str):
+    """Задержка и, возможно, ошибка для запроса с ключом key.
+
+    Генератор создаётся на запрос из (зерно, апстрим, ключ, номер повтора ключа),
+    а не берётся общий на все потоки: исход запроса не зависит от того, какие
+    запросы обработаны раньше него.
+    """
+    with stub.config['counter_lock']:
+        counts = stub.config['request_counts']
+        occurrence = counts[(upstream, key)] = counts.get((upstream, key), 0) + 1
+    rng = random.Random(f"{stub.config['seed']}:{upstream}:{key}:{occurrence}")
+    return stub.config['faults'][upstream].apply(rng)
+
+
+def _stable_unit(text: str, salt: str) -> float:
+    """Детерминированное число в [0, 1) по строке"""
+    digest = hashlib.sha1(f'{salt}:{text}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def synthetic_geocode(query: str) -> list:
+    """Синтетический ответ Nominatim: точка в радиусе ~40 км от центра"""
+    angle = _stable_unit(query, 'angle') * 2 * math.pi
+    radius_deg = 0.35 * math.sqrt(_stable_unit(query, 'radius'))
+    lat = CITY_CENTER[0] + radius_deg * math.sin(angle) * 0.5
+    lon = CITY_CENTER[1] + radius_deg * math.cos(angle)
+    return [{
+        'lat': f'{lat:.7f}',
+        'lon': f'{lon:.7f}',
+        'display_name': f'{query} (stub)',
+        'address': {'city': 'Санкт-Петербург'}
+    }]
+
+
+def synthetic_route(coordinates: str, overview: str) -> dict:
+    """Синтетический ответ OSRM: ломаная между точками с дорожным коэффициентом 1.3"""
+    points = [tuple(map(float, pair.split(','))) for pair in coordinates.split(';')]
+    vertices = 20 if overview == 'simplified' else 400
+    line = []
+    for (lon1, lat1), (lon2, lat2) in zip(points, points[1:]):
+        for i in range(vertices):
+            t = i / vertices
+            # Небольшой изгиб, чтобы геометрия не была прямой
+            bend = 0.01 * math.sin(t * math.pi)
+            line.append([lon1 + (lon2 - lon1) * t + bend, lat1 + (lat2 - lat1) * t])
+    line.append(list(points[-1]))
+
+    straight_m = 0.0
+    for (lon1, lat1), (lon2, lat2) in zip(points, points[1:]):
+        dlat = math.radians(lat2 - lat1)
+        dlon = math.radians(lon2 - lon1)
+        a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+        straight_m += 6371000.0 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    distance = round(straight_m * 1.3, 1)
+
+    route = {'distance': distance, 'duration': round(distance / 8.3, 1), 'weight': distance, 'legs': []}
+    if overview != 'false':
+        route['geometry'] = {'type': 'LineString', 'coordinates': line}
+    return {'code': 'Ok', 'routes': [route], 'waypoints': []}
+
+
+def _json(body, status: int = 200) -> Response:
+    return Response(json.dumps(body, ensure_ascii=False), status=status, mimetype='application/json')
+
+
+def _replay_or_generate(upstream: str, key: str, real_url: str, params: dict, generate):
+    """Записанный ответ, запись с реального сервиса (--record) или синтетика"""
+    body = stub.config['recordings'].get(upstream, key)
+    if body is not None:
+        return body
+    if stub.config['record']:
+        resp = requests.get(real_url, params=params, timeout=15,
+                            headers={'User-Agent': 'TransportCompany/1.0 (upstream-stub recorder)'})
+        if resp.status_code == 200:
+            body = resp.json()
+            stub.config['recordings'].put(upstream, key, body)
+            return body
+    return generate()
+
+
+@stub.route('/nominatim/search')
+def nominatim_search():
+    query = request.args.get('q', '')
+    key = ' '.join(query.lower().split())
+    fault = inject_fault('nominatim', f'search:{key}')
+    if fault:
+        return _json(fault[1], fault[0])
+    params = {'format': 'json', 'limit': request.args.get('limit', 1), 'q': query}
+    body = _replay_or_generate('nominatim', key, f"{REAL_UPSTREAMS['nominatim']}/search", params,
+                               lambda: synthetic_geocode(query))
+    return _json(body)
+
+
+@stub.route('/nominatim/reverse')
+def nominatim_reverse():
+    lat = request.args.get('lat', '0')
+    lon = request.args.get('lon', '0')
+    fault = inject_fault('nominatim', f'reverse:{lat},{lon}')
+    if fault:
+        return _json(fault[1], fault[0])
+    return _json({'lat': lat, 'lon': lon, 'display_name': f'{lat}, {lon} (stub)',
+                  'address': {'city': 'Санкт-Петербург'}})
+
+
+@stub.route('/osrm/route/v1/<profile>/<path:coordinates>')
+def osrm_route(profile, coordinates):
+    overview = request.args.get('overview', 'simplified')
+    key = f'{profile}/{coordinates}?overview={overview}'
+    fault = inject_fault('osrm', key)
+    if fault:
+        return _json(fault[1], fault[0])
+    params = dict(request.args)
+    body = _replay_or_generate('osrm', key, f"{REAL_UPSTREAMS['osrm']}/route/v1/{profile}/{coordinates}", params,
+                               lambda: synthetic_route(coordinates, overview))
+    return _json(body)
+
+
+@stub.route('/telegram/bot<token>/sendMessage', methods=['POST'])
+def telegram_send_message(token):
+    fault = inject_fault('telegram', 'sendMessage')
+    if fault:
+        return _json({'ok': False, 'description': fault[1]['error']}, fault[0])
+    with stub.config['counter_lock']:
+        stub.config['message_id'] += 1
+        message_id = stub.config['message_id']
+    return jsonify({'ok': True, 'result': {'message_id': message_id, 'date': int(time.time())}})
+
+
+@stub.route('/health')
+def health():
+    return jsonify({'status': 'healthy', 'service': 'upstream-stub'})
+
+
+def configure(seed: int = 42, record: bool = False, profile_path: Path = PROFILE_PATH):
+    """Загрузка профиля задержек/ошибок и записанных ответов"""
+    with open(profile_path, 'r', encoding='utf-8') as f:
+        profile = json.load(f)
+    stub.config.update(
+        recordings=Recordings(RECORDINGS_DIR),
+        record=record,
+        seed=seed,
+        faults={name: FaultProfile(profile.get(name, {})) for name in ('nominatim', 'osrm', 'telegram')},
+        request_counts={},
+        message_id=0,
+        counter_lock=threading.Lock()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный стенд Nominatim/OSRM/Telegram')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=42, help='зерно генератора задержек и ошибок')
+    parser.add_argument('--profile', default=str(PROFILE_PATH), help='JSON-профиль задержек и ошибок')
+    parser.add_argument('--record', action='store_true', help='записывать незаписанные ответы с реальных сервисов')
+    args = parser.parse_args()
+
+    configure(seed=args.seed, record=args.record, profile_path=Path(args.profile))
+    print(f"🧪 Upstream stub on http://{args.host}:{args.port} (record={'on' if args.record else 'off'})")
+    stub.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()